@@ -1,21 +1,62 @@
 import os
 import io
+import hashlib
+import uuid
 from datetime import datetime, date, timedelta
 from functools import wraps
 from zoneinfo import ZoneInfo
 
+import click
 from flask import (
-    Flask, render_template, request, redirect, url_for,
-    session, flash, jsonify, send_file, send_from_directory
+    Flask, Response, abort, render_template, request, redirect, url_for,
+    session, flash, jsonify, send_file, send_from_directory, g
 )
+from itsdangerous import BadSignature, URLSafeTimedSerializer
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 
-from models import get_db, init_db
+from calendario import (
+    is_feriado, tipo_dia, get_semana_inicio_fim, get_mes_inicio_fim
+)
+from exportacao import MODOS as MODOS_EXPORTACAO
+from horas import (
+    calcular_horas_esperadas, calcular_horas_extras_semana,
+    calcular_horas_justificadas, calcular_resumo_semana,
+    atualizar_resumo_semanal, atualizar_resumo_feriado, reconstruir_resumo_semanal,
+    carregar_escalas, carregar_resumo_semanal, recalcular_horas
+)
+from models import get_db, init_db, init_app, verificar_planos, CONSULTAS_CRITICAS
+import cache_painel
+import cache_relatorios
+import calendario
+import consultas
+import escopo
+import eventos
+import fechamento
+import graficos
+import instrumentacao
+import jobs
+import metricas
+import painel
+import ponto
+import tempo
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'piticas-ponto-secret-key-2026')
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=10)
+init_app(app)
+instrumentacao.init_app(app)
+metricas.init_app(app)
+jobs.init_app(app)
+
+# Tokens da API de ponto (quiosques e apps): validade em dias
+API_TOKEN_DIAS = int(os.environ.get('API_TOKEN_DIAS', 30))
+# Máximo de batidas offline aceitas numa só requisição
+API_LOTE_MAXIMO = 500
+# Fila de um quiosque (vários colaboradores, às vezes um dia inteiro offline)
+API_SYNC_MAXIMO = 2000
+# /metrics (Prometheus): sem token, só localhost
+METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN', '')
 
 # Upload config
 DATA_DIR = os.environ.get('DATA_DIR', os.path.dirname(os.path.abspath(__file__)))
@@ -68,139 +109,127 @@ def gestor_required(f):
     return decorated
 
 
-def is_feriado(d, db=None):
-    """Verifica se uma data é feriado."""
-    close_db = False
-    if db is None:
-        db = get_db()
-        close_db = True
-    result = db.execute(
-        'SELECT descricao FROM feriados WHERE data = ?', (d.isoformat(),)
-    ).fetchone()
-    if close_db:
-        db.close()
-    return result['descricao'] if result else None
+def _escopo_lojas():
+    """Lojas do gestor logado (None = todas), lidas uma vez por requisição."""
+    if 'escopo_lojas' not in g:
+        g.escopo_lojas = escopo.lojas_do_gestor(get_db(), session['user_id'])
+    return g.escopo_lojas
 
 
-def tipo_dia(d, db=None):
-    """Retorna 'especial' para domingos/feriados, 'normal' para os demais."""
-    if d.weekday() == 6:  # domingo
-        return 'especial'
-    if is_feriado(d, db):
-        return 'especial'
-    return 'normal'
+def todas_lojas_required(f):
+    """Restringe a rota (abaixo de gestor_required) aos gestores que veem todas as lojas."""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if _escopo_lojas() is not None:
+            flash('Acesso restrito a gestores de todas as lojas.', 'danger')
+            return redirect(url_for('dashboard'))
+        return f(*args, **kwargs)
+    return decorated
 
 
-def carga_esperada_dia(d, colaborador, db=None):
-    """Retorna carga horária esperada para o dia: 8h normal, 6h dom/feriado."""
-    if tipo_dia(d, db) == 'especial':
-        return colaborador['horas_dia_especial'] or 6.0
-    return colaborador['horas_dia_normal'] or 8.0
+def _lojas_ativas(db):
+    """Lojas ativas do escopo do gestor logado, para os filtros e formulários."""
+    filtro_loja, params = escopo.filtro_sql(_escopo_lojas(), 'id')
+    return db.execute(
+        f'SELECT * FROM lojas WHERE ativo = 1{filtro_loja} ORDER BY nome', params
+    ).fetchall()
 
 
-def calcular_horas(entrada, saida_almoco, retorno_almoco, saida):
-    """Calcula total de horas trabalhadas considerando almoço."""
-    if not entrada or not saida:
-        if entrada and not saida:
-            fmt = '%H:%M'
-            h_entrada = datetime.strptime(entrada, fmt)
-            agora_dt = agora()
-            h_agora = datetime.strptime(agora_dt.strftime('%H:%M'), fmt)
-
-            total_minutos = (h_agora - h_entrada).total_seconds() / 60
-
-            if saida_almoco and retorno_almoco:
-                h_saida_almoco = datetime.strptime(saida_almoco, fmt)
-                h_retorno_almoco = datetime.strptime(retorno_almoco, fmt)
-                almoco_minutos = (h_retorno_almoco - h_saida_almoco).total_seconds() / 60
-                total_minutos -= almoco_minutos
-            elif saida_almoco and not retorno_almoco:
-                h_saida_almoco = datetime.strptime(saida_almoco, fmt)
-                almoco_minutos = (h_agora - h_saida_almoco).total_seconds() / 60
-                total_minutos -= almoco_minutos
-
-            return round(max(0, total_minutos / 60), 2)
-        return 0.0
-
-    fmt = '%H:%M'
-    try:
-        h_entrada = datetime.strptime(entrada, fmt)
-        h_saida = datetime.strptime(saida, fmt)
-        total_minutos = (h_saida - h_entrada).total_seconds() / 60
+def _colaborador_do_escopo(db, colab_id):
+    """Colaborador pelo id, ou None se não existir ou estiver fora do escopo do gestor."""
+    colaborador = db.execute(
+        'SELECT * FROM colaboradores WHERE id = ?', (colab_id,)
+    ).fetchone()
+    if colaborador is None or not escopo.contem(_escopo_lojas(), colaborador['loja_id']):
+        return None
+    return colaborador
 
-        if saida_almoco and retorno_almoco:
-            h_saida_almoco = datetime.strptime(saida_almoco, fmt)
-            h_retorno_almoco = datetime.strptime(retorno_almoco, fmt)
-            almoco_minutos = (h_retorno_almoco - h_saida_almoco).total_seconds() / 60
-            total_minutos -= almoco_minutos
 
-        return round(max(0, total_minutos / 60), 2)
-    except (ValueError, TypeError):
-        return 0.0
+def _colaboradores_ativos(db):
+    """(id, nome) dos colaboradores ativos do escopo, para os formulários do gestor."""
+    filtro_loja, lojas = escopo.filtro_sql(_escopo_lojas())
+    return db.execute(
+        f'SELECT c.id, c.nome FROM colaboradores c WHERE c.ativo = 1{filtro_loja} ORDER BY c.nome',
+        lojas
+    ).fetchall()
 
 
-def calcular_horas_extras_semana(horas_semana, max_horas_semana=40.0):
-    """Calcula horas extras na semana (acima do limite)."""
-    if horas_semana > max_horas_semana:
-        return round(horas_semana - max_horas_semana, 2)
-    return 0.0
+def _serializador_api(salt='api-ponto'):
+    return URLSafeTimedSerializer(app.secret_key, salt=salt)
 
 
-def get_semana_inicio_fim(d):
-    """Retorna domingo e sábado da semana de uma data (convenção brasileira)."""
-    # weekday(): 0=seg..6=dom. Offset para chegar ao domingo anterior (ou o próprio dia se já for domingo)
-    offset = (d.weekday() + 1) % 7
-    inicio = d - timedelta(days=offset)
-    fim = inicio + timedelta(days=6)
-    return inicio, fim
+def _carimbo_senha(senha_hash):
+    """Muda junto com a senha, invalidando os tokens emitidos antes da troca."""
+    return hashlib.sha256((senha_hash or '').encode()).hexdigest()[:16]
 
 
-def get_mes_inicio_fim(d):
-    """Retorna primeiro e último dia do mês."""
-    inicio = d.replace(day=1)
-    if d.month == 12:
-        fim = d.replace(year=d.year + 1, month=1, day=1) - timedelta(days=1)
-    else:
-        fim = d.replace(month=d.month + 1, day=1) - timedelta(days=1)
-    return inicio, fim
+def gerar_token_api(colaborador):
+    """Token assinado (sem estado no servidor) para a API de ponto."""
+    return _serializador_api().dumps(
+        {'id': colaborador['id'], 's': _carimbo_senha(colaborador['senha'])})
 
 
-def calcular_resumo_semana(registros_semana, max_horas_semana=40.0):
-    """Calcula resumo da semana: horas normais, extras, folgas usadas."""
-    horas_total = sum(r['horas_trabalhadas'] for r in registros_semana)
-    dias_trabalhados = len(registros_semana)
-    horas_extras = calcular_horas_extras_semana(horas_total, max_horas_semana)
-    horas_normais = min(horas_total, max_horas_semana)
-    return {
-        'horas_total': round(horas_total, 2),
-        'horas_normais': round(horas_normais, 2),
-        'horas_extras': horas_extras,
-        'dias_trabalhados': dias_trabalhados,
-    }
+def token_required(f):
+    """Autentica pelo cabeçalho `Authorization: Bearer <token>` (g.colaborador_api)."""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        tipo, _, token = request.headers.get('Authorization', '').partition(' ')
+        if tipo.lower() != 'bearer' or not token:
+            return jsonify({'erro': 'Token de acesso ausente.'}), 401
+        try:
+            dados = _serializador_api().loads(token.strip(), max_age=API_TOKEN_DIAS * 86400)
+        except BadSignature:
+            return jsonify({'erro': 'Token inválido ou expirado.'}), 401
+        colaborador = get_db().execute(
+            'SELECT * FROM colaboradores WHERE id = ? AND ativo = 1', (dados.get('id'),)
+        ).fetchone()
+        if colaborador is None or _carimbo_senha(colaborador['senha']) != dados.get('s'):
+            return jsonify({'erro': 'Token inválido ou expirado.'}), 401
+        g.colaborador_api = colaborador
+        return f(*args, **kwargs)
+    return decorated
 
 
-def calcular_horas_justificadas(colab_id, data_inicio, data_fim, colaborador, db):
-    """Calcula total de horas justificadas (aprovadas) em um período.
-    Para cada dia coberto por uma justificativa aprovada, soma a carga horária esperada."""
-    justificativas = db.execute(
-        '''SELECT * FROM justificativas
-           WHERE colaborador_id = ? AND status = 'aprovado'
-           AND (data_inicio <= ? AND data_fim >= ?)''',
-        (colab_id, data_fim.isoformat(), data_inicio.isoformat())
-    ).fetchall()
+def gerar_token_quiosque(gestor, loja_id):
+    """Token do aparelho de quiosque: vale enquanto o gestor que o ativou for
+    gestor e a loja (0 = todas) estiver no escopo dele."""
+    return _serializador_api('quiosque').dumps(
+        {'g': gestor['id'], 'l': loja_id or 0, 's': _carimbo_senha(gestor['senha'])})
 
-    horas = 0.0
-    dias_justificados = set()
-    for j in justificativas:
-        j_inicio = max(date.fromisoformat(j['data_inicio']), data_inicio)
-        j_fim = min(date.fromisoformat(j['data_fim']), data_fim)
-        d = j_inicio
-        while d <= j_fim:
-            if d.isoformat() not in dias_justificados:
-                dias_justificados.add(d.isoformat())
-                horas += carga_esperada_dia(d, colaborador, db)
-            d += timedelta(days=1)
-    return round(horas, 2), len(dias_justificados)
+
+def quiosque_required(f):
+    """Autentica o quiosque pelo token Bearer (loja em g.quiosque_loja, 0 = todas)."""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        tipo, _, token = request.headers.get('Authorization', '').partition(' ')
+        try:
+            if tipo.lower() != 'bearer':
+                raise BadSignature('sem token')
+            dados = _serializador_api('quiosque').loads(
+                token.strip(), max_age=API_TOKEN_DIAS * 86400)
+        except BadSignature:
+            return jsonify({'erro': 'Quiosque não autorizado. Peça a um gestor para ativá-lo.'}), 401
+        db = get_db()
+        gestor = db.execute(
+            'SELECT * FROM colaboradores WHERE id = ? AND ativo = 1 AND is_gestor = 1',
+            (dados.get('g'),)
+        ).fetchone()
+        if gestor is None or _carimbo_senha(gestor['senha']) != dados.get('s'):
+            return jsonify({'erro': 'Quiosque não autorizado. Peça a um gestor para ativá-lo.'}), 401
+        loja_id = dados.get('l') or 0
+        lojas = escopo.lojas_do_gestor(db, gestor['id'])
+        # O escopo do gestor pode ter mudado depois da ativação
+        if (not loja_id and lojas is not None) or not escopo.contem(lojas, loja_id):
+            return jsonify({'erro': 'Quiosque não autorizado. Peça a um gestor para ativá-lo.'}), 401
+        g.quiosque_loja = loja_id
+        return f(*args, **kwargs)
+    return decorated
+
+
+def calcular_horas(entrada, saida_almoco, retorno_almoco, saida):
+    """Calcula total de horas trabalhadas considerando almoço."""
+    return tempo.calcular_horas(entrada, saida_almoco, retorno_almoco, saida,
+                                agora_min=tempo.minutos_agora(agora()))
 
 
 @app.context_processor
@@ -235,7 +264,6 @@ def login():
         user = db.execute(
             'SELECT * FROM colaboradores WHERE email = ? AND ativo = 1', (email,)
         ).fetchone()
-        db.close()
 
         if not user:
             flash('E-mail ou senha inválidos.', 'danger')
@@ -289,7 +317,6 @@ def criar_senha():
         db.commit()
 
         user = db.execute('SELECT * FROM colaboradores WHERE id = ?', (user_id,)).fetchone()
-        db.close()
 
         # Limpar dados temporários e fazer login
         session.pop('primeiro_acesso_user_id', None)
@@ -323,201 +350,17 @@ def logout():
 @login_required
 def meu_ponto():
     db = get_db()
-    hoje_dt = hoje()
-    hoje_iso = hoje_dt.isoformat()
-    user_id = session['user_id']
-
-    # Dados do colaborador
     colaborador = db.execute(
-        'SELECT * FROM colaboradores WHERE id = ?', (user_id,)
-    ).fetchone()
-
-    # Registro de hoje
-    registro_hoje = db.execute(
-        'SELECT * FROM registros_ponto WHERE colaborador_id = ? AND data = ?',
-        (user_id, hoje_iso)
+        'SELECT * FROM colaboradores WHERE id = ?', (session['user_id'],)
     ).fetchone()
-
-    # Registros da semana
-    inicio_sem, fim_sem = get_semana_inicio_fim(hoje_dt)
-    registros_semana = db.execute(
-        '''SELECT * FROM registros_ponto
-           WHERE colaborador_id = ? AND data BETWEEN ? AND ?
-           ORDER BY data''',
-        (user_id, inicio_sem.isoformat(), fim_sem.isoformat())
-    ).fetchall()
-
-    # Registros do mês
-    inicio_mes, fim_mes = get_mes_inicio_fim(hoje_dt)
-    registros_mes = db.execute(
-        '''SELECT * FROM registros_ponto
-           WHERE colaborador_id = ? AND data BETWEEN ? AND ?
-           ORDER BY data''',
-        (user_id, inicio_mes.isoformat(), fim_mes.isoformat())
-    ).fetchall()
-
-    # Calcular totais
-    max_horas = colaborador['max_horas_semana'] or 40.0
-    horas_semana_trabalhadas = sum(r['horas_trabalhadas'] for r in registros_semana)
-    horas_mes_trabalhadas = sum(r['horas_trabalhadas'] for r in registros_mes)
-
-    # Horas justificadas (aprovadas)
-    horas_just_semana, _ = calcular_horas_justificadas(
-        user_id, inicio_sem, fim_sem, colaborador, db)
-    horas_just_mes, _ = calcular_horas_justificadas(
-        user_id, inicio_mes, fim_mes, colaborador, db)
-
-    horas_semana = horas_semana_trabalhadas + horas_just_semana
-    horas_mes = horas_mes_trabalhadas + horas_just_mes
-    resumo_sem = calcular_resumo_semana(registros_semana, max_horas)
-    # Adicionar horas justificadas ao resumo
-    resumo_sem['horas_justificadas'] = horas_just_semana
-    resumo_sem['horas_total'] = round(resumo_sem['horas_total'] + horas_just_semana, 2)
-
-    # Horas extras do mês (somar por semana incluindo justificadas)
-    horas_extras_mes = 0.0
-    semanas_no_mes = {}
-    for r in registros_mes:
-        d = date.fromisoformat(r['data'])
-        sem_inicio, _ = get_semana_inicio_fim(d)
-        chave = sem_inicio.isoformat()
-        if chave not in semanas_no_mes:
-            semanas_no_mes[chave] = 0.0
-        semanas_no_mes[chave] += r['horas_trabalhadas']
-    # Adicionar horas justificadas por semana
-    d = inicio_mes
-    while d <= min(fim_mes, hoje_dt):
-        sem_inicio, sem_fim = get_semana_inicio_fim(d)
-        chave = sem_inicio.isoformat()
-        if chave not in semanas_no_mes:
-            semanas_no_mes[chave] = 0.0
-        d += timedelta(days=1)
-    # Somar justificadas por semana
-    for chave in semanas_no_mes:
-        sem_inicio = date.fromisoformat(chave)
-        sem_fim = sem_inicio + timedelta(days=6)
-        hj, _ = calcular_horas_justificadas(user_id, sem_inicio, sem_fim, colaborador, db)
-        semanas_no_mes[chave] += hj
-    for h in semanas_no_mes.values():
-        horas_extras_mes += calcular_horas_extras_semana(h, max_horas)
-
-    # Atrasos no mês
-    atrasos_mes = sum(1 for r in registros_mes if r['atraso_minutos'] and r['atraso_minutos'] > 0)
-    total_atraso_mes = sum(r['atraso_minutos'] for r in registros_mes if r['atraso_minutos'] and r['atraso_minutos'] > 0)
-
-    # Tipo do dia (normal ou especial)
-    tipo_dia_hoje = tipo_dia(hoje_dt, db)
-    feriado_hoje = is_feriado(hoje_dt, db)
-
-    # Duração mínima do almoço
-    min_almoco = 30 if tipo_dia_hoje == 'especial' else 60
-
-    # Calcular horário mínimo de retorno do almoço (se estiver em almoço)
-    retorno_minimo = None
-    if registro_hoje and registro_hoje['saida_almoco'] and not registro_hoje['retorno_almoco']:
-        fmt = '%H:%M'
-        h_saida_almoco = datetime.strptime(registro_hoje['saida_almoco'], fmt)
-        h_retorno_min = h_saida_almoco + timedelta(minutes=min_almoco)
-        retorno_minimo = h_retorno_min.strftime('%H:%M')
-
-    # Determinar próximo tipo de batida
-    proximo_tipo = _determinar_proximo_tipo(registro_hoje)
-
-    # Justificativas pendentes
-    justificativas = db.execute(
-        '''SELECT * FROM justificativas
-           WHERE colaborador_id = ?
-           ORDER BY data_registro DESC LIMIT 10''',
-        (user_id,)
-    ).fetchall()
-
-    # Escala de hoje (se existir)
-    escala_hoje = db.execute(
-        'SELECT * FROM escalas WHERE colaborador_id = ? AND data = ?',
-        (user_id, hoje_iso)
-    ).fetchone()
-
-    # Escalas da semana (para mostrar ao colaborador)
-    inicio_sem, fim_sem = get_semana_inicio_fim(hoje_dt)
-    escalas_semana = db.execute(
-        'SELECT * FROM escalas WHERE colaborador_id = ? AND data BETWEEN ? AND ? ORDER BY data',
-        (user_id, inicio_sem.isoformat(), fim_sem.isoformat())
-    ).fetchall()
-
-    # Escalas do mês inteiro (visão mensal)
-    inicio_mes_dt, fim_mes_dt = get_mes_inicio_fim(hoje_dt)
-    escalas_mes = db.execute(
-        'SELECT * FROM escalas WHERE colaborador_id = ? AND data BETWEEN ? AND ? ORDER BY data',
-        (user_id, inicio_mes_dt.isoformat(), fim_mes_dt.isoformat())
-    ).fetchall()
-    escalas_mes_map = {e['data']: e for e in escalas_mes}
-
-    # Gerar calendário do mês (lista de semanas com dias — semana começa no domingo)
-    primeiro_dia_mes = inicio_mes_dt
-    ultimo_dia_mes = fim_mes_dt
-    # Começar do domingo da semana do primeiro dia do mês
-    # weekday(): 0=seg..6=dom. Para achar o domingo anterior: (weekday + 1) % 7
-    offset_dom = (primeiro_dia_mes.weekday() + 1) % 7
-    cal_inicio = primeiro_dia_mes - timedelta(days=offset_dom)
-    # Terminar no sábado da semana do último dia do mês
-    offset_sab = (5 - ultimo_dia_mes.weekday()) % 7
-    cal_fim = ultimo_dia_mes + timedelta(days=offset_sab)
-    calendario_semanas = []
-    d = cal_inicio
-    while d <= cal_fim:
-        semana = []
-        for _ in range(7):
-            semana.append(d)
-            d += timedelta(days=1)
-        calendario_semanas.append(semana)
-
-    meses_pt = ['', 'Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho',
-                'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
-    nome_mes_atual = f"{meses_pt[hoje_dt.month]} {hoje_dt.year}"
-
-    db.close()
-
     return render_template('meu_ponto.html',
-                           colaborador=colaborador,
-                           registro_hoje=registro_hoje,
-                           registros_semana=registros_semana,
-                           registros_mes=registros_mes,
-                           horas_semana=round(horas_semana, 2),
-                           horas_mes=round(horas_mes, 2),
-                           horas_just_semana=horas_just_semana,
-                           horas_just_mes=horas_just_mes,
-                           resumo_sem=resumo_sem,
-                           horas_extras_mes=round(horas_extras_mes, 2),
-                           tipo_dia_hoje=tipo_dia_hoje,
-                           feriado_hoje=feriado_hoje,
-                           min_almoco=min_almoco,
-                           retorno_minimo=retorno_minimo,
-                           proximo_tipo=proximo_tipo,
-                           atrasos_mes=atrasos_mes,
-                           total_atraso_mes=total_atraso_mes,
-                           escala_hoje=escala_hoje,
-                           escalas_semana=escalas_semana,
-                           escalas_mes_map=escalas_mes_map,
-                           calendario_semanas=calendario_semanas,
-                           nome_mes_atual=nome_mes_atual,
-                           inicio_mes_dt=inicio_mes_dt,
-                           fim_mes_dt=fim_mes_dt,
-                           justificativas=justificativas)
+                           idempotencia=uuid.uuid4().hex,
+                           **painel.montar_meu_ponto(db, colaborador, hoje()))
 
 
 def _determinar_proximo_tipo(registro):
     """Determina qual é a próxima batida a ser feita."""
-    if not registro:
-        return 'entrada'
-    if not registro['entrada']:
-        return 'entrada'
-    if not registro['saida_almoco']:
-        return 'saida_almoco'
-    if not registro['retorno_almoco']:
-        return 'retorno_almoco'
-    if not registro['saida']:
-        return 'saida'
-    return 'completo'
+    return ponto.proximo_tipo(registro)
 
 
 LABELS_TIPO = {
@@ -529,134 +372,326 @@ LABELS_TIPO = {
 }
 
 
+def _mensagem_batida(batida):
+    """(mensagem, categoria) para o resultado de ponto.registrar_batida."""
+    hora = batida['hora']
+    if batida['status'] == ponto.COMPLETO:
+        return 'Todas as batidas do dia já foram registradas.', 'info'
+    if batida['status'] == ponto.FORA_DE_ORDEM:
+        return (f'Horário {hora} anterior à última batida registrada ({batida["ultima"]}).',
+                'warning')
+    if batida['status'] == ponto.ALMOCO_CURTO:
+        return (f'Intervalo de almoço mínimo: {batida["min_almoco"]} minutos. '
+                f'Faltam {batida["restante"]} min. Aguarde para registrar o retorno.', 'warning')
+    if batida['status'] == ponto.DUPLICADA:
+        # Reenvio do mesmo formulário (duplo toque): nada foi gravado de novo
+        return f'{LABELS_TIPO[batida["tipo"]]} já registrada às {hora}.', 'info'
+    if batida['tipo'] == 'entrada' and batida['atraso'] > 0:
+        return (f'Entrada registrada às {hora} — atraso de {batida["atraso"]} min '
+                f'(horário esperado: {batida["horario_esperado"]}).', 'warning')
+    return f'{LABELS_TIPO[batida["tipo"]]} registrada às {hora}!', 'success'
+
+
 @app.route('/registrar-ponto', methods=['POST'])
 @login_required
 def registrar_ponto():
     db = get_db()
-    user_id = session['user_id']
-    hoje_iso = hoje().isoformat()
-    agora_str = agora().strftime('%H:%M')
-    td = tipo_dia(hoje(), db)
+    batida = ponto.registrar_batida(db, session['user_id'], hoje(), agora().strftime('%H:%M'),
+                                    request.form.get('idempotencia') or None)
+    flash(*_mensagem_batida(batida))
+    return redirect(url_for('meu_ponto'))
+
+
+# ---------------------------------------------------------------------------
+# API de ponto (JSON, token) — quiosques e apps
+# ---------------------------------------------------------------------------
+
+def _json_registro(registro):
+    if registro is None:
+        return None
+    return {
+        'data': registro['data'],
+        'entrada': registro['entrada'] or None,
+        'saida_almoco': registro['saida_almoco'] or None,
+        'retorno_almoco': registro['retorno_almoco'] or None,
+        'saida': registro['saida'] or None,
+        'horas_trabalhadas': registro['horas_trabalhadas'],
+        'atraso_minutos': registro['atraso_minutos'] or 0,
+        'status': registro['status'],
+    }
+
+
+def _json_batida(batida):
+    if batida['status'] == ponto.INVALIDA:
+        mensagem = batida['erro']
+    else:
+        mensagem, _ = _mensagem_batida(batida)
+    return {
+        'status': batida['status'],
+        'tipo': batida['tipo'],
+        'data': batida['data'],
+        'hora': batida['hora'],
+        'atraso_minutos': batida['atraso'],
+        'mensagem': mensagem,
+        'registro': _json_registro(batida['registro']),
+        'proximo_tipo': _determinar_proximo_tipo(batida['registro']) if batida['registro'] else None,
+    }
+
+
+STATUS_HTTP_BATIDA = {
+    ponto.REGISTRADA: 201,
+    ponto.DUPLICADA: 200,
+    ponto.COMPLETO: 409,
+    ponto.ALMOCO_CURTO: 409,
+    ponto.FORA_DE_ORDEM: 409,
+}
+
+
+def _corpo_api():
+    """Corpo JSON ou formulário da requisição."""
+    return request.get_json(silent=True) or request.form
 
-    # Busca registro de hoje
+
+def _data_hora_batida(valor):
+    """Horário ISO de uma batida offline no fuso de São Paulo (sem fuso, ao minuto)."""
+    dt = datetime.fromisoformat(str(valor))
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(BR_TZ).replace(tzinfo=None)
+    return dt.replace(second=0, microsecond=0)
+
+
+@app.route('/api/v1/token', methods=['POST'])
+def api_token():
+    dados = _corpo_api()
+    email = str(dados.get('email', '')).strip().lower()
+    senha = str(dados.get('senha', ''))
+    user = get_db().execute(
+        'SELECT * FROM colaboradores WHERE email = ? AND ativo = 1', (email,)
+    ).fetchone()
+    if not user or user['primeiro_acesso'] or not check_password_hash(user['senha'], senha):
+        # Primeiro acesso exige criar a senha pelo site antes de usar a API
+        return jsonify({'erro': 'E-mail ou senha inválidos.'}), 401
+    return jsonify({
+        'token': gerar_token_api(user),
+        'expira_em': (agora() + timedelta(days=API_TOKEN_DIAS)).isoformat(timespec='seconds'),
+        'colaborador': {'id': user['id'], 'nome': user['nome']},
+    })
+
+
+@app.route('/api/v1/ponto', methods=['POST'])
+@token_required
+def api_registrar_ponto():
+    db = get_db()
+    batida = ponto.registrar_batida(db, g.colaborador_api['id'], hoje(),
+                                    agora().strftime('%H:%M'),
+                                    _corpo_api().get('idempotencia') or None)
+    if batida['registro'] is None:
+        # Reenvio respondido sem lock: busca a linha para o cliente
+        batida['registro'] = db.execute(
+            'SELECT * FROM registros_ponto WHERE colaborador_id = ? AND data = ?',
+            (g.colaborador_api['id'], batida['data'])
+        ).fetchone()
+    return jsonify(_json_batida(batida)), STATUS_HTTP_BATIDA[batida['status']]
+
+
+@app.route('/api/v1/ponto/hoje')
+@token_required
+def api_ponto_hoje():
+    db = get_db()
+    hoje_dt = hoje()
     registro = db.execute(
         'SELECT * FROM registros_ponto WHERE colaborador_id = ? AND data = ?',
-        (user_id, hoje_iso)
+        (g.colaborador_api['id'], hoje_dt.isoformat())
     ).fetchone()
+    td = tipo_dia(hoje_dt, db)
+    retorno_minimo = None
+    if registro and registro['saida_almoco'] and not registro['retorno_almoco']:
+        retorno_minimo = tempo.formatar(
+            tempo.para_minutos(registro['saida_almoco']) + (30 if td == 'especial' else 60))
+    horas = 0.0
+    if registro:
+        # Jornada em andamento conta até agora
+        horas = calcular_horas(registro['entrada'], registro['saida_almoco'],
+                               registro['retorno_almoco'], registro['saida'])
+    return jsonify({
+        'data': hoje_dt.isoformat(),
+        'tipo_dia': td,
+        'registro': _json_registro(registro),
+        'proximo_tipo': _determinar_proximo_tipo(registro),
+        'retorno_minimo': retorno_minimo,
+        'horas_ate_agora': horas,
+    })
+
+
+@app.route('/api/v1/ponto/semana')
+@token_required
+def api_ponto_semana():
+    db = get_db()
+    colaborador = g.colaborador_api
+    try:
+        ref = date.fromisoformat(request.args.get('data', ''))
+    except ValueError:
+        ref = hoje()
+    inicio_sem, fim_sem = get_semana_inicio_fim(ref)
+    registros = db.execute(
+        consultas.REGISTROS_COLABORADOR_PERIODO,
+        (colaborador['id'], inicio_sem.isoformat(), fim_sem.isoformat())
+    ).fetchall()
+    max_horas = colaborador['max_horas_semana'] or 40.0
+    resumo = calcular_resumo_semana(registros, max_horas)
+    linha = carregar_resumo_semanal(
+        db, inicio_sem, fim_sem, [colaborador['id']]).get(colaborador['id'], {}).get(inicio_sem)
+    horas_just = linha['horas_justificadas'] if linha else 0.0
+    horas_total = round(resumo['horas_total'] + horas_just, 2)
+    return jsonify({
+        'inicio': inicio_sem.isoformat(),
+        'fim': fim_sem.isoformat(),
+        'dias': [_json_registro(r) for r in registros],
+        'horas_trabalhadas': resumo['horas_total'],
+        'horas_justificadas': horas_just,
+        'horas_total': horas_total,
+        'horas_extras': calcular_horas_extras_semana(horas_total, max_horas),
+        'max_horas_semana': max_horas,
+        'dias_trabalhados': resumo['dias_trabalhados'],
+    })
+
+
+def _gravar_batidas_offline(itens, colaborador_do_item):
+    """Valida e grava batidas offline (ponto.registrar_lote); resposta JSON da API.
+
+    colaborador_do_item(item) devolve o id do colaborador ou None se o
+    item não puder bater ponto por este cliente.
+    """
+    itens = [item if isinstance(item, dict) else {} for item in itens]
+    agora_dt = agora().replace(tzinfo=None)
+    limite_antigo = (agora_dt - ponto.RETENCAO_CHAVES).date()
+    resultados = [None] * len(itens)
+    validas, posicoes = [], []
+    for i, item in enumerate(itens):
+        invalida = {'status': ponto.INVALIDA, 'tipo': None, 'data': None,
+                    'hora': None, 'atraso': 0, 'registro': None}
+        colab_id = colaborador_do_item(item)
+        try:
+            dt = _data_hora_batida(item.get('data_hora'))
+        except (TypeError, ValueError):
+            resultados[i] = dict(invalida, erro='Horário inválido.')
+            continue
+        invalida.update(data=dt.date().isoformat(), hora=dt.strftime('%H:%M'))
+        if colab_id is None:
+            resultados[i] = dict(invalida, erro='Colaborador não encontrado.')
+        elif dt > agora_dt + timedelta(minutes=5):
+            resultados[i] = dict(invalida, erro='Horário no futuro.')
+        elif dt.date() < limite_antigo:
+            resultados[i] = dict(invalida, erro='Batida antiga demais para envio offline.')
+        else:
+            validas.append((colab_id, dt.date(), dt.strftime('%H:%M'),
+                            str(item.get('idempotencia') or '') or None))
+            posicoes.append(i)
 
-    proximo_tipo = _determinar_proximo_tipo(registro)
+    if validas:
+        gravadas = ponto.registrar_lote(get_db(), validas)
+        for i, batida in zip(posicoes, gravadas):
+            resultados[i] = batida
 
-    if proximo_tipo == 'completo':
-        flash('Todas as batidas do dia já foram registradas.', 'info')
-        db.close()
-        return redirect(url_for('meu_ponto'))
+    return {
+        'registradas': sum(1 for r in resultados if r['status'] == ponto.REGISTRADA),
+        'resultados': [dict(_json_batida(r), idempotencia=item.get('idempotencia'))
+                       for r, item in zip(resultados, itens)],
+    }
 
-    # Validar duração mínima do almoço ao retornar
-    if proximo_tipo == 'retorno_almoco' and registro and registro['saida_almoco']:
-        fmt = '%H:%M'
-        h_saida_almoco = datetime.strptime(registro['saida_almoco'], fmt)
-        h_retorno = datetime.strptime(agora_str, fmt)
-        almoco_minutos = (h_retorno - h_saida_almoco).total_seconds() / 60
-        min_almoco = 30 if td == 'especial' else 60
-        if almoco_minutos < min_almoco:
-            restante = int(min_almoco - almoco_minutos)
-            flash(f'Intervalo de almoço mínimo: {min_almoco} minutos. '
-                  f'Faltam {restante} min. Aguarde para registrar o retorno.', 'warning')
-            db.close()
-            return redirect(url_for('meu_ponto'))
 
-    if not registro:
-        # Criar registro do dia
-        # Calcular atraso — prioridade: escala do dia > horário fixo do colaborador
-        colaborador = db.execute(
-            'SELECT * FROM colaboradores WHERE id = ?', (user_id,)
-        ).fetchone()
-        atraso = 0
+def _itens_lote(maximo):
+    """Lista "batidas" do corpo JSON, ou a resposta de erro."""
+    itens = (request.get_json(silent=True) or {}).get('batidas')
+    if not isinstance(itens, list) or not itens:
+        return None, (jsonify({'erro': 'Envie a lista "batidas".'}), 400)
+    if len(itens) > maximo:
+        return None, (jsonify({'erro': f'Máximo de {maximo} batidas por envio.'}), 413)
+    return itens, None
 
-        # Primeiro verificar escala do dia
-        escala_hoje = db.execute(
-            'SELECT * FROM escalas WHERE colaborador_id = ? AND data = ?',
-            (user_id, hoje_iso)
-        ).fetchone()
 
-        horario_esp = ''
-        if escala_hoje and escala_hoje['horario_entrada']:
-            horario_esp = escala_hoje['horario_entrada']
-        elif colaborador and colaborador['horario_entrada']:
-            horario_esp = colaborador['horario_entrada']
-
-        if horario_esp:
-            tolerancia = db.execute(
-                "SELECT valor FROM configuracoes WHERE chave = 'tolerancia_minutos'"
-            ).fetchone()
-            tol_min = int(tolerancia['valor']) if tolerancia else 15
-            fmt = '%H:%M'
-            try:
-                h_esperada = datetime.strptime(horario_esp, fmt)
-                h_real = datetime.strptime(agora_str, fmt)
-                diff = (h_real - h_esperada).total_seconds() / 60
-                if diff > tol_min:
-                    atraso = int(diff)
-            except (ValueError, TypeError):
-                pass
+@app.route('/api/v1/ponto/lote', methods=['POST'])
+@token_required
+def api_ponto_lote():
+    """Batidas enfileiradas offline: {"batidas": [{"data_hora": ISO, "idempotencia": ...}]}."""
+    itens, erro = _itens_lote(API_LOTE_MAXIMO)
+    if erro:
+        return erro
+    colab_id = g.colaborador_api['id']
+    return jsonify(_gravar_batidas_offline(itens, lambda item: colab_id))
 
-        db.execute(
-            '''INSERT INTO registros_ponto
-               (colaborador_id, data, entrada, tipo_dia, status, atraso_minutos)
-               VALUES (?, ?, ?, ?, 'em_andamento', ?)''',
-            (user_id, hoje_iso, agora_str, td, atraso)
-        )
 
-        if atraso > 0:
-            flash(f'Entrada registrada às {agora_str} — atraso de {atraso} min '
-                  f'(horário esperado: {horario_esp}).', 'warning')
-        else:
-            flash(f'Entrada registrada às {agora_str}!', 'success')
-    else:
-        # Atualizar registro existente
-        db.execute(
-            f'UPDATE registros_ponto SET {proximo_tipo} = ? WHERE id = ?',
-            (agora_str, registro['id'])
-        )
+# ---------------------------------------------------------------------------
+# Quiosque offline (service worker + fila local no navegador)
+# ---------------------------------------------------------------------------
 
-        # Se é a saída final, calcular horas e marcar como completo
-        if proximo_tipo == 'saida':
-            reg_atualizado = db.execute(
-                'SELECT * FROM registros_ponto WHERE id = ?', (registro['id'],)
-            ).fetchone()
-            horas = calcular_horas(
-                reg_atualizado['entrada'],
-                reg_atualizado['saida_almoco'],
-                reg_atualizado['retorno_almoco'],
-                agora_str
-            )
-            db.execute(
-                '''UPDATE registros_ponto
-                   SET horas_trabalhadas = ?, status = 'completo'
-                   WHERE id = ?''',
-                (horas, registro['id'])
-            )
-        else:
-            # Atualizar horas parciais
-            reg_atualizado = db.execute(
-                'SELECT * FROM registros_ponto WHERE id = ?', (registro['id'],)
-            ).fetchone()
-            horas = calcular_horas(
-                reg_atualizado['entrada'],
-                reg_atualizado['saida_almoco'] if proximo_tipo != 'saida_almoco' else agora_str,
-                reg_atualizado['retorno_almoco'] if proximo_tipo != 'retorno_almoco' else agora_str,
-                reg_atualizado['saida']
-            )
-            db.execute(
-                'UPDATE registros_ponto SET horas_trabalhadas = ? WHERE id = ?',
-                (horas, registro['id'])
-            )
+def _colaboradores_quiosque(db, loja_id):
+    sql = 'SELECT id, nome FROM colaboradores WHERE ativo = 1'
+    params = []
+    if loja_id:
+        sql += ' AND loja_id = ?'
+        params.append(loja_id)
+    return db.execute(sql + ' ORDER BY nome', params).fetchall()
 
-        flash(f'{LABELS_TIPO[proximo_tipo]} registrada às {agora_str}!', 'success')
 
-    db.commit()
-    db.close()
-    return redirect(url_for('meu_ponto'))
+@app.route('/quiosque/')
+@gestor_required
+def quiosque():
+    """Tela de ponto compartilhada da loja, ativada por um gestor no aparelho."""
+    db = get_db()
+    gestor = db.execute('SELECT * FROM colaboradores WHERE id = ?',
+                        (session['user_id'],)).fetchone()
+    loja_id = request.args.get('loja', type=int) or 0
+    lojas = _lojas_ativas(db)
+    todas = _escopo_lojas() is None
+    if not loja_id and not todas:
+        # Gestor de lojas não ativa o quiosque de todas: abre na primeira dele
+        if not lojas:
+            abort(403)
+        return redirect(url_for('quiosque', loja=lojas[0]['id']))
+    if not escopo.contem(_escopo_lojas(), loja_id):
+        abort(403)
+    loja = next((l for l in lojas if l['id'] == loja_id), None)
+    if loja_id and loja is None:
+        abort(404)
+    return render_template('quiosque.html',
+                           loja=loja,
+                           lojas=lojas,
+                           todas=todas,
+                           colaboradores=_colaboradores_quiosque(db, loja['id'] if loja else 0),
+                           token=gerar_token_quiosque(gestor, loja['id'] if loja else 0))
+
+
+@app.route('/quiosque/sw.js')
+def quiosque_service_worker():
+    # Servido sob /quiosque/ para que o escopo do service worker cubra a tela
+    resposta = send_from_directory(os.path.join(app.root_path, 'static', 'js'),
+                                   'sw-quiosque.js', mimetype='application/javascript')
+    resposta.headers['Cache-Control'] = 'no-cache'
+    return resposta
+
+
+@app.route('/api/ponto/sync', methods=['POST'])
+@quiosque_required
+def api_ponto_sync():
+    """Fila do quiosque: {"batidas": [{"colaborador_id", "data_hora", "idempotencia"}]}.
+
+    Todas as batidas entram numa única transação; cada uma recebe seu
+    resultado (e a chave de idempotência de volta, para sair da fila).
+    """
+    itens, erro = _itens_lote(API_SYNC_MAXIMO)
+    if erro:
+        return erro
+    permitidos = {c['id'] for c in _colaboradores_quiosque(get_db(), g.quiosque_loja)}
+
+    def colaborador_do_item(item):
+        try:
+            colab_id = int(item.get('colaborador_id'))
+        except (TypeError, ValueError):
+            return None
+        return colab_id if colab_id in permitidos else None
+
+    return jsonify(_gravar_batidas_offline(itens, colaborador_do_item))
 
 
 # ---------------------------------------------------------------------------
@@ -670,196 +705,67 @@ def dashboard():
     hoje_iso = hoje().isoformat()
     inicio_sem, fim_sem = get_semana_inicio_fim(hoje())
     inicio_mes, fim_mes = get_mes_inicio_fim(hoje())
+    filtro_loja, lojas = escopo.filtro_sql(_escopo_lojas())
 
-    # Todos os colaboradores ativos
+    # Colaboradores ativos das lojas do gestor
     colaboradores = db.execute(
-        'SELECT * FROM colaboradores WHERE ativo = 1 ORDER BY nome'
+        consultas.COLABORADORES_ATIVOS.format(filtro_loja=filtro_loja), lojas
     ).fetchall()
 
-    # Registros de hoje de todos
+    # Registros de hoje desses colaboradores
     registros_hoje = db.execute(
-        '''SELECT r.*, c.nome as colaborador_nome
-           FROM registros_ponto r
-           JOIN colaboradores c ON r.colaborador_id = c.id
-           WHERE r.data = ? AND c.ativo = 1
-           ORDER BY c.nome''',
-        (hoje_iso,)
+        consultas.REGISTROS_HOJE.format(filtro_loja=filtro_loja), [hoje_iso] + lojas
     ).fetchall()
 
     # IDs que registraram hoje
     ids_com_registro = {r['colaborador_id'] for r in registros_hoje}
 
-    # Resumo semanal por colaborador (com horas extras)
-    resumo_semanal = db.execute(
-        '''SELECT c.id, c.nome, c.cargo, c.max_horas_semana, c.folgas_semana,
-                  SUM(r.horas_trabalhadas) as horas_semana,
-                  COUNT(r.id) as dias_semana
-           FROM colaboradores c
-           LEFT JOIN registros_ponto r ON c.id = r.colaborador_id
-               AND r.data BETWEEN ? AND ?
-           WHERE c.ativo = 1
-           GROUP BY c.id
-           ORDER BY c.nome''',
-        (inicio_sem.isoformat(), fim_sem.isoformat())
-    ).fetchall()
-
-    # Resumo mensal por colaborador
-    resumo_mensal = db.execute(
-        '''SELECT c.id, c.nome, c.cargo, c.max_horas_semana,
-                  SUM(r.horas_trabalhadas) as horas_mes,
-                  COUNT(r.id) as dias_mes
-           FROM colaboradores c
-           LEFT JOIN registros_ponto r ON c.id = r.colaborador_id
-               AND r.data BETWEEN ? AND ?
-           WHERE c.ativo = 1
-           GROUP BY c.id
-           ORDER BY c.nome''',
-        (inicio_mes.isoformat(), fim_mes.isoformat())
-    ).fetchall()
-
-    # Calcular horas extras mensais e horas justificadas por colaborador
-    horas_extras_mensal = {}
-    horas_justificadas_mensal = {}
-    for c in colaboradores:
-        regs_mes = db.execute(
-            '''SELECT data, horas_trabalhadas FROM registros_ponto
-               WHERE colaborador_id = ? AND data BETWEEN ? AND ?''',
-            (c['id'], inicio_mes.isoformat(), fim_mes.isoformat())
-        ).fetchall()
-        max_h = c['max_horas_semana'] or 40.0
-
-        # Horas justificadas do mês
-        hj_mes, _ = calcular_horas_justificadas(c['id'], inicio_mes, fim_mes, c, db)
-        horas_justificadas_mensal[c['id']] = hj_mes
-
-        semanas = {}
-        for r in regs_mes:
-            d = date.fromisoformat(r['data'])
-            sem_inicio, _ = get_semana_inicio_fim(d)
-            chave = sem_inicio.isoformat()
-            semanas[chave] = semanas.get(chave, 0) + r['horas_trabalhadas']
-        # Adicionar justificadas por semana
-        for chave in list(semanas.keys()):
-            sem_inicio = date.fromisoformat(chave)
-            sem_fim = sem_inicio + timedelta(days=6)
-            hj, _ = calcular_horas_justificadas(c['id'], sem_inicio, sem_fim, c, db)
-            semanas[chave] += hj
-        extras = sum(calcular_horas_extras_semana(h, max_h) for h in semanas.values())
-        horas_extras_mensal[c['id']] = round(extras, 2)
+    # Totais por colaborador da semana e do mês, do cache: só quem teve
+    # alteração é recalculado
+    semana = inicio_sem.isoformat()
+    mes = inicio_mes.strftime('%Y-%m')
+    totais = cache_painel.totais(db, colaboradores, [mes, semana])
+
+    # Resumo semanal e mensal por colaborador
+    resumo_semanal = [dict(c, horas_semana=totais[(c['id'], semana)]['horas'],
+                           dias_semana=totais[(c['id'], semana)]['dias'])
+                      for c in colaboradores]
+    resumo_mensal = [dict(c, horas_mes=totais[(c['id'], mes)]['horas'],
+                          dias_mes=totais[(c['id'], mes)]['dias'])
+                     for c in colaboradores]
+
+    # Horas extras mensais e horas justificadas por colaborador
+    horas_extras_mensal = {c['id']: round(totais[(c['id'], mes)]['extras'], 2)
+                           for c in colaboradores}
+    horas_justificadas_mensal = {c['id']: totais[(c['id'], mes)]['justificadas']
+                                 for c in colaboradores}
 
     # Justificativas pendentes
     justificativas_pendentes = db.execute(
-        '''SELECT j.*, c.nome as colaborador_nome
-           FROM justificativas j
-           JOIN colaboradores c ON j.colaborador_id = c.id
-           WHERE j.status = 'pendente'
-           ORDER BY j.data_registro DESC'''
+        consultas.JUSTIFICATIVAS_PENDENTES.format(filtro_loja=filtro_loja), lojas
     ).fetchall()
 
     # Atrasos de hoje
     atrasos_hoje = sum(1 for r in registros_hoje if r['atraso_minutos'] and r['atraso_minutos'] > 0)
 
     # Alertas: colaboradores sem registro hoje (e que não tem justificativa)
-    ausentes = []
-    for c in colaboradores:
-        if c['id'] not in ids_com_registro and not c['is_gestor']:
-            just = db.execute(
-                '''SELECT id FROM justificativas
-                   WHERE colaborador_id = ? AND ? BETWEEN data_inicio AND data_fim
-                   AND status = 'aprovado' ''',
-                (c['id'], hoje_iso)
-            ).fetchone()
-            if not just:
-                ausentes.append(c)
-
-    # -----------------------------------------------------------------------
-    # Dados para gráficos (Chart.js)
-    # -----------------------------------------------------------------------
-
-    # 1. Evolução diária de horas (últimos 30 dias)
-    trinta_dias_atras = (hoje() - timedelta(days=29)).isoformat()
-    evolucao_diaria = db.execute(
-        '''SELECT data, SUM(horas_trabalhadas) as total_horas, COUNT(id) as total_registros
-           FROM registros_ponto
-           WHERE data BETWEEN ? AND ?
-           GROUP BY data
-           ORDER BY data''',
-        (trinta_dias_atras, hoje_iso)
-    ).fetchall()
-    chart_evolucao_labels = [r['data'][5:] for r in evolucao_diaria]  # MM-DD
-    chart_evolucao_horas = [round(r['total_horas'], 2) for r in evolucao_diaria]
-    chart_evolucao_presencas = [r['total_registros'] for r in evolucao_diaria]
-
-    # 2. Comparativo mensal (últimos 6 meses)
-    chart_mensal_labels = []
-    chart_mensal_horas = []
-    chart_mensal_extras = []
-    meses_nomes = ['Jan','Fev','Mar','Abr','Mai','Jun',
-                   'Jul','Ago','Set','Out','Nov','Dez']
-    for i in range(5, -1, -1):
-        d_ref = hoje().replace(day=1)
-        # Subtrair meses
-        for _ in range(i):
-            d_ref = (d_ref - timedelta(days=1)).replace(day=1)
-        m_inicio, m_fim = get_mes_inicio_fim(d_ref)
-        label = f"{meses_nomes[d_ref.month - 1]}/{str(d_ref.year)[2:]}"
-        chart_mensal_labels.append(label)
-
-        totais_mes = db.execute(
-            '''SELECT COALESCE(SUM(horas_trabalhadas), 0) as total
-               FROM registros_ponto
-               WHERE data BETWEEN ? AND ?''',
-            (m_inicio.isoformat(), m_fim.isoformat())
-        ).fetchone()
-        chart_mensal_horas.append(round(totais_mes['total'], 2))
-
-        # Horas extras do mês (simplificado: total - esperado proporcional)
-        extras_total = 0.0
-        for c in colaboradores:
-            regs = db.execute(
-                '''SELECT data, horas_trabalhadas FROM registros_ponto
-                   WHERE colaborador_id = ? AND data BETWEEN ? AND ?''',
-                (c['id'], m_inicio.isoformat(), m_fim.isoformat())
-            ).fetchall()
-            max_h = c['max_horas_semana'] or 40.0
-            semanas_c = {}
-            for r in regs:
-                d_r = date.fromisoformat(r['data'])
-                sem_i, _ = get_semana_inicio_fim(d_r)
-                ch = sem_i.isoformat()
-                semanas_c[ch] = semanas_c.get(ch, 0) + r['horas_trabalhadas']
-            extras_total += sum(calcular_horas_extras_semana(h, max_h) for h in semanas_c.values())
-        chart_mensal_extras.append(round(extras_total, 2))
-
-    # 3. Ranking de horas no mês (top 10)
-    ranking = db.execute(
-        '''SELECT c.nome, SUM(r.horas_trabalhadas) as total_horas
-           FROM registros_ponto r
-           JOIN colaboradores c ON r.colaborador_id = c.id
-           WHERE r.data BETWEEN ? AND ? AND c.ativo = 1
-           GROUP BY c.id
-           ORDER BY total_horas DESC
-           LIMIT 10''',
-        (inicio_mes.isoformat(), fim_mes.isoformat())
-    ).fetchall()
-    chart_ranking_nomes = [r['nome'].split()[0] for r in ranking]  # Primeiro nome
-    chart_ranking_horas = [round(r['total_horas'], 2) for r in ranking]
+    justificados_hoje = {r['colaborador_id'] for r in db.execute(
+        consultas.JUSTIFICADOS_DIA, (hoje_iso, hoje_iso)
+    )}
+    ausentes = [c for c in colaboradores
+                if c['id'] not in ids_com_registro and not c['is_gestor']
+                and c['id'] not in justificados_hoje]
+
+    # Os gráficos (Chart.js) buscam os dados depois, em /api/dashboard/*
 
     # Escalas de hoje (para mostrar quem tem escala/folga)
     escalas_hoje = db.execute(
-        '''SELECT e.*, c.nome as colaborador_nome
-           FROM escalas e
-           JOIN colaboradores c ON e.colaborador_id = c.id
-           WHERE e.data = ? AND c.ativo = 1
-           ORDER BY c.nome''',
-        (hoje_iso,)
+        consultas.ESCALAS_HOJE.format(filtro_loja=filtro_loja), [hoje_iso] + lojas
     ).fetchall()
 
     escalados_hoje = sum(1 for e in escalas_hoje if not e['folga'])
     folgas_hoje = sum(1 for e in escalas_hoje if e['folga'])
 
-    db.close()
-
     return render_template('dashboard.html',
                            colaboradores=colaboradores,
                            registros_hoje=registros_hoje,
@@ -873,18 +779,68 @@ def dashboard():
                            fim_sem=fim_sem,
                            inicio_mes=inicio_mes,
                            fim_mes=fim_mes,
-                           chart_evolucao_labels=chart_evolucao_labels,
-                           chart_evolucao_horas=chart_evolucao_horas,
-                           chart_evolucao_presencas=chart_evolucao_presencas,
-                           chart_mensal_labels=chart_mensal_labels,
-                           chart_mensal_horas=chart_mensal_horas,
-                           chart_mensal_extras=chart_mensal_extras,
-                           chart_ranking_nomes=chart_ranking_nomes,
                            atrasos_hoje=atrasos_hoje,
                            escalas_hoje=escalas_hoje,
                            escalados_hoje=escalados_hoje,
                            folgas_hoje=folgas_hoje,
-                           chart_ranking_horas=chart_ranking_horas)
+                           eventos_desde=eventos.ultimo_id(db),
+                           hoje_iso=hoje_iso)
+
+
+def _json_grafico(dados):
+    """Dados de um gráfico, que o navegador pode reusar por graficos.TTL segundos."""
+    resposta = jsonify(dados)
+    resposta.headers['Cache-Control'] = f'private, max-age={graficos.TTL}'
+    return resposta
+
+
+@app.route('/api/dashboard/evolucao')
+@gestor_required
+def api_dashboard_evolucao():
+    return _json_grafico(graficos.evolucao(get_db(), hoje(), _escopo_lojas()))
+
+
+@app.route('/api/dashboard/mensal')
+@gestor_required
+def api_dashboard_mensal():
+    return _json_grafico(graficos.mensal(get_db(), hoje(), _escopo_lojas()))
+
+
+@app.route('/api/dashboard/ranking')
+@gestor_required
+def api_dashboard_ranking():
+    return _json_grafico(graficos.ranking(get_db(), hoje(), _escopo_lojas()))
+
+
+@app.route('/dashboard/eventos')
+@gestor_required
+def dashboard_eventos():
+    """Stream (Server-Sent Events) das alterações do dia para o dashboard aberto."""
+    dia = request.args.get('dia') or hoje().isoformat()
+    desde = request.headers.get('Last-Event-ID', type=int)
+    if desde is None:
+        desde = request.args.get('desde', type=int)
+    if desde is None:
+        desde = eventos.ultimo_id(get_db())
+    lojas = _escopo_lojas()
+
+    # Sem stream_with_context: a conexão do pool é devolvida ao fim da
+    # view, e o stream só lê a memória do barramento
+    def gerar():
+        yield 'retry: 3000\n\n'
+        for evento_id, tipo, dados in eventos.barramento.ouvir(
+                desde, encerrar=lambda: hoje().isoformat() != dia):
+            if tipo == eventos.REGISTRO and dados['data'] != dia:
+                continue
+            if tipo in (eventos.REGISTRO, eventos.JUSTIFICATIVA) and not escopo.contem(
+                    lojas, dados['loja_id']):
+                continue
+            yield eventos.formatar_sse(evento_id, tipo, dados)
+
+    return Response(gerar(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
 
 
 @app.route('/relatorio-colaborador/<int:colab_id>')
@@ -892,12 +848,9 @@ def dashboard():
 def relatorio_colaborador(colab_id):
     db = get_db()
 
-    colaborador = db.execute(
-        'SELECT * FROM colaboradores WHERE id = ?', (colab_id,)
-    ).fetchone()
+    colaborador = _colaborador_do_escopo(db, colab_id)
     if not colaborador:
         flash('Colaborador não encontrado.', 'danger')
-        db.close()
         return redirect(url_for('dashboard'))
 
     # Período: parâmetro ou mês atual
@@ -911,9 +864,7 @@ def relatorio_colaborador(colab_id):
     inicio_mes, fim_mes = get_mes_inicio_fim(data_ref)
 
     registros = db.execute(
-        '''SELECT * FROM registros_ponto
-           WHERE colaborador_id = ? AND data BETWEEN ? AND ?
-           ORDER BY data''',
+        consultas.REGISTROS_COLABORADOR_PERIODO,
         (colab_id, inicio_mes.isoformat(), fim_mes.isoformat())
     ).fetchall()
 
@@ -940,10 +891,11 @@ def relatorio_colaborador(colab_id):
         semanas[chave]['registros'].append(r)
         semanas[chave]['total_horas'] += r['horas_trabalhadas']
 
-    # Adicionar horas justificadas por semana
+    # Adicionar horas justificadas por semana (resumo materializado)
+    resumos = carregar_resumo_semanal(db, inicio_mes, fim_mes, [colab_id]).get(colab_id, {})
     for chave in semanas:
-        hj, _ = calcular_horas_justificadas(
-            colab_id, semanas[chave]['inicio'], semanas[chave]['fim'], colaborador, db)
+        resumo = resumos.get(semanas[chave]['inicio'])
+        hj = resumo['horas_justificadas'] if resumo else 0.0
         semanas[chave]['horas_justificadas'] = hj
         semanas[chave]['total_horas'] += hj
 
@@ -962,33 +914,13 @@ def relatorio_colaborador(colab_id):
     total_horas_mes = total_horas_trabalhadas + horas_just_mes
     total_dias = len(registros)
 
-    # Calcular horas esperadas no mês
-    # Considera dias trabalhados: cada dia pode ser normal (8h) ou especial (6h)
-    horas_esperadas = 0.0
-    d = inicio_mes
-    dias_uteis = 0
-    while d <= min(fim_mes, hoje()):
-        # Conta todos os dias como possíveis dias de trabalho (horário flexível)
-        # mas desconta as folgas semanais (2 por semana estimado)
-        horas_esperadas += carga_esperada_dia(d, colaborador, db)
-        dias_uteis += 1
-        d += timedelta(days=1)
-
-    # Descontar folgas: folgas_semana * semanas no período
-    folgas = colaborador['folgas_semana'] or 2
-    semanas_periodo = max(1, dias_uteis / 7)
-    folgas_total = round(folgas * semanas_periodo)
-    # Desconta as folgas usando média da carga diária
-    media_carga = horas_esperadas / dias_uteis if dias_uteis > 0 else 8.0
-    horas_esperadas -= folgas_total * media_carga
-    horas_esperadas = max(0, horas_esperadas)
+    # Calcular horas esperadas no mês (dias normais/especiais menos folgas)
+    horas_esperadas = _calcular_horas_esperadas_mes(colaborador, inicio_mes, fim_mes, db)
 
     # Banco de horas (normais, sem contar extras)
     horas_normais_mes = min(total_horas_mes, total_horas_mes - total_horas_extras_mes)
     banco_horas = round(total_horas_mes - horas_esperadas, 2)
 
-    db.close()
-
     return render_template('relatorio_colaborador.html',
                            colaborador=colaborador,
                            registros=registros,
@@ -1014,16 +946,35 @@ def relatorio_colaborador(colab_id):
 @gestor_required
 def lista_colaboradores():
     db = get_db()
+    filtro_loja, lojas = escopo.filtro_sql(_escopo_lojas())
     colaboradores = db.execute(
-        '''SELECT c.*, l.nome as loja_nome
+        f'''SELECT c.*, l.nome as loja_nome
            FROM colaboradores c
            LEFT JOIN lojas l ON c.loja_id = l.id
-           ORDER BY c.nome'''
+           WHERE 1 = 1{filtro_loja}
+           ORDER BY c.nome''',
+        lojas
     ).fetchall()
-    db.close()
     return render_template('colaboradores.html', colaboradores=colaboradores)
 
 
+def _contexto_form_colaborador(db, colaborador):
+    """Lojas do formulário (as do escopo) e as que o colaborador gerencia (None: sem permissão)."""
+    lojas = _lojas_ativas(db)
+    lojas_gestor = None
+    if _escopo_lojas() is None:
+        lojas_gestor = (colaborador and escopo.lojas_do_gestor(db, colaborador['id'])) or ()
+    return {'lojas': lojas, 'lojas_gestor': lojas_gestor}
+
+
+def _salvar_lojas_gestor(db, colab_id, is_gestor):
+    """Grava as lojas marcadas no formulário; só quem vê todas as lojas pode atribuí-las."""
+    if _escopo_lojas() is not None:
+        return
+    lojas = request.form.getlist('lojas_gestor', type=int) if is_gestor else []
+    escopo.definir_lojas(db, colab_id, lojas)
+
+
 @app.route('/colaboradores/novo', methods=['GET', 'POST'])
 @gestor_required
 def novo_colaborador():
@@ -1032,7 +983,7 @@ def novo_colaborador():
         email = request.form.get('email', '').strip().lower()
         cargo = request.form.get('cargo', '').strip()
         departamento = request.form.get('departamento', '').strip()
-        loja_id = request.form.get('loja_id', '') or None
+        loja_id = request.form.get('loja_id', type=int)
         max_horas_semana = float(request.form.get('max_horas_semana', 40))
         horas_dia_normal = float(request.form.get('horas_dia_normal', 8))
         horas_dia_especial = float(request.form.get('horas_dia_especial', 6))
@@ -1043,13 +994,18 @@ def novo_colaborador():
         if not nome or not email:
             flash('Nome e e-mail são obrigatórios.', 'danger')
             db = get_db()
-            lojas = db.execute('SELECT * FROM lojas WHERE ativo = 1 ORDER BY nome').fetchall()
-            db.close()
-            return render_template('colaborador_form.html', colaborador=None, lojas=lojas)
+            return render_template('colaborador_form.html', colaborador=None,
+                                   **_contexto_form_colaborador(db, None))
+
+        if not escopo.contem(_escopo_lojas(), loja_id):
+            flash('Selecione uma das suas lojas.', 'danger')
+            db = get_db()
+            return render_template('colaborador_form.html', colaborador=None,
+                                   **_contexto_form_colaborador(db, None))
 
         db = get_db()
         try:
-            db.execute(
+            cursor = db.execute(
                 '''INSERT INTO colaboradores
                    (nome, email, senha, cargo, departamento, loja_id,
                     max_horas_semana, horas_dia_normal, horas_dia_especial,
@@ -1059,32 +1015,28 @@ def novo_colaborador():
                  max_horas_semana, horas_dia_normal, horas_dia_especial,
                  folgas_semana, horario_entrada, is_gestor, 1)
             )
+            _salvar_lojas_gestor(db, cursor.lastrowid, is_gestor)
+            cache_relatorios.marcar_alteracao(db, cursor.lastrowid)
             db.commit()
             flash(f'Colaborador "{nome}" cadastrado com sucesso! No primeiro login, será solicitada a criação de senha.', 'success')
         except Exception as e:
             flash(f'Erro ao cadastrar: {e}', 'danger')
-        finally:
-            db.close()
 
         return redirect(url_for('lista_colaboradores'))
 
     db = get_db()
-    lojas = db.execute('SELECT * FROM lojas WHERE ativo = 1 ORDER BY nome').fetchall()
-    db.close()
-    return render_template('colaborador_form.html', colaborador=None, lojas=lojas)
+    return render_template('colaborador_form.html', colaborador=None,
+                           **_contexto_form_colaborador(db, None))
 
 
 @app.route('/colaboradores/<int:colab_id>/editar', methods=['GET', 'POST'])
 @gestor_required
 def editar_colaborador(colab_id):
     db = get_db()
-    colaborador = db.execute(
-        'SELECT * FROM colaboradores WHERE id = ?', (colab_id,)
-    ).fetchone()
+    colaborador = _colaborador_do_escopo(db, colab_id)
 
     if not colaborador:
         flash('Colaborador não encontrado.', 'danger')
-        db.close()
         return redirect(url_for('lista_colaboradores'))
 
     if request.method == 'POST':
@@ -1092,7 +1044,7 @@ def editar_colaborador(colab_id):
         email = request.form.get('email', '').strip().lower()
         cargo = request.form.get('cargo', '').strip()
         departamento = request.form.get('departamento', '').strip()
-        loja_id = request.form.get('loja_id', '') or None
+        loja_id = request.form.get('loja_id', type=int)
         max_horas_semana = float(request.form.get('max_horas_semana', 40))
         horas_dia_normal = float(request.form.get('horas_dia_normal', 8))
         horas_dia_especial = float(request.form.get('horas_dia_especial', 6))
@@ -1103,6 +1055,11 @@ def editar_colaborador(colab_id):
         nova_senha = request.form.get('senha', '').strip()
         resetar_acesso = 1 if request.form.get('resetar_acesso') else 0
 
+        if not escopo.contem(_escopo_lojas(), loja_id):
+            flash('Selecione uma das suas lojas.', 'danger')
+            return render_template('colaborador_form.html', colaborador=colaborador,
+                                   **_contexto_form_colaborador(db, colaborador))
+
         try:
             if nova_senha:
                 db.execute(
@@ -1137,18 +1094,21 @@ def editar_colaborador(colab_id):
                      max_horas_semana, horas_dia_normal, horas_dia_especial,
                      folgas_semana, horario_entrada, is_gestor, ativo, colab_id)
                 )
+            if (max_horas_semana != colaborador['max_horas_semana']
+                    or horas_dia_normal != colaborador['horas_dia_normal']
+                    or horas_dia_especial != colaborador['horas_dia_especial']):
+                reconstruir_resumo_semanal(db, colab_id)
+            _salvar_lojas_gestor(db, colab_id, is_gestor)
+            cache_relatorios.marcar_alteracao(db, colab_id)
             db.commit()
             flash(f'Colaborador "{nome}" atualizado!', 'success')
         except Exception as e:
             flash(f'Erro ao atualizar: {e}', 'danger')
-        finally:
-            db.close()
 
         return redirect(url_for('lista_colaboradores'))
 
-    lojas = db.execute('SELECT * FROM lojas WHERE ativo = 1 ORDER BY nome').fetchall()
-    db.close()
-    return render_template('colaborador_form.html', colaborador=colaborador, lojas=lojas)
+    return render_template('colaborador_form.html', colaborador=colaborador,
+                           **_contexto_form_colaborador(db, colaborador))
 
 
 # ---------------------------------------------------------------------------
@@ -1160,11 +1120,14 @@ def editar_colaborador(colab_id):
 def lista_justificativas():
     db = get_db()
     if session.get('is_gestor'):
+        filtro_loja, lojas = escopo.filtro_sql(_escopo_lojas())
         justificativas = db.execute(
-            '''SELECT j.*, c.nome as colaborador_nome
+            f'''SELECT j.*, c.nome as colaborador_nome
                FROM justificativas j
                JOIN colaboradores c ON j.colaborador_id = c.id
-               ORDER BY j.data_registro DESC'''
+               WHERE 1 = 1{filtro_loja}
+               ORDER BY j.data_registro DESC''',
+            lojas
         ).fetchall()
     else:
         justificativas = db.execute(
@@ -1175,7 +1138,6 @@ def lista_justificativas():
                ORDER BY j.data_registro DESC''',
             (session['user_id'],)
         ).fetchall()
-    db.close()
     return render_template('justificativas.html', justificativas=justificativas)
 
 
@@ -1193,13 +1155,23 @@ def nova_justificativa():
         if not data_inicio or not data_fim or not tipo:
             flash('Preencha todos os campos obrigatórios.', 'danger')
             db = get_db()
-            colaboradores = db.execute(
-                'SELECT id, nome FROM colaboradores WHERE ativo = 1 ORDER BY nome'
-            ).fetchall() if session.get('is_gestor') else []
-            db.close()
+            colaboradores = _colaboradores_ativos(db) if session.get('is_gestor') else []
             return render_template('justificativa_form.html',
                                    justificativa=None, colaboradores=colaboradores)
 
+        # Calcular dias
+        try:
+            d_inicio = date.fromisoformat(data_inicio)
+            d_fim = date.fromisoformat(data_fim)
+            dias = (d_fim - d_inicio).days + 1
+        except ValueError:
+            d_inicio = d_fim = None
+            dias = 1
+
+        if d_inicio and d_fim and d_fim < d_inicio:
+            flash('A data final não pode ser anterior à data inicial.', 'danger')
+            return redirect(url_for('nova_justificativa'))
+
         # Upload de arquivo (atestado)
         arquivo_nome = ''
         arquivo = request.files.get('arquivo_atestado')
@@ -1209,14 +1181,6 @@ def nova_justificativa():
             arquivo_nome = f"atestado_{colab_id}_{timestamp}.{ext}"
             arquivo.save(os.path.join(app.config['UPLOAD_FOLDER'], arquivo_nome))
 
-        # Calcular dias
-        try:
-            d_inicio = date.fromisoformat(data_inicio)
-            d_fim = date.fromisoformat(data_fim)
-            dias = (d_fim - d_inicio).days + 1
-        except ValueError:
-            dias = 1
-
         db = get_db()
         try:
             # Se gestor, auto-aprovar
@@ -1224,7 +1188,7 @@ def nova_justificativa():
             aprovado_por = session['user_id'] if session.get('is_gestor') else None
             data_aprovacao = agora().isoformat() if session.get('is_gestor') else None
 
-            db.execute(
+            cursor = db.execute(
                 '''INSERT INTO justificativas
                    (colaborador_id, data_inicio, data_fim, tipo, descricao,
                     arquivo_atestado, dias, status, aprovado_por, data_aprovacao)
@@ -1232,6 +1196,10 @@ def nova_justificativa():
                 (colab_id, data_inicio, data_fim, tipo, descricao,
                  arquivo_nome, dias, status, aprovado_por, data_aprovacao)
             )
+            if status == 'aprovado' and d_inicio and d_fim:
+                atualizar_resumo_semanal(db, colab_id, d_inicio, d_fim)
+                cache_relatorios.marcar_alteracao(db, colab_id, d_inicio, d_fim)
+            eventos.publicar(db, eventos.JUSTIFICATIVA, colab_id, referencia=cursor.lastrowid)
             db.commit()
             if status == 'pendente':
                 flash('Justificativa enviada para aprovação do gestor!', 'success')
@@ -1239,16 +1207,11 @@ def nova_justificativa():
                 flash('Justificativa registrada e aprovada!', 'success')
         except Exception as e:
             flash(f'Erro: {e}', 'danger')
-        finally:
-            db.close()
 
         return redirect(url_for('lista_justificativas'))
 
     db = get_db()
-    colaboradores = db.execute(
-        'SELECT id, nome FROM colaboradores WHERE ativo = 1 ORDER BY nome'
-    ).fetchall() if session.get('is_gestor') else []
-    db.close()
+    colaboradores = _colaboradores_ativos(db) if session.get('is_gestor') else []
     return render_template('justificativa_form.html',
                            justificativa=None, colaboradores=colaboradores)
 
@@ -1267,14 +1230,31 @@ def aprovar_justificativa(just_id):
     acao = request.form.get('acao', 'aprovar')
     status = 'aprovado' if acao == 'aprovar' else 'rejeitado'
 
+    just = db.execute(
+        '''SELECT j.colaborador_id, j.data_inicio, j.data_fim, c.loja_id
+           FROM justificativas j
+           JOIN colaboradores c ON j.colaborador_id = c.id
+           WHERE j.id = ?''',
+        (just_id,)
+    ).fetchone()
+    if not just or not escopo.contem(_escopo_lojas(), just['loja_id']):
+        flash('Justificativa não encontrada.', 'danger')
+        return redirect(url_for('lista_justificativas'))
+
     db.execute(
         '''UPDATE justificativas
            SET status = ?, aprovado_por = ?, data_aprovacao = ?
            WHERE id = ?''',
         (status, session['user_id'], agora().isoformat(), just_id)
     )
+    atualizar_resumo_semanal(db, just['colaborador_id'],
+                             date.fromisoformat(just['data_inicio']),
+                             date.fromisoformat(just['data_fim']))
+    cache_relatorios.marcar_alteracao(db, just['colaborador_id'],
+                                      date.fromisoformat(just['data_inicio']),
+                                      date.fromisoformat(just['data_fim']))
+    eventos.publicar(db, eventos.JUSTIFICATIVA, just['colaborador_id'], referencia=just_id)
     db.commit()
-    db.close()
 
     label = 'aprovada' if status == 'aprovado' else 'rejeitada'
     flash(f'Justificativa {label} com sucesso!', 'success')
@@ -1315,26 +1295,20 @@ def _registrar_historico(db, registro_id, colaborador_id, editado_por, acao,
 def editar_registro(reg_id):
     db = get_db()
     registro = db.execute(
-        '''SELECT r.*, c.nome as colaborador_nome
+        '''SELECT r.*, c.nome as colaborador_nome, c.loja_id
            FROM registros_ponto r
            JOIN colaboradores c ON r.colaborador_id = c.id
            WHERE r.id = ?''',
         (reg_id,)
     ).fetchone()
 
-    if not registro:
+    if not registro or not escopo.contem(_escopo_lojas(), registro['loja_id']):
         flash('Registro não encontrado.', 'danger')
-        db.close()
         return redirect(url_for('dashboard'))
 
     # Carregar histórico de edições do registro
     historico = db.execute(
-        '''SELECT h.*, c.nome as editor_nome
-           FROM historico_edicoes h
-           JOIN colaboradores c ON h.editado_por = c.id
-           WHERE h.registro_id = ?
-           ORDER BY h.data_edicao DESC''',
-        (reg_id,)
+        consultas.HISTORICO_REGISTRO, (reg_id,)
     ).fetchall()
 
     if request.method == 'POST':
@@ -1347,7 +1321,6 @@ def editar_registro(reg_id):
 
         if not motivo:
             flash('Informe o motivo da edição.', 'warning')
-            db.close()
             return render_template('editar_registro.html',
                                    registro=registro, historico=historico)
 
@@ -1366,7 +1339,6 @@ def editar_registro(reg_id):
 
         if not campos_alterados:
             flash('Nenhum campo foi alterado.', 'info')
-            db.close()
             return redirect(url_for('relatorio_colaborador',
                                     colab_id=registro['colaborador_id']))
 
@@ -1388,13 +1360,16 @@ def editar_registro(reg_id):
         _registrar_historico(db, reg_id, registro['colaborador_id'],
                              session['user_id'], 'edicao',
                              campos_alterados, motivo)
+        atualizar_resumo_semanal(db, registro['colaborador_id'],
+                                 date.fromisoformat(registro['data']))
+        cache_relatorios.marcar_alteracao(db, registro['colaborador_id'],
+                                          date.fromisoformat(registro['data']))
+        eventos.publicar(db, eventos.REGISTRO, registro['colaborador_id'], registro['data'])
         db.commit()
         flash('Registro atualizado com sucesso!', 'success')
-        db.close()
         return redirect(url_for('relatorio_colaborador',
                                 colab_id=registro['colaborador_id']))
 
-    db.close()
     return render_template('editar_registro.html',
                            registro=registro, historico=historico)
 
@@ -1404,9 +1379,7 @@ def editar_registro(reg_id):
 def criar_registro():
     """Gestor pode criar registro de ponto para qualquer colaborador/data."""
     db = get_db()
-    colaboradores = db.execute(
-        'SELECT id, nome FROM colaboradores WHERE ativo = 1 ORDER BY nome'
-    ).fetchall()
+    colaboradores = _colaboradores_ativos(db)
 
     if request.method == 'POST':
         colab_id = request.form.get('colaborador_id', type=int)
@@ -1420,14 +1393,18 @@ def criar_registro():
 
         if not colab_id or not data_reg:
             flash('Colaborador e data são obrigatórios.', 'warning')
-            db.close()
+            return render_template('editar_registro.html',
+                                   registro=None, colaboradores=colaboradores,
+                                   modo='novo')
+
+        if colab_id not in {c['id'] for c in colaboradores}:
+            flash('Colaborador não encontrado.', 'danger')
             return render_template('editar_registro.html',
                                    registro=None, colaboradores=colaboradores,
                                    modo='novo')
 
         if not motivo:
             flash('Informe o motivo da criação do registro.', 'warning')
-            db.close()
             return render_template('editar_registro.html',
                                    registro=None, colaboradores=colaboradores,
                                    modo='novo')
@@ -1439,7 +1416,6 @@ def criar_registro():
         ).fetchone()
         if existente:
             flash('Já existe registro nessa data para este colaborador. Edite o existente.', 'warning')
-            db.close()
             return redirect(url_for('editar_registro', reg_id=existente['id']))
 
         horas = calcular_horas(entrada, saida_almoco, retorno_almoco, saida)
@@ -1448,8 +1424,7 @@ def criar_registro():
         # Determinar tipo do dia
         from datetime import date as dt_date
         d = dt_date.fromisoformat(data_reg)
-        feriado = db.execute('SELECT id FROM feriados WHERE data = ?',
-                             (data_reg,)).fetchone()
+        feriado = is_feriado(d, db) is not None
         tipo_dia = 'feriado' if feriado else ('normal' if d.weekday() < 5 else 'fim_de_semana')
 
         cursor = db.execute(
@@ -1466,12 +1441,13 @@ def criar_registro():
 
         _registrar_historico(db, reg_id, colab_id,
                              session['user_id'], 'criacao', motivo=motivo)
+        atualizar_resumo_semanal(db, colab_id, d)
+        cache_relatorios.marcar_alteracao(db, colab_id, d)
+        eventos.publicar(db, eventos.REGISTRO, colab_id, data_reg)
         db.commit()
         flash('Registro criado com sucesso!', 'success')
-        db.close()
         return redirect(url_for('relatorio_colaborador', colab_id=colab_id))
 
-    db.close()
     return render_template('editar_registro.html',
                            registro=None, colaboradores=colaboradores,
                            modo='novo')
@@ -1483,18 +1459,20 @@ def excluir_registro(reg_id):
     """Gestor pode excluir um registro de ponto."""
     db = get_db()
     registro = db.execute(
-        'SELECT * FROM registros_ponto WHERE id = ?', (reg_id,)
+        '''SELECT r.*, c.loja_id
+           FROM registros_ponto r
+           JOIN colaboradores c ON r.colaborador_id = c.id
+           WHERE r.id = ?''',
+        (reg_id,)
     ).fetchone()
 
-    if not registro:
+    if not registro or not escopo.contem(_escopo_lojas(), registro['loja_id']):
         flash('Registro não encontrado.', 'danger')
-        db.close()
         return redirect(url_for('dashboard'))
 
     motivo = request.form.get('motivo', '').strip()
     if not motivo:
         flash('Informe o motivo da exclusão.', 'warning')
-        db.close()
         return redirect(url_for('editar_registro', reg_id=reg_id))
 
     # Registrar exclusão no histórico antes de deletar
@@ -1508,9 +1486,11 @@ def excluir_registro(reg_id):
 
     colab_id = registro['colaborador_id']
     db.execute('DELETE FROM registros_ponto WHERE id = ?', (reg_id,))
+    atualizar_resumo_semanal(db, colab_id, date.fromisoformat(registro['data']))
+    cache_relatorios.marcar_alteracao(db, colab_id, date.fromisoformat(registro['data']))
+    eventos.publicar(db, eventos.REGISTRO, colab_id, registro['data'])
     db.commit()
     flash('Registro excluído com sucesso!', 'success')
-    db.close()
     return redirect(url_for('relatorio_colaborador', colab_id=colab_id))
 
 
@@ -1520,27 +1500,20 @@ def historico_registro(reg_id):
     """Visualiza o histórico completo de edições de um registro."""
     db = get_db()
     registro = db.execute(
-        '''SELECT r.*, c.nome as colaborador_nome
+        '''SELECT r.*, c.nome as colaborador_nome, c.loja_id
            FROM registros_ponto r
            JOIN colaboradores c ON r.colaborador_id = c.id
            WHERE r.id = ?''',
         (reg_id,)
     ).fetchone()
 
-    if not registro:
+    if not registro or not escopo.contem(_escopo_lojas(), registro['loja_id']):
         flash('Registro não encontrado.', 'danger')
-        db.close()
         return redirect(url_for('dashboard'))
 
     historico = db.execute(
-        '''SELECT h.*, c.nome as editor_nome
-           FROM historico_edicoes h
-           JOIN colaboradores c ON h.editado_por = c.id
-           WHERE h.registro_id = ?
-           ORDER BY h.data_edicao DESC''',
-        (reg_id,)
+        consultas.HISTORICO_REGISTRO, (reg_id,)
     ).fetchall()
-    db.close()
     return render_template('editar_registro.html',
                            registro=registro, historico=historico,
                            modo='historico')
@@ -1557,7 +1530,6 @@ def lista_feriados():
     feriados = db.execute(
         'SELECT * FROM feriados ORDER BY data'
     ).fetchall()
-    db.close()
     return render_template('feriados.html', feriados=feriados)
 
 
@@ -1575,12 +1547,13 @@ def novo_feriado():
             'INSERT INTO feriados (data, descricao) VALUES (?, ?)',
             (data, descricao)
         )
+        calendario.incrementar_versao(db)
+        atualizar_resumo_feriado(db, data)
+        cache_relatorios.marcar_feriado(db, data)
         db.commit()
         flash('Feriado adicionado!', 'success')
     except Exception as e:
         flash(f'Erro: {e}', 'danger')
-    finally:
-        db.close()
     return redirect(url_for('lista_feriados'))
 
 
@@ -1588,9 +1561,13 @@ def novo_feriado():
 @gestor_required
 def excluir_feriado(fer_id):
     db = get_db()
+    feriado = db.execute('SELECT data FROM feriados WHERE id = ?', (fer_id,)).fetchone()
     db.execute('DELETE FROM feriados WHERE id = ?', (fer_id,))
+    calendario.incrementar_versao(db)
+    if feriado:
+        atualizar_resumo_feriado(db, feriado['data'])
+        cache_relatorios.marcar_feriado(db, feriado['data'])
     db.commit()
-    db.close()
     flash('Feriado removido!', 'success')
     return redirect(url_for('lista_feriados'))
 
@@ -1599,117 +1576,143 @@ def excluir_feriado(fer_id):
 # Export Excel
 # ---------------------------------------------------------------------------
 
-@app.route('/exportar/<int:colab_id>')
-@gestor_required
-def exportar_excel(colab_id):
-    from openpyxl import Workbook
-    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-
-    db = get_db()
-    colaborador = db.execute(
-        'SELECT * FROM colaboradores WHERE id = ?', (colab_id,)
-    ).fetchone()
+def _parametros_mes(colab_id, mes):
+    """Parâmetros do relatório mensal de um colaborador (?mes=AAAA-MM).
 
-    mes = request.args.get('mes', hoje().strftime('%Y-%m'))
+    Mês inválido vira o mês atual, mas o rótulo do arquivo é mantido.
+    """
     try:
         ano, m = mes.split('-')
         data_ref = date(int(ano), int(m), 1)
-    except (ValueError, TypeError):
+    except (ValueError, TypeError, AttributeError):
         data_ref = hoje().replace(day=1)
+    return {'colab_id': colab_id, 'data_ref': data_ref.isoformat(), 'rotulo': mes,
+            'gerado_em': agora().isoformat()}
 
-    inicio_mes, fim_mes = get_mes_inicio_fim(data_ref)
 
-    registros = db.execute(
-        '''SELECT * FROM registros_ponto
-           WHERE colaborador_id = ? AND data BETWEEN ? AND ?
-           ORDER BY data''',
-        (colab_id, inicio_mes.isoformat(), fim_mes.isoformat())
-    ).fetchall()
+def _parametros_lote(args):
+    """Período, loja e modo da exportação em lote (?mes= ou ?ano=, &loja=, &modo=)."""
+    ano = args.get('ano', '')
+    mes = args.get('mes', hoje().strftime('%Y-%m'))
+    try:
+        if ano:
+            inicio, fim = date(int(ano), 1, 1), date(int(ano), 12, 31)
+            rotulo = ano
+        else:
+            a, m = mes.split('-')
+            inicio, fim = get_mes_inicio_fim(date(int(a), int(m), 1))
+            rotulo = mes
+    except (ValueError, TypeError):
+        inicio, fim = get_mes_inicio_fim(hoje())
+        rotulo = inicio.strftime('%Y-%m')
 
-    # Horas justificadas
-    horas_just, _ = calcular_horas_justificadas(colab_id, inicio_mes, fim_mes, colaborador, db)
+    loja = args.get('loja', '')
+    loja_id = int(loja) if loja.isdigit() else None
+    lojas = _escopo_lojas()
+    modo = args.get('modo', 'abas')
+    return {
+        'inicio': inicio.isoformat(), 'fim': fim.isoformat(), 'rotulo': rotulo,
+        # Loja fora do escopo é ignorada; `lojas` é o escopo (None = todas)
+        'loja_id': loja_id if loja_id and escopo.contem(lojas, loja_id) else None,
+        'lojas': None if lojas is None else list(lojas),
+        'modo': modo if modo in MODOS_EXPORTACAO else 'abas',
+    }
 
-    db.close()
 
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Ponto"
+def _enviar_relatorio(item):
+    """Envia um relatório do cache com ETag (o navegador revalida e recebe 304)."""
+    resposta = send_file(cache_relatorios.caminho(item['chave']), as_attachment=True,
+                         download_name=item['nome_arquivo'], mimetype=item['mimetype'],
+                         etag=item['chave'], conditional=True)
+    resposta.headers['Cache-Control'] = 'private, no-cache'
+    return resposta
 
-    # Header
-    header_font = Font(bold=True, color="FFFFFF", size=11)
-    header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-    thin_border = Border(
-        left=Side(style='thin'), right=Side(style='thin'),
-        top=Side(style='thin'), bottom=Side(style='thin')
-    )
 
-    ws.merge_cells('A1:G1')
-    ws['A1'] = f"Relatório de Ponto - {colaborador['nome']}"
-    ws['A1'].font = Font(bold=True, size=14)
-
-    ws.merge_cells('A2:G2')
-    ws['A2'] = f"Período: {inicio_mes.strftime('%d/%m/%Y')} a {fim_mes.strftime('%d/%m/%Y')}"
-
-    headers = ['Data', 'Tipo Dia', 'Entrada', 'Saída Almoço', 'Retorno Almoço', 'Saída', 'Horas', 'Status']
-    for col, h in enumerate(headers, 1):
-        cell = ws.cell(row=4, column=col, value=h)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = Alignment(horizontal='center')
-        cell.border = thin_border
-
-    total_horas = 0
-    for i, reg in enumerate(registros, 5):
-        d = date.fromisoformat(reg['data'])
-        ws.cell(row=i, column=1, value=d.strftime('%d/%m/%Y')).border = thin_border
-        td = reg['tipo_dia'] or 'normal'
-        ws.cell(row=i, column=2, value='Dom/Feriado' if td == 'especial' else 'Normal').border = thin_border
-        ws.cell(row=i, column=3, value=reg['entrada'] or '-').border = thin_border
-        ws.cell(row=i, column=4, value=reg['saida_almoco'] or '-').border = thin_border
-        ws.cell(row=i, column=5, value=reg['retorno_almoco'] or '-').border = thin_border
-        ws.cell(row=i, column=6, value=reg['saida'] or '-').border = thin_border
-        ws.cell(row=i, column=7, value=reg['horas_trabalhadas']).border = thin_border
-        ws.cell(row=i, column=8, value=reg['status']).border = thin_border
-        total_horas += reg['horas_trabalhadas']
-
-    row_total = len(registros) + 5
-    ws.cell(row=row_total, column=6, value="TOTAL TRABALHADO:").font = Font(bold=True)
-    ws.cell(row=row_total, column=7, value=round(total_horas, 2)).font = Font(bold=True)
-
-    # Horas justificadas
-    row_just = row_total + 1
-    ws.cell(row=row_just, column=6, value="HORAS JUSTIFICADAS:").font = Font(bold=True, color="0070C0")
-    ws.cell(row=row_just, column=7, value=round(horas_just, 2)).font = Font(bold=True, color="0070C0")
-
-    # Total geral
-    row_geral = row_just + 1
-    ws.cell(row=row_geral, column=6, value="TOTAL GERAL:").font = Font(bold=True)
-    ws.cell(row=row_geral, column=7, value=round(total_horas + horas_just, 2)).font = Font(bold=True)
-
-    # Calcular horas extras (incluindo justificadas)
-    max_h = colaborador['max_horas_semana'] or 40.0
-    semanas_exp = {}
-    for reg in registros:
-        d = date.fromisoformat(reg['data'])
-        sem_inicio, _ = get_semana_inicio_fim(d)
-        chave = sem_inicio.isoformat()
-        semanas_exp[chave] = semanas_exp.get(chave, 0) + reg['horas_trabalhadas']
-    total_extras = sum(calcular_horas_extras_semana(h, max_h) for h in semanas_exp.values())
-
-    row_extras = row_geral + 1
-    ws.cell(row=row_extras, column=6, value="HORAS EXTRAS:").font = Font(bold=True, color="FF0000")
-    ws.cell(row=row_extras, column=7, value=round(total_extras, 2)).font = Font(bold=True, color="FF0000")
-
-    for col in range(1, 9):
-        ws.column_dimensions[chr(64 + col)].width = 16
-
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-
-    nome_arquivo = f"ponto_{colaborador['nome'].replace(' ', '_')}_{mes}.xlsx"
-    return send_file(output, as_attachment=True, download_name=nome_arquivo,
-                     mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+@app.route('/exportar/<int:colab_id>')
+@gestor_required
+def exportar_excel(colab_id):
+    if not _colaborador_do_escopo(get_db(), colab_id):
+        abort(404)
+    parametros = _parametros_mes(colab_id, request.args.get('mes', hoje().strftime('%Y-%m')))
+    return _enviar_relatorio(cache_relatorios.gerar(get_db(), 'excel', parametros))
+
+
+@app.route('/exportar/lote')
+@gestor_required
+def exportar_excel_lote():
+    """Planilha de todos os colaboradores: ?mes=AAAA-MM ou ?ano=AAAA, &loja=, &modo=abas|unica."""
+    parametros = _parametros_lote(request.args)
+    return _enviar_relatorio(cache_relatorios.gerar(get_db(), 'excel_lote', parametros))
+
+
+# ---------------------------------------------------------------------------
+# Jobs de relatórios (geração em segundo plano, ver jobs.py)
+# ---------------------------------------------------------------------------
+
+def _job_do_gestor(db, job_id):
+    """Job pelo id, ou None se for de outro gestor e o logado não vir todas as lojas."""
+    job = jobs.obter_job(db, job_id)
+    if job is None or (job['solicitado_por'] != session['user_id']
+                       and _escopo_lojas() is not None):
+        return None
+    return job
+
+
+def _json_job(job):
+    dados = {
+        'id': job['id'],
+        'tipo': job['tipo'],
+        'status': job['status'],
+        'progresso': job['progresso'],
+        'erro': job['erro'],
+        'status_url': url_for('status_job', job_id=job['id']),
+    }
+    if job['status'] == jobs.CONCLUIDO:
+        dados['download_url'] = url_for('download_job', job_id=job['id'])
+    return dados
+
+
+@app.route('/relatorios/jobs', methods=['POST'])
+@gestor_required
+def criar_job():
+    """Enfileira um relatório: tipo=pdf|excel (colab_id, mes) ou excel_lote (mes/ano, loja, modo)."""
+    db = get_db()
+    tipo = request.form.get('tipo', '')
+    if tipo in ('pdf', 'excel'):
+        colab_id = request.form.get('colab_id', type=int)
+        if not colab_id or not _colaborador_do_escopo(db, colab_id):
+            return jsonify({'erro': 'Colaborador não encontrado.'}), 404
+        parametros = _parametros_mes(colab_id, request.form.get('mes', hoje().strftime('%Y-%m')))
+    elif tipo == 'excel_lote':
+        parametros = _parametros_lote(request.form)
+    else:
+        return jsonify({'erro': 'Tipo de relatório inválido.'}), 400
+
+    job_id = jobs.fila.enfileirar(db, tipo, parametros, session['user_id'])
+    return jsonify(_json_job(jobs.obter_job(db, job_id))), 202
+
+
+@app.route('/relatorios/jobs/<job_id>')
+@gestor_required
+def status_job(job_id):
+    job = _job_do_gestor(get_db(), job_id)
+    if not job:
+        return jsonify({'erro': 'Job não encontrado.'}), 404
+    return jsonify(_json_job(job))
+
+
+@app.route('/relatorios/jobs/<job_id>/download')
+@gestor_required
+def download_job(job_id):
+    job = _job_do_gestor(get_db(), job_id)
+    if not job:
+        return jsonify({'erro': 'Job não encontrado.'}), 404
+    if job['status'] != jobs.CONCLUIDO:
+        return jsonify(_json_job(job)), 409
+    item = cache_relatorios.obter(get_db(), job['chave'])
+    if item is None:
+        return jsonify({'erro': 'Arquivo expirado, gere o relatório novamente.'}), 410
+    return _enviar_relatorio(item)
 
 
 # ---------------------------------------------------------------------------
@@ -1739,7 +1742,6 @@ def alterar_senha():
 
         if not check_password_hash(user['senha'], senha_atual):
             flash('Senha atual incorreta.', 'danger')
-            db.close()
             return render_template('alterar_senha.html')
 
         db.execute(
@@ -1747,7 +1749,6 @@ def alterar_senha():
             (generate_password_hash(nova_senha), session['user_id'])
         )
         db.commit()
-        db.close()
         flash('Senha alterada com sucesso!', 'success')
         return redirect(url_for('meu_ponto'))
 
@@ -1770,125 +1771,10 @@ def hora_atual():
 @app.route('/exportar-pdf/<int:colab_id>')
 @gestor_required
 def exportar_pdf(colab_id):
-    from xhtml2pdf import pisa
-
-    db = get_db()
-    colaborador = db.execute(
-        'SELECT * FROM colaboradores WHERE id = ?', (colab_id,)
-    ).fetchone()
-
-    mes = request.args.get('mes', hoje().strftime('%Y-%m'))
-    try:
-        ano, m = mes.split('-')
-        data_ref = date(int(ano), int(m), 1)
-    except (ValueError, TypeError):
-        data_ref = hoje().replace(day=1)
-
-    inicio_mes, fim_mes = get_mes_inicio_fim(data_ref)
-
-    registros = db.execute(
-        '''SELECT * FROM registros_ponto
-           WHERE colaborador_id = ? AND data BETWEEN ? AND ?
-           ORDER BY data''',
-        (colab_id, inicio_mes.isoformat(), fim_mes.isoformat())
-    ).fetchall()
-
-    horas_just, dias_just = calcular_horas_justificadas(
-        colab_id, inicio_mes, fim_mes, colaborador, db)
-
-    total_horas_trab = sum(r['horas_trabalhadas'] for r in registros)
-    total_geral = total_horas_trab + horas_just
-
-    # Loja do colaborador
-    loja = None
-    if colaborador['loja_id']:
-        loja = db.execute('SELECT nome FROM lojas WHERE id = ?',
-                          (colaborador['loja_id'],)).fetchone()
-
-    db.close()
-
-    meses_pt = ['', 'Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho',
-                'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
-    nome_mes = f"{meses_pt[data_ref.month]}/{data_ref.year}"
-
-    # Build HTML
-    rows_html = ''
-    for r in registros:
-        d = date.fromisoformat(r['data'])
-        dias_sem = ['Seg', 'Ter', 'Qua', 'Qui', 'Sex', 'Sáb', 'Dom']
-        td_label = 'Fer/Dom' if (r['tipo_dia'] or 'normal') == 'especial' else 'Normal'
-        rows_html += f'''<tr>
-            <td>{d.strftime("%d/%m/%Y")} ({dias_sem[d.weekday()]})</td>
-            <td style="text-align:center">{td_label}</td>
-            <td style="text-align:center">{r['entrada'] or '-'}</td>
-            <td style="text-align:center">{r['saida_almoco'] or '-'}</td>
-            <td style="text-align:center">{r['retorno_almoco'] or '-'}</td>
-            <td style="text-align:center">{r['saida'] or '-'}</td>
-            <td style="text-align:center"><b>{r['horas_trabalhadas']:.2f}h</b></td>
-        </tr>'''
-
-    loja_info = f"<b>Loja:</b> {loja['nome']}" if loja else ""
-
-    html = f'''<!DOCTYPE html>
-<html><head><meta charset="utf-8">
-<style>
-    @page {{ size: A4; margin: 1.5cm; }}
-    body {{ font-family: Helvetica, Arial, sans-serif; font-size: 10px; color: #333; }}
-    h1 {{ color: #4472C4; font-size: 18px; margin-bottom: 2px; }}
-    h2 {{ color: #666; font-size: 13px; font-weight: normal; margin-top: 0; }}
-    .info {{ margin-bottom: 10px; font-size: 10px; }}
-    table {{ width: 100%; border-collapse: collapse; margin-top: 10px; }}
-    th {{ background-color: #4472C4; color: white; padding: 6px 4px; font-size: 9px;
-          text-align: center; }}
-    td {{ padding: 5px 4px; border-bottom: 1px solid #ddd; font-size: 9px; }}
-    tr:nth-child(even) {{ background-color: #f8f9fa; }}
-    .totals {{ margin-top: 15px; }}
-    .totals td {{ border: none; padding: 3px 4px; font-size: 10px; }}
-    .signature {{ margin-top: 50px; }}
-    .signature td {{ border: none; text-align: center; padding-top: 40px;
-                     border-top: 1px solid #333; font-size: 10px; }}
-    .footer {{ text-align: center; font-size: 8px; color: #999; margin-top: 30px; }}
-</style></head><body>
-    <h1>Piticas - Folha de Ponto</h1>
-    <h2>{nome_mes}</h2>
-    <div class="info">
-        <b>Colaborador:</b> {colaborador['nome']} &nbsp;|&nbsp;
-        <b>Cargo:</b> {colaborador['cargo'] or '-'} &nbsp;|&nbsp;
-        <b>E-mail:</b> {colaborador['email']}
-        {(' &nbsp;|&nbsp; ' + loja_info) if loja_info else ''}
-    </div>
-    <table>
-        <thead><tr>
-            <th style="text-align:left">Data</th><th>Tipo</th><th>Entrada</th>
-            <th>Saída Almoço</th><th>Retorno</th><th>Saída</th><th>Horas</th>
-        </tr></thead>
-        <tbody>{rows_html}</tbody>
-    </table>
-    <table class="totals">
-        <tr><td style="text-align:right;width:70%"><b>Total Trabalhado:</b></td>
-            <td><b>{total_horas_trab:.2f}h</b></td></tr>
-        <tr><td style="text-align:right"><b>Horas Justificadas:</b></td>
-            <td><b style="color:#0070C0">{horas_just:.2f}h</b> ({dias_just} dia(s))</td></tr>
-        <tr><td style="text-align:right"><b>Total Geral:</b></td>
-            <td><b style="color:#28a745">{total_geral:.2f}h</b></td></tr>
-    </table>
-    <table class="signature"><tr>
-        <td style="width:45%">{colaborador['nome']}<br><small>Colaborador</small></td>
-        <td style="width:10%"></td>
-        <td style="width:45%">Gestor Responsável<br><small>Assinatura</small></td>
-    </tr></table>
-    <div class="footer">
-        Documento gerado em {agora().strftime("%d/%m/%Y %H:%M")} - Piticas Controle de Ponto
-    </div>
-</body></html>'''
-
-    result = io.BytesIO()
-    pisa.CreatePDF(io.StringIO(html), dest=result)
-    result.seek(0)
-
-    nome_arquivo = f"ponto_{colaborador['nome'].replace(' ', '_')}_{mes}.pdf"
-    return send_file(result, as_attachment=True, download_name=nome_arquivo,
-                     mimetype='application/pdf')
+    if not _colaborador_do_escopo(get_db(), colab_id):
+        abort(404)
+    parametros = _parametros_mes(colab_id, request.args.get('mes', hoje().strftime('%Y-%m')))
+    return _enviar_relatorio(cache_relatorios.gerar(get_db(), 'pdf', parametros))
 
 
 # ---------------------------------------------------------------------------
@@ -1897,6 +1783,7 @@ def exportar_pdf(colab_id):
 
 @app.route('/lojas')
 @gestor_required
+@todas_lojas_required
 def lista_lojas():
     db = get_db()
     lojas = db.execute(
@@ -1906,12 +1793,12 @@ def lista_lojas():
            GROUP BY l.id
            ORDER BY l.nome'''
     ).fetchall()
-    db.close()
     return render_template('lojas.html', lojas=lojas)
 
 
 @app.route('/lojas/nova', methods=['POST'])
 @gestor_required
+@todas_lojas_required
 def nova_loja():
     nome = request.form.get('nome', '').strip()
     endereco = request.form.get('endereco', '').strip()
@@ -1925,13 +1812,12 @@ def nova_loja():
         flash(f'Loja "{nome}" cadastrada!', 'success')
     except Exception as e:
         flash(f'Erro: {e}', 'danger')
-    finally:
-        db.close()
     return redirect(url_for('lista_lojas'))
 
 
 @app.route('/lojas/<int:loja_id>/editar', methods=['POST'])
 @gestor_required
+@todas_lojas_required
 def editar_loja(loja_id):
     nome = request.form.get('nome', '').strip()
     endereco = request.form.get('endereco', '').strip()
@@ -1939,21 +1825,27 @@ def editar_loja(loja_id):
     db = get_db()
     db.execute('UPDATE lojas SET nome=?, endereco=?, ativo=? WHERE id=?',
                (nome, endereco, ativo, loja_id))
+    cache_relatorios.marcar_alteracao(db)
     db.commit()
-    db.close()
     flash('Loja atualizada!', 'success')
     return redirect(url_for('lista_lojas'))
 
 
 @app.route('/lojas/<int:loja_id>/excluir', methods=['POST'])
 @gestor_required
+@todas_lojas_required
 def excluir_loja(loja_id):
     db = get_db()
+    # Sem a loja, um gestor que só tinha ela passaria a ver todas
+    if db.execute('SELECT 1 FROM gestor_lojas WHERE loja_id = ? LIMIT 1', (loja_id,)).fetchone():
+        flash('Há gestores atribuídos a esta loja. Altere as lojas deles antes de removê-la.',
+              'danger')
+        return redirect(url_for('lista_lojas'))
     # Desassociar colaboradores
     db.execute('UPDATE colaboradores SET loja_id = NULL WHERE loja_id = ?', (loja_id,))
     db.execute('DELETE FROM lojas WHERE id = ?', (loja_id,))
+    cache_relatorios.marcar_alteracao(db)
     db.commit()
-    db.close()
     flash('Loja removida!', 'success')
     return redirect(url_for('lista_lojas'))
 
@@ -1962,147 +1854,98 @@ def excluir_loja(loja_id):
 # Banco de Horas
 # ---------------------------------------------------------------------------
 
-def _calcular_horas_esperadas_mes(colab, inicio_mes, fim_mes, db):
-    """Calcula horas esperadas no mês considerando dias e folgas."""
-    horas_esperadas = 0.0
-    d = inicio_mes
-    dias_uteis = 0
-    limite = min(fim_mes, hoje())
-    while d <= limite:
-        horas_esperadas += carga_esperada_dia(d, colab, db)
-        dias_uteis += 1
-        d += timedelta(days=1)
-    folgas = colab['folgas_semana'] or 2
-    semanas_periodo = max(1, dias_uteis / 7)
-    folgas_total = round(folgas * semanas_periodo)
-    media_carga = horas_esperadas / dias_uteis if dias_uteis > 0 else 8.0
-    horas_esperadas -= folgas_total * media_carga
-    return max(0, round(horas_esperadas, 2))
+def _calcular_horas_esperadas_mes(colab, inicio_mes, fim_mes, db, escalas=None):
+    """Calcula horas esperadas no mês (até hoje) pela escala, dias e folgas."""
+    return calcular_horas_esperadas(colab, inicio_mes, min(fim_mes, hoje()), db, escalas)
 
 
 @app.route('/banco-horas')
 @gestor_required
 def banco_horas():
     db = get_db()
+    lojas = _lojas_ativas(db)
+    loja_filter = request.args.get('loja', '')
+    # O filtro da tela só restringe o escopo do gestor, nunca o amplia
+    lojas_escopo = escopo.restringir(_escopo_lojas(), request.args.get('loja', type=int))
+    filtro_loja, params = escopo.filtro_sql(lojas_escopo)
+    inicio_mes, fim_mes = get_mes_inicio_fim(hoje())
+
+    # Saldo dos meses fechados vem de colaboradores.saldo_banco e o mês
+    # corrente do diário (banco_horas_diario), numa única consulta
     colaboradores = db.execute(
-        'SELECT * FROM colaboradores WHERE ativo = 1 ORDER BY nome'
+        consultas.BANCO_HORAS_MES.format(filtro_loja=filtro_loja),
+        [inicio_mes.isoformat(), fim_mes.isoformat()] + params
     ).fetchall()
 
-    lojas = db.execute('SELECT * FROM lojas WHERE ativo = 1 ORDER BY nome').fetchall()
-    loja_filter = request.args.get('loja', '')
-
-    # Calcular saldo acumulado para cada colaborador
+    # Escalas do mês dessas lojas numa consulta, para as horas esperadas
+    escalas = carregar_escalas(db, inicio_mes, fim_mes, lojas=lojas_escopo)
     resumo = []
     for c in colaboradores:
-        if loja_filter and str(c['loja_id'] or '') != loja_filter:
-            continue
-
-        # Buscar saldos fechados anteriores
-        saldo_anterior = db.execute(
-            '''SELECT COALESCE(SUM(saldo), 0) as total FROM banco_horas
-               WHERE colaborador_id = ? AND fechado = 1''',
-            (c['id'],)
-        ).fetchone()['total']
-
-        # Calcular mês atual
-        inicio_mes, fim_mes = get_mes_inicio_fim(hoje())
-        regs_mes = db.execute(
-            '''SELECT horas_trabalhadas FROM registros_ponto
-               WHERE colaborador_id = ? AND data BETWEEN ? AND ?''',
-            (c['id'], inicio_mes.isoformat(), fim_mes.isoformat())
-        ).fetchall()
-        horas_trab_mes = sum(r['horas_trabalhadas'] for r in regs_mes)
-        horas_just_mes, _ = calcular_horas_justificadas(
-            c['id'], inicio_mes, fim_mes, c, db)
-        horas_esperadas_mes = _calcular_horas_esperadas_mes(c, inicio_mes, fim_mes, db)
-        saldo_mes = round(horas_trab_mes + horas_just_mes - horas_esperadas_mes, 2)
-        saldo_total = round(saldo_anterior + saldo_mes, 2)
-
-        # Loja
-        loja_nome = ''
-        if c['loja_id']:
-            loja = db.execute('SELECT nome FROM lojas WHERE id = ?', (c['loja_id'],)).fetchone()
-            loja_nome = loja['nome'] if loja else ''
+        horas_esperadas_mes = _calcular_horas_esperadas_mes(
+            c, inicio_mes, fim_mes, db, escalas.get(c['id'], {}))
+        horas_just_mes = round(c['horas_just'], 2)
+        saldo_anterior = c['saldo_banco'] or 0
+        saldo_mes = round(c['horas_trab'] + horas_just_mes - horas_esperadas_mes, 2)
 
         resumo.append({
             'id': c['id'],
             'nome': c['nome'],
             'cargo': c['cargo'],
-            'loja': loja_nome,
-            'horas_trab_mes': round(horas_trab_mes, 2),
-            'horas_just_mes': round(horas_just_mes, 2),
+            'loja': c['loja_nome'] or '',
+            'horas_trab_mes': round(c['horas_trab'], 2),
+            'horas_just_mes': horas_just_mes,
             'horas_esperadas_mes': horas_esperadas_mes,
             'saldo_mes': saldo_mes,
             'saldo_anterior': round(saldo_anterior, 2),
-            'saldo_total': saldo_total,
+            'saldo_total': round(saldo_anterior + saldo_mes, 2),
         })
 
-    db.close()
-
     mes_atual = hoje().strftime('%Y-%m')
     return render_template('banco_horas.html', resumo=resumo, lojas=lojas,
                            loja_filter=loja_filter, mes_atual=mes_atual)
 
 
+def _validar_mes(valor):
+    """'AAAA-MM' normalizado ou None se inválido."""
+    try:
+        ano, m = valor.split('-')
+        return date(int(ano), int(m), 1).strftime('%Y-%m')
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
 @app.route('/banco-horas/fechar-mes', methods=['POST'])
 @gestor_required
 def fechar_mes_banco():
-    """Fecha o mês e persiste o saldo no banco de horas."""
+    """Fecha o mês (ou um intervalo de meses) e persiste o saldo no banco de horas."""
     mes = request.form.get('mes', '')
     if not mes:
         flash('Mês não informado.', 'danger')
         return redirect(url_for('banco_horas'))
 
-    try:
-        ano, m = mes.split('-')
-        data_ref = date(int(ano), int(m), 1)
-    except (ValueError, TypeError):
+    mes_inicio = _validar_mes(mes)
+    mes_fim = _validar_mes(request.form.get('mes_fim') or mes)
+    if not mes_inicio or not mes_fim:
         flash('Mês inválido.', 'danger')
         return redirect(url_for('banco_horas'))
+    if mes_fim < mes_inicio:
+        flash('O mês final deve ser igual ou posterior ao inicial.', 'danger')
+        return redirect(url_for('banco_horas'))
 
-    inicio_mes, fim_mes = get_mes_inicio_fim(data_ref)
-
-    db = get_db()
-    colaboradores = db.execute(
-        'SELECT * FROM colaboradores WHERE ativo = 1'
-    ).fetchall()
-
-    count = 0
-    for c in colaboradores:
-        # Verificar se já fechou
-        existente = db.execute(
-            'SELECT id FROM banco_horas WHERE colaborador_id = ? AND mes = ?',
-            (c['id'], mes)
-        ).fetchone()
-        if existente:
-            continue
-
-        regs = db.execute(
-            '''SELECT horas_trabalhadas FROM registros_ponto
-               WHERE colaborador_id = ? AND data BETWEEN ? AND ?''',
-            (c['id'], inicio_mes.isoformat(), fim_mes.isoformat())
-        ).fetchall()
-        horas_trab = sum(r['horas_trabalhadas'] for r in regs)
-        horas_just, _ = calcular_horas_justificadas(c['id'], inicio_mes, fim_mes, c, db)
-        horas_esperadas = _calcular_horas_esperadas_mes(c, inicio_mes, fim_mes, db)
-        saldo = round(horas_trab + horas_just - horas_esperadas, 2)
-
-        db.execute(
-            '''INSERT INTO banco_horas
-               (colaborador_id, mes, horas_trabalhadas, horas_justificadas,
-                horas_esperadas, saldo, fechado)
-               VALUES (?, ?, ?, ?, ?, ?, 1)''',
-            (c['id'], mes, round(horas_trab, 2), round(horas_just, 2),
-             horas_esperadas, saldo)
-        )
-        count += 1
-
-    db.commit()
-    db.close()
+    meses = fechamento.meses_do_intervalo(mes_inicio, mes_fim)
+    fechados, tempos = fechamento.fechar_meses(get_db(), meses, hoje())
+    app.logger.info('Fechamento %s a %s: %s (%s)', mes_inicio, mes_fim, fechados,
+                    ', '.join(f'{fase}={seg * 1000:.1f}ms' for fase, seg in tempos.items()))
 
     meses_pt = ['', 'Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho',
                 'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
-    flash(f'Mês {meses_pt[data_ref.month]}/{data_ref.year} fechado para {count} colaborador(es)!', 'success')
+    if len(meses) == 1:
+        ano, m = (int(p) for p in mes_inicio.split('-'))
+        flash(f'Mês {meses_pt[m]}/{ano} fechado para {fechados[mes_inicio]} colaborador(es)!',
+              'success')
+    else:
+        flash(f'{len(meses)} meses fechados ({mes_inicio} a {mes_fim}): '
+              f'{sum(fechados.values())} fechamento(s)!', 'success')
     return redirect(url_for('banco_horas'))
 
 
@@ -2153,20 +1996,16 @@ def escalas():
             'weekday': d.weekday(),  # 0=seg, 6=dom
         })
 
-    # Colaboradores ativos (não gestores)
+    # Filtro por loja, dentro do escopo do gestor
+    loja_id = request.args.get('loja', type=int) or ''
+    lojas = _lojas_ativas(db)
+    filtro_loja, params = escopo.filtro_sql(escopo.restringir(_escopo_lojas(), loja_id))
+
+    # Colaboradores ativos dessas lojas
     colaboradores = db.execute(
-        'SELECT * FROM colaboradores WHERE ativo = 1 ORDER BY nome'
+        consultas.COLABORADORES_ATIVOS.format(filtro_loja=filtro_loja), params
     ).fetchall()
 
-    # Filtro por loja
-    loja_id = request.args.get('loja', '', type=str)
-    lojas = db.execute('SELECT * FROM lojas WHERE ativo = 1 ORDER BY nome').fetchall()
-    if loja_id and loja_id.isdigit():
-        loja_id = int(loja_id)
-        colaboradores = [c for c in colaboradores if c['loja_id'] == loja_id]
-    else:
-        loja_id = ''
-
     # Carregar escalas existentes para esta semana (Dom-Sáb)
     escalas_map = {}  # {colaborador_id: {data_iso: escala_row}}
     if colaboradores:
@@ -2187,8 +2026,8 @@ def escalas():
     sem_ant_inicio = inicio_sem - timedelta(days=7)
     sem_ant_fim = sem_ant_inicio + timedelta(days=6)
     tem_semana_anterior = db.execute(
-        'SELECT COUNT(*) as cnt FROM escalas WHERE data BETWEEN ? AND ?',
-        (sem_ant_inicio.isoformat(), sem_ant_fim.isoformat())
+        consultas.ESCALAS_SEMANA.format(filtro_loja=filtro_loja),
+        [sem_ant_inicio.isoformat(), sem_ant_fim.isoformat()] + params
     ).fetchone()['cnt'] > 0
 
     # Determinar primeiro dia útil da semana (não feriado, não domingo)
@@ -2198,8 +2037,6 @@ def escalas():
             primeiro_dia_util = dia['data_iso']
             break
 
-    db.close()
-
     return render_template('escalas.html',
                            colaboradores=colaboradores,
                            dias_semana=dias_semana,
@@ -2222,8 +2059,12 @@ def salvar_escalas():
     dados = request.form
 
     inicio_sem = dados.get('inicio_sem', '')
+    loja_id = dados.get('loja', type=int) or ''
+    # Só os colaboradores que estavam na tela: os de outras lojas não vêm
+    # no formulário e teriam as escalas apagadas
+    filtro_loja, params = escopo.filtro_sql(escopo.restringir(_escopo_lojas(), loja_id))
     colaboradores = db.execute(
-        'SELECT id FROM colaboradores WHERE ativo = 1'
+        f'SELECT c.id FROM colaboradores c WHERE c.ativo = 1{filtro_loja}', params
     ).fetchall()
 
     count = 0
@@ -2259,10 +2100,9 @@ def salvar_escalas():
                 )
 
     db.commit()
-    db.close()
 
     flash(f'Escala salva com sucesso! ({count} registros)', 'success')
-    return redirect(url_for('escalas', semana=inicio_sem))
+    return redirect(url_for('escalas', semana=inicio_sem, loja=loja_id))
 
 
 @app.route('/escalas/copiar-semana', methods=['POST'])
@@ -2270,29 +2110,31 @@ def salvar_escalas():
 def copiar_semana_escalas():
     db = get_db()
     inicio_destino = request.form.get('inicio_sem', '')
+    loja_id = request.form.get('loja', type=int) or ''
 
     try:
         dt_destino = date.fromisoformat(inicio_destino)
     except (ValueError, TypeError):
         flash('Data inválida.', 'danger')
-        db.close()
-        return redirect(url_for('escalas'))
+        return redirect(url_for('escalas', loja=loja_id))
 
     # Semana = Dom a Sáb (dt_destino já é domingo)
     dom_destino = dt_destino
     dom_origem = dom_destino - timedelta(days=7)
     sab_origem = dom_origem + timedelta(days=6)
 
-    # Carregar escalas da semana anterior (Dom a Sáb)
+    # Carregar escalas da semana anterior (Dom a Sáb) das lojas da tela
+    filtro_loja, params = escopo.filtro_sql(escopo.restringir(_escopo_lojas(), loja_id))
     escalas_origem = db.execute(
-        'SELECT * FROM escalas WHERE data BETWEEN ? AND ?',
-        (dom_origem.isoformat(), sab_origem.isoformat())
+        f'''SELECT e.* FROM escalas e
+            JOIN colaboradores c ON c.id = e.colaborador_id
+            WHERE e.data BETWEEN ? AND ?{filtro_loja}''',
+        [dom_origem.isoformat(), sab_origem.isoformat()] + params
     ).fetchall()
 
     if not escalas_origem:
         flash('Semana anterior não possui escalas para copiar.', 'warning')
-        db.close()
-        return redirect(url_for('escalas', semana=inicio_destino))
+        return redirect(url_for('escalas', semana=inicio_destino, loja=loja_id))
 
     count = 0
     for e in escalas_origem:
@@ -2313,10 +2155,9 @@ def copiar_semana_escalas():
         count += 1
 
     db.commit()
-    db.close()
 
     flash(f'Escala copiada da semana anterior! ({count} registros)', 'success')
-    return redirect(url_for('escalas', semana=inicio_destino))
+    return redirect(url_for('escalas', semana=inicio_destino, loja=loja_id))
 
 
 @app.route('/api/escalas/semana')
@@ -2332,13 +2173,14 @@ def api_escalas_semana():
 
     inicio_sem, fim_sem = get_semana_inicio_fim(data_ref)
 
+    filtro_loja, lojas = escopo.filtro_sql(_escopo_lojas())
     escalas_rows = db.execute(
-        '''SELECT e.*, c.nome as colaborador_nome
+        f'''SELECT e.*, c.nome as colaborador_nome
            FROM escalas e
            JOIN colaboradores c ON e.colaborador_id = c.id
-           WHERE e.data BETWEEN ? AND ? AND c.ativo = 1
+           WHERE e.data BETWEEN ? AND ? AND c.ativo = 1{filtro_loja}
            ORDER BY c.nome, e.data''',
-        (inicio_sem.isoformat(), fim_sem.isoformat())
+        [inicio_sem.isoformat(), fim_sem.isoformat()] + lojas
     ).fetchall()
 
     resultado = {}
@@ -2352,10 +2194,110 @@ def api_escalas_semana():
             'folga': bool(e['folga']),
         }
 
-    db.close()
     return jsonify(resultado)
 
 
+# ---------------------------------------------------------------------------
+# Métricas (Prometheus)
+# ---------------------------------------------------------------------------
+
+@app.route('/metrics')
+def metricas_prometheus():
+    if not metricas.acesso_permitido(METRICAS_TOKEN):
+        abort(403)
+    return Response(metricas.texto_prometheus(metricas.histogramas(app)),
+                    mimetype='text/plain; version=0.0.4')
+
+
+# ---------------------------------------------------------------------------
+# Comandos de manutenção (flask --app app <comando>)
+# ---------------------------------------------------------------------------
+
+@app.cli.command('verificar-indices')
+def verificar_indices_cmd():
+    """Falha se alguma consulta crítica voltar a varrer uma tabela inteira."""
+    problemas = verificar_planos(get_db())
+    for nome, detalhe in problemas:
+        click.echo(f'{nome}: {detalhe}', err=True)
+    if problemas:
+        raise SystemExit(1)
+    click.echo(f'{len(CONSULTAS_CRITICAS)} consultas críticas usando índices.')
+
+
+@app.cli.command('reconstruir-resumos')
+@click.option('--colaborador', 'colab_id', type=int, default=None,
+              help='Reconstrói apenas um colaborador.')
+def reconstruir_resumos_cmd(colab_id):
+    """Reconstrói resumo_semanal e o banco de horas a partir dos registros (backfill)."""
+    db = get_db()
+    total = reconstruir_resumo_semanal(db, colab_id)
+    db.commit()
+    click.echo(f'Resumo semanal reconstruído para {total} colaborador(es).')
+
+
+@app.cli.command('fechar-mes')
+@click.argument('mes')
+@click.option('--ate', 'mes_fim', default=None, help='Último mês do intervalo (AAAA-MM).')
+def fechar_mes_cmd(mes, mes_fim):
+    """Fecha o banco de horas de MES (AAAA-MM), ou de MES até --ate."""
+    mes_inicio, mes_fim = _validar_mes(mes), _validar_mes(mes_fim or mes)
+    if not mes_inicio or not mes_fim or mes_fim < mes_inicio:
+        raise click.BadParameter('use AAAA-MM, com --ate igual ou posterior a MES.')
+    meses = fechamento.meses_do_intervalo(mes_inicio, mes_fim)
+    fechados, tempos = fechamento.fechar_meses(get_db(), meses, hoje())
+    for m, total in fechados.items():
+        click.echo(f'{m}: {total} colaborador(es) fechado(s)')
+    click.echo('Tempo por fase: ' + ', '.join(
+        f'{fase} {seg * 1000:.1f}ms' for fase, seg in tempos.items()))
+
+
+@app.cli.command('recalcular-horas')
+@click.argument('inicio')
+@click.argument('fim', required=False)
+def recalcular_horas_cmd(inicio, fim):
+    """Recalcula horas_trabalhadas dos registros fechados entre INICIO e FIM.
+
+    Aceita datas (AAAA-MM-DD) ou meses (AAAA-MM); sem FIM, usa só INICIO.
+    """
+    try:
+        d_inicio, _ = _periodo_cli(inicio)
+        _, d_fim = _periodo_cli(fim or inicio)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    db = get_db()
+    lidos, alterados = recalcular_horas(db, d_inicio, d_fim)
+    if alterados:
+        cache_relatorios.marcar_alteracao(db, None, d_inicio, d_fim)
+    db.commit()
+    click.echo(f'{lidos} registro(s) lido(s), {alterados} corrigido(s).')
+
+
+@app.cli.command('processar-jobs', with_appcontext=False)
+@click.option('--uma-vez', is_flag=True, help='Processa os jobs pendentes e sai.')
+def processar_jobs_cmd(uma_vez):
+    """Worker da fila de relatórios em processo separado (use com JOBS_WORKERS=0)."""
+    if not uma_vez:
+        jobs.fila.executar()
+        return
+    db = get_db()
+    try:
+        total = 0
+        while jobs.fila.processar_proximo(db):
+            total += 1
+        removidos = jobs.fila.limpar(db)
+    finally:
+        db.close()
+    click.echo(f'{total} job(s) processado(s), {removidos} expirado(s) removido(s).')
+
+
+def _periodo_cli(valor):
+    """Converte 'AAAA-MM' no mês inteiro ou 'AAAA-MM-DD' em um único dia."""
+    if len(valor) == 7:
+        return get_mes_inicio_fim(date.fromisoformat(valor + '-01'))
+    d = date.fromisoformat(valor)
+    return d, d
+
+
 # ---------------------------------------------------------------------------
 # Run
 # ---------------------------------------------------------------------------
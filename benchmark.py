@@ -0,0 +1,212 @@
+"""Benchmark das telas principais sobre uma base sintética.
+
+Gera um banco temporário com gerar_dados.py e mede, pelo test client do
+Flask, as rotas mais pesadas: meu_ponto, dashboard (e os dados dos seus
+gráficos), relatorio_colaborador, banco_horas, escalas e as exportações
+(Excel, PDF e lote, sempre de um colaborador/mês diferente para não cair
+no cache). Por fim roda a tempestade de batidas concorrentes do
+benchmark_batidas.py.
+
+Para cada cenário: vazão, latência p50/p95/p99 e consultas SQL por
+requisição (lidas do cabeçalho Server-Timing). O resultado pode ser
+salvo em JSON e comparado com uma execução anterior:
+
+    python benchmark.py --colaboradores 200 --anos 1 --salvar base.json
+    python benchmark.py --colaboradores 200 --anos 1 --comparar base.json
+
+Com --comparar, sai com código 1 se algum p95 piorou mais que
+--tolerancia (%) ou se alguma rota passou a fazer mais consultas.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+# O banco temporário precisa estar definido antes de importar o app
+DIRETORIO = tempfile.mkdtemp(prefix='bench_')
+os.environ['DATA_DIR'] = DIRETORIO
+
+with contextlib.redirect_stdout(io.StringIO()):
+    from app import app, hoje  # noqa: E402
+from models import get_db  # noqa: E402
+import benchmark_batidas  # noqa: E402
+import gerar_dados  # noqa: E402
+
+_CONSULTAS = re.compile(r'db;dur=([\d.]+);desc="(\d+) consultas"')
+
+
+def _percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100))]
+
+
+def _cliente(email, senha):
+    cliente = app.test_client()
+    resposta = cliente.post('/login', data={'email': email, 'senha': senha})
+    if resposta.status_code != 302:
+        raise RuntimeError(f'login de {email} falhou')
+    return cliente
+
+
+def _cenarios(colaboradores, repeticoes, repeticoes_exportacao):
+    """(nome, cliente, [urls]) de cada cenário."""
+    ref = hoje()
+    meses = [(ref.replace(day=1) - timedelta(days=1 + 31 * i)).strftime('%Y-%m')
+             for i in range(repeticoes_exportacao)]
+    ids = [c['id'] for c in colaboradores]
+
+    def rodizio(n, inicio=0):
+        return [ids[(inicio + i) % len(ids)] for i in range(n)]
+
+    gestor = _cliente('admin@empresa.com', 'admin123')
+    colaborador = _cliente(colaboradores[-1]['email'], gerar_dados.SENHA)
+    return [
+        ('meu_ponto', colaborador, ['/meu-ponto'] * repeticoes),
+        ('dashboard', gestor, ['/dashboard'] * repeticoes),
+        *((f'grafico_{grafico}', gestor, [f'/api/dashboard/{grafico}'] * repeticoes)
+          for grafico in ('evolucao', 'mensal', 'ranking')),
+        ('relatorio_colaborador', gestor,
+         [f'/relatorio-colaborador/{cid}?mes={meses[0]}' for cid in rodizio(repeticoes)]),
+        ('banco_horas', gestor, ['/banco-horas'] * repeticoes),
+        ('escalas', gestor, ['/escalas'] * repeticoes),
+        ('exportar_excel', gestor,
+         [f'/exportar/{cid}?mes={meses[0]}' for cid in rodizio(repeticoes_exportacao)]),
+        ('exportar_pdf', gestor,
+         [f'/exportar-pdf/{cid}?mes={meses[0]}'
+          for cid in rodizio(repeticoes_exportacao, repeticoes_exportacao)]),
+        ('exportar_lote', gestor, [f'/exportar/lote?mes={mes}' for mes in meses]),
+    ]
+
+
+def medir(nome, cliente, urls):
+    """Executa as URLs em sequência; a primeira requisição de páginas é aquecimento."""
+    if not nome.startswith('exportar'):
+        cliente.get(urls[0])
+    latencias, consultas, tempo_db, erros = [], [], [], 0
+    inicio = time.perf_counter()
+    for url in urls:
+        t = time.perf_counter()
+        resposta = cliente.get(url)
+        latencias.append(time.perf_counter() - t)
+        if resposta.status_code != 200:
+            erros += 1
+        medicao = _CONSULTAS.search(resposta.headers.get('Server-Timing', ''))
+        if medicao:
+            tempo_db.append(float(medicao.group(1)))
+            consultas.append(int(medicao.group(2)))
+    total = time.perf_counter() - inicio
+    return {
+        'requisicoes': len(urls), 'erros': erros, 'vazao': len(urls) / total,
+        **{f'p{p}_ms': _percentil(latencias, p) * 1000 for p in (50, 95, 99)},
+        'consultas': sum(consultas) / len(consultas) if consultas else 0,
+        'db_ms': sum(tempo_db) / len(tempo_db) if tempo_db else 0,
+    }
+
+
+def comparar(atual, anterior, tolerancia):
+    """Imprime a variação de p95 e consultas; retorna a lista de regressões."""
+    regressoes = []
+    print(f'\n{"cenário":24} {"p95 antes":>10} {"p95 agora":>10} {"var.":>7} '
+          f'{"consultas":>15}')
+    for nome, agora in atual['cenarios'].items():
+        antes = anterior.get('cenarios', {}).get(nome)
+        if not antes:
+            print(f'{nome:24} (novo)')
+            continue
+        variacao = (agora['p95_ms'] / antes['p95_ms'] - 1) * 100 if antes['p95_ms'] else 0
+        marca = ''
+        if variacao > tolerancia:
+            regressoes.append(f'{nome}: p95 {variacao:+.0f}%')
+            marca = ' <-'
+        if agora['consultas'] > antes['consultas'] + 0.5:
+            regressoes.append(f'{nome}: {antes["consultas"]:.0f} -> {agora["consultas"]:.0f} consultas')
+            marca = ' <-'
+        print(f'{nome:24} {antes["p95_ms"]:10.1f} {agora["p95_ms"]:10.1f} {variacao:+6.0f}% '
+              f'{antes["consultas"]:7.0f} -> {agora["consultas"]:<4.0f}{marca}')
+    return regressoes
+
+
+def executar(args):
+    with app.app_context():
+        db = get_db()
+        totais, tempos = gerar_dados.gerar(db, args.lojas, args.colaboradores, args.anos,
+                                           hoje=hoje(), semente=args.semente)
+        db.commit()
+        colaboradores = db.execute(
+            "SELECT id, email FROM colaboradores WHERE email LIKE '%@exemplo.local' ORDER BY id"
+        ).fetchall()
+    print('base: ' + ', '.join(f'{k}={v}' for k, v in totais.items())
+          + f' ({sum(tempos.values()):.1f}s)')
+
+    resultado = {
+        'parametros': {k: getattr(args, k) for k in
+                       ('lojas', 'colaboradores', 'anos', 'semente', 'repeticoes')},
+        'data': date.today().isoformat(),
+        'cenarios': {},
+    }
+    print(f'\n{"cenário":24} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} '
+          f'{"consultas":>9} {"db ms":>7}')
+    for nome, cliente, urls in _cenarios(colaboradores, args.repeticoes,
+                                         args.repeticoes_exportacao):
+        r = resultado['cenarios'][nome] = medir(nome, cliente, urls)
+        erros = f'  {r["erros"]} erro(s)' if r['erros'] else ''
+        print(f'{nome:24} {r["vazao"]:8.1f} {r["p50_ms"]:8.1f} {r["p95_ms"]:8.1f} '
+              f'{r["p99_ms"]:8.1f} {r["consultas"]:9.1f} {r["db_ms"]:7.1f}{erros}')
+
+    if args.batidas:
+        print('\nTempestade de batidas:')
+        resultado['batidas'] = benchmark_batidas.executar(args.batidas, args.threads, 0.2)
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lojas', type=int, default=3)
+    parser.add_argument('--colaboradores', type=int, default=60)
+    parser.add_argument('--anos', type=float, default=1.0)
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--repeticoes', type=int, default=20,
+                        help='Requisições por cenário de página.')
+    parser.add_argument('--repeticoes-exportacao', type=int, default=3,
+                        help='Requisições por cenário de exportação (geração sem cache).')
+    parser.add_argument('--batidas', type=int, default=100,
+                        help='Colaboradores na tempestade de batidas (0 desliga).')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--salvar', metavar='ARQUIVO', help='Grava o resultado em JSON.')
+    parser.add_argument('--comparar', metavar='ARQUIVO',
+                        help='Compara com um resultado salvo antes.')
+    parser.add_argument('--tolerancia', type=float, default=20.0,
+                        help='Piora aceitável do p95, em %% (com --comparar).')
+    args = parser.parse_args()
+
+    try:
+        resultado = executar(args)
+    finally:
+        shutil.rmtree(DIRETORIO, ignore_errors=True)
+
+    if args.salvar:
+        with open(args.salvar, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+        print(f'\nResultado salvo em {args.salvar}.')
+
+    falhou = any(r['erros'] for r in resultado['cenarios'].values())
+    if resultado.get('batidas') and not resultado['batidas']['ok']:
+        falhou = True
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as arquivo:
+            regressoes = comparar(resultado, json.load(arquivo), args.tolerancia)
+        for regressao in regressoes:
+            print(f'REGRESSÃO {regressao}')
+        falhou = falhou or bool(regressoes)
+    sys.exit(1 if falhou else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""Benchmark de contenção do registro de ponto (ponto.registrar_batida).
+
+Simula a abertura da loja: N colaboradores batendo ponto ao mesmo tempo a
+partir de T threads, cada batida com sua própria conexão do pool, como uma
+requisição. Cada batida é enviada duas vezes com a mesma chave (duplo
+toque) e, para parte dos colaboradores, também por um segundo aparelho
+sem chave no mesmo minuto. Roda num banco temporário; o banco real não é
+tocado.
+
+    python benchmark_batidas.py --colaboradores 150 --threads 16
+
+Ao final confere que nenhuma batida se perdeu e que os reenvios não
+gravaram nada. O benchmark.py importa este módulo e roda executar() sobre
+o banco sintético dele.
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+# Como script, o banco temporário precisa estar definido antes de importar
+# o app; importado (benchmark.py), usa o banco de quem importou
+if __name__ == '__main__':
+    DIRETORIO = tempfile.mkdtemp(prefix='bench_batidas_')
+    os.environ['DATA_DIR'] = DIRETORIO
+
+with contextlib.redirect_stdout(io.StringIO()):
+    from app import app  # noqa: E402
+from models import get_db  # noqa: E402
+import ponto  # noqa: E402
+
+DIA = date(2026, 3, 2)   # segunda-feira sem feriado
+FASES = (('entrada', 8 * 60), ('saida_almoco', 12 * 60),
+         ('retorno_almoco', 13 * 60 + 25), ('saida', 17 * 60 + 30))
+
+
+def _hhmm(minutos):
+    return f'{minutos // 60:02d}:{minutos % 60:02d}'
+
+
+def _criar_colaboradores(n):
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            '''INSERT INTO colaboradores (nome, email, horario_entrada)
+               VALUES (?, ?, '08:00')''',
+            [(f'Bench {i}', f'bench{i}@bench.local') for i in range(n)]
+        )
+        db.commit()
+        return [r['id'] for r in db.execute(
+            "SELECT id FROM colaboradores WHERE email LIKE '%@bench.local' ORDER BY id")]
+
+
+def _percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100))]
+
+
+def executar(colaboradores, threads, segundo_aparelho):
+    ids = _criar_colaboradores(colaboradores)
+    rng = random.Random(42)
+    latencias = []
+    contagem = {}
+    lock = threading.Lock()
+
+    def bater(colab_id, hora, chave):
+        inicio = time.perf_counter()
+        with app.app_context():
+            resultado = ponto.registrar_batida(get_db(), colab_id, DIA, hora, chave)
+        decorrido = time.perf_counter() - inicio
+        with lock:
+            latencias.append(decorrido)
+            contagem[resultado['status']] = contagem.get(resultado['status'], 0) + 1
+
+    envios = 0
+    inicio_total = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for fase, base in FASES:
+            tarefas = []
+            for colab_id in ids:
+                hora = _hhmm(base + rng.randint(0, 20))
+                chave = f'{colab_id}-{fase}'
+                tarefas += [(colab_id, hora, chave), (colab_id, hora, chave)]
+                if rng.random() < segundo_aparelho:
+                    tarefas.append((colab_id, hora, None))
+            rng.shuffle(tarefas)
+            envios += len(tarefas)
+            # Uma fase termina antes da próxima começar (almoço mínimo etc.)
+            list(executor.map(lambda t: bater(*t), tarefas))
+    total = time.perf_counter() - inicio_total
+
+    with app.app_context():
+        db = get_db()
+        completos = db.execute(
+            '''SELECT COUNT(*) FROM registros_ponto r
+               JOIN colaboradores c ON c.id = r.colaborador_id
+               WHERE r.data = ? AND r.status = 'completo' AND c.email LIKE '%@bench.local'
+                 AND r.entrada <> '' AND r.saida_almoco <> ''
+                 AND r.retorno_almoco <> '' AND r.saida <> '' ''',
+            (DIA.isoformat(),)
+        ).fetchone()[0]
+
+    print(f'colaboradores={colaboradores} threads={threads} envios={envios}')
+    print(f'tempo total: {total:.2f}s  vazão: {envios / total:.0f} batidas/s')
+    print('latência (ms): p50={:.1f} p95={:.1f} p99={:.1f} máx={:.1f}'.format(
+        *(_percentil(latencias, p) * 1000 for p in (50, 95, 99, 100))))
+    print('resultados:', ', '.join(f'{k}={v}' for k, v in sorted(contagem.items())))
+
+    esperadas = colaboradores * len(FASES)
+    ok = (completos == colaboradores
+          and contagem.get(ponto.REGISTRADA, 0) == esperadas
+          and sum(contagem.values()) == envios)
+    print(f'registros completos: {completos}/{colaboradores}  '
+          f'batidas gravadas: {contagem.get(ponto.REGISTRADA, 0)}/{esperadas}  '
+          f'{"OK" if ok else "FALHOU"}')
+    return {
+        'ok': ok, 'envios': envios, 'segundos': total, 'vazao': envios / total,
+        **{f'p{p}_ms': _percentil(latencias, p) * 1000 for p in (50, 95, 99)},
+        'max_ms': _percentil(latencias, 100) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--colaboradores', type=int, default=150)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--segundo-aparelho', type=float, default=0.2,
+                        help='Fração dos colaboradores que batem também por outro aparelho.')
+    args = parser.parse_args()
+    try:
+        ok = executar(args.colaboradores, args.threads, args.segundo_aparelho)['ok']
+    finally:
+        shutil.rmtree(DIRETORIO, ignore_errors=True)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""Cache por colaborador dos totais do dashboard.
+
+Os números de cada colaborador num período (horas e dias trabalhados da
+semana; no mês também as justificadas e as extras) ficam na tabela
+`cache_painel`, no mesmo banco, então valem para todos os workers. Cada
+linha guarda a assinatura das versões dos dados de que depende, as mesmas
+de versoes_relatorio (ver cache_relatorios.py): as rotas de escrita já as
+incrementam com marcar_alteracao(), e o dashboard recalcula só os
+colaboradores cuja assinatura mudou.
+
+Um mês depende também dos meses vizinhos com que divide semana, porque
+as horas extras são semanais e contam as justificadas da semana inteira.
+As versões são lidas antes do cálculo: uma escrita no meio do caminho
+deixa a linha com assinatura velha, e ela é recalculada na próxima vez.
+"""
+import json
+from datetime import date, timedelta
+
+from cache_relatorios import TODOS
+from calendario import get_mes_inicio_fim, get_semana_inicio_fim
+import consultas
+from fechamento import meses_do_intervalo
+from horas import MotorHoras
+
+# Incrementar quando o conteúdo das linhas mudar (invalida o cache inteiro)
+FORMATO = 1
+
+
+def _limites(periodo):
+    """[inicio, fim] de um mês 'AAAA-MM' ou da semana que começa em 'AAAA-MM-DD'."""
+    if len(periodo) == 7:
+        return get_mes_inicio_fim(date.fromisoformat(periodo + '-01'))
+    inicio = date.fromisoformat(periodo)
+    return inicio, inicio + timedelta(days=6)
+
+
+def dependencias(periodo):
+    """Meses cujas alterações atingem o período (incluindo as semanas de borda)."""
+    inicio, fim = _limites(periodo)
+    return meses_do_intervalo(get_semana_inicio_fim(inicio)[0].strftime('%Y-%m'),
+                              get_semana_inicio_fim(fim)[1].strftime('%Y-%m'))
+
+
+def _assinaturas(db, ids, periodos):
+    """{(colab_id, periodo): assinatura das versões dos dados}."""
+    meses_de = {p: dependencias(p) + [''] for p in periodos}
+    meses = sorted({m for ms in meses_de.values() for m in ms})
+    alvos = [TODOS] + list(ids)
+    versoes = {(r['colaborador_id'], r['mes']): r['versao'] for r in db.execute(
+        consultas.VERSOES_PAINEL.format(alvos=consultas.marcas(len(alvos)),
+                                        meses=consultas.marcas(len(meses))),
+        alvos + meses
+    )}
+    return {
+        (cid, p): json.dumps(
+            [FORMATO] + [(versoes.get((cid, m), 0), versoes.get((TODOS, m), 0))
+                         for m in meses_de[p]],
+            separators=(',', ':'))
+        for cid in ids for p in periodos
+    }
+
+
+def _calcular(db, colaboradores, periodos):
+    """[(colab_id, periodo, totais)] calculados pelo MotorHoras."""
+    limites = {p: _limites(p) for p in periodos}
+    motor = MotorHoras(
+        db,
+        min(get_semana_inicio_fim(inicio)[0] for inicio, _ in limites.values()),
+        max(get_semana_inicio_fim(fim)[1] for _, fim in limites.values()),
+        [c['id'] for c in colaboradores])
+    linhas = []
+    for c in colaboradores:
+        for p, (inicio, fim) in limites.items():
+            totais = {'horas': motor.horas_trabalhadas(c['id'], inicio, fim),
+                      'dias': motor.dias_trabalhados(c['id'], inicio, fim)}
+            if len(p) == 7:
+                totais['justificadas'] = motor.horas_justificadas(c, inicio, fim)[0]
+                totais['extras'] = motor.horas_extras(c, inicio, fim)
+                totais['extras_sem_justificadas'] = motor.horas_extras(
+                    c, inicio, fim, com_justificadas=False)
+            linhas.append((c['id'], p, totais))
+    return linhas
+
+
+def totais(db, colaboradores, periodos):
+    """{(colab_id, periodo): totais} dos colaboradores nos períodos.
+
+    Períodos são meses 'AAAA-MM' ou semanas 'AAAA-MM-DD' (domingo). Quem
+    tiver algum período desatualizado é recalculado e regravado; linhas
+    de períodos fora da lista são descartadas nessa hora.
+    """
+    ids = [c['id'] for c in colaboradores]
+    if not ids or not periodos:
+        return {}
+    assinaturas = _assinaturas(db, ids, periodos)
+    resultado = {}
+    for r in db.execute(
+        consultas.CACHE_PAINEL.format(marcas=consultas.marcas(len(periodos))),
+        list(periodos)
+    ):
+        k = (r['colaborador_id'], r['periodo'])
+        if assinaturas.get(k) == r['versao']:
+            resultado[k] = json.loads(r['dados'])
+
+    desatualizados = [c for c in colaboradores
+                      if any((c['id'], p) not in resultado for p in periodos)]
+    if desatualizados:
+        novos = _calcular(db, desatualizados, periodos)
+        db.execute(
+            f'''DELETE FROM cache_painel
+                WHERE periodo NOT IN ({','.join('?' * len(periodos))})''',
+            list(periodos)
+        )
+        db.executemany(
+            '''INSERT OR REPLACE INTO cache_painel (periodo, colaborador_id, versao, dados)
+               VALUES (?, ?, ?, ?)''',
+            [(p, cid, assinaturas[(cid, p)], json.dumps(t)) for cid, p, t in novos]
+        )
+        db.commit()
+        resultado.update(((cid, p), t) for cid, p, t in novos)
+    return resultado
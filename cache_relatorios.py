@@ -0,0 +1,181 @@
+"""Cache de relatórios gerados (PDF/Excel), endereçado pela versão dos dados.
+
+A chave de um relatório é o SHA-256 de (tipo, parâmetros, versões dos
+dados que ele lê). As versões ficam na tabela `versoes_relatorio`, um
+contador por (colaborador, mês) incrementado pelas rotas de escrita com
+marcar_alteracao(); mês '' é o cadastro do colaborador. Enquanto nada
+muda, a chave se repete e o arquivo já gerado é servido (com ETag); um
+mês sem alterações, como um mês fechado, não é gerado de novo.
+
+Os arquivos ficam em DATA_DIR/cache_relatorios/ e os metadados na tabela
+`cache_relatorios`; acima de RELATORIOS_CACHE_MB os menos acessados
+recentemente são removidos (LRU).
+"""
+import hashlib
+import json
+import os
+import tempfile
+from datetime import date, datetime
+
+from exportacao import gerar_relatorio
+from models import DATA_DIR
+
+DIRETORIO = os.path.join(DATA_DIR, 'cache_relatorios')
+LIMITE_BYTES = int(os.environ.get('RELATORIOS_CACHE_MB', 200)) * 1024 * 1024
+# Incrementar quando o layout dos relatórios mudar (invalida o cache inteiro)
+FORMATO = 1
+
+# colaborador_id especiais em versoes_relatorio
+LOTE = 0     # exportação em lote: muda junto com qualquer colaborador
+TODOS = -1   # alteração que atinge todos (feriado, loja, recálculo em massa)
+
+
+def _agora():
+    return datetime.now().isoformat(timespec='microseconds')
+
+
+def _meses(inicio, fim):
+    """'AAAA-MM' de cada mês em [inicio, fim]."""
+    ano, mes = inicio.year, inicio.month
+    while (ano, mes) <= (fim.year, fim.month):
+        yield f'{ano:04d}-{mes:02d}'
+        ano, mes = (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+
+
+# ---------------------------------------------------------------------------
+# Versões dos dados
+# ---------------------------------------------------------------------------
+
+def marcar_alteracao(db, colab_id=None, inicio=None, fim=None):
+    """Invalida os relatórios afetados por uma escrita (chamar antes do commit).
+
+    colab_id=None atinge todos os colaboradores; sem `inicio`, a alteração
+    é de cadastro e vale para todos os meses.
+    """
+    meses = list(_meses(inicio, fim or inicio)) if inicio else ['']
+    alvos = (TODOS if colab_id is None else colab_id, LOTE)
+    db.executemany(
+        '''INSERT INTO versoes_relatorio (colaborador_id, mes, versao) VALUES (?, ?, 1)
+           ON CONFLICT(colaborador_id, mes) DO UPDATE SET versao = versao + 1''',
+        [(alvo, mes) for alvo in alvos for mes in meses]
+    )
+
+
+def marcar_feriado(db, data_iso):
+    """Invalida o mês de um feriado incluído/removido para todos os colaboradores."""
+    try:
+        d = date.fromisoformat(data_iso)
+    except (ValueError, TypeError):
+        return
+    marcar_alteracao(db, None, d)
+
+
+def _versoes(db, ids, meses):
+    marcas_ids = ','.join('?' * len(ids))
+    marcas_meses = ','.join('?' * len(meses))
+    linhas = db.execute(
+        f'''SELECT colaborador_id, mes, versao FROM versoes_relatorio
+            WHERE colaborador_id IN ({marcas_ids}) AND mes IN ({marcas_meses})
+            ORDER BY colaborador_id, mes''',
+        list(ids) + list(meses)
+    ).fetchall()
+    return [tuple(linha) for linha in linhas]
+
+
+def chave(db, tipo, p):
+    """Chave do relatório para os dados atuais (parâmetros no formato de gerar_relatorio)."""
+    if tipo == 'excel_lote':
+        meses = list(_meses(date.fromisoformat(p['inicio']), date.fromisoformat(p['fim'])))
+        ids = (LOTE,)
+        base = [p['inicio'], p['fim'], p['rotulo'], p.get('loja_id'), p.get('modo'),
+                p.get('lojas')]
+    else:
+        # gerado_em fica de fora: o rodapé do PDF mostra quando esta versão dos
+        # dados foi gerada, e o mesmo arquivo serve até os dados mudarem
+        meses = [p['data_ref'][:7]]
+        ids = (p['colab_id'], TODOS)
+        base = [p['colab_id'], p['data_ref'], p['rotulo']]
+    versoes = _versoes(db, ids, meses + [''])
+    material = json.dumps([FORMATO, tipo, base, versoes], separators=(',', ':'))
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+# ---------------------------------------------------------------------------
+# Arquivos
+# ---------------------------------------------------------------------------
+
+def caminho(k):
+    return os.path.join(DIRETORIO, k[:2], k)
+
+
+def obter(db, k):
+    """Linha do cache para a chave (marcando o acesso) ou None."""
+    item = db.execute('SELECT * FROM cache_relatorios WHERE chave = ?', (k,)).fetchone()
+    if item is None:
+        return None
+    if not os.path.exists(caminho(k)):
+        # Arquivo removido por fora (disco limpo, outro processo)
+        db.execute('DELETE FROM cache_relatorios WHERE chave = ?', (k,))
+        db.commit()
+        return None
+    db.execute('UPDATE cache_relatorios SET acessado_em = ? WHERE chave = ?', (_agora(), k))
+    db.commit()
+    return item
+
+
+def gerar(db, tipo, p, progresso=None):
+    """Retorna a linha do cache do relatório, gerando o arquivo se for preciso."""
+    k = chave(db, tipo, p)
+    item = obter(db, k)
+    if item is not None:
+        return item
+
+    destino = caminho(k)
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    fd, parcial = tempfile.mkstemp(dir=DIRETORIO, suffix='.parcial')
+    try:
+        with os.fdopen(fd, 'wb') as arquivo:
+            nome, mimetype = gerar_relatorio(db, tipo, p, arquivo, progresso)
+        os.replace(parcial, destino)
+    except BaseException:
+        if os.path.exists(parcial):
+            os.remove(parcial)
+        raise
+
+    db.execute(
+        '''INSERT OR REPLACE INTO cache_relatorios
+           (chave, nome_arquivo, mimetype, tamanho, criado_em, acessado_em)
+           VALUES (?, ?, ?, ?, ?, ?)''',
+        (k, nome, mimetype, os.path.getsize(destino), _agora(), _agora())
+    )
+    db.commit()
+    remover_excedente(db, manter=k)
+    return db.execute('SELECT * FROM cache_relatorios WHERE chave = ?', (k,)).fetchone()
+
+
+def remover_excedente(db, limite=None, manter=None):
+    """Remove os itens menos acessados até o cache caber no limite.
+
+    `manter` protege a chave recém-gerada. Retorna quantos itens saíram.
+    """
+    limite = LIMITE_BYTES if limite is None else limite
+    total = db.execute('SELECT COALESCE(SUM(tamanho), 0) FROM cache_relatorios').fetchone()[0]
+    if total <= limite:
+        return 0
+    removidos = []
+    for item in db.execute(
+            'SELECT chave, tamanho FROM cache_relatorios ORDER BY acessado_em').fetchall():
+        if total <= limite:
+            break
+        if item['chave'] == manter:
+            continue
+        removidos.append(item['chave'])
+        total -= item['tamanho']
+    db.executemany('DELETE FROM cache_relatorios WHERE chave = ?', [(k,) for k in removidos])
+    db.commit()
+    for k in removidos:
+        try:
+            os.remove(caminho(k))
+        except FileNotFoundError:
+            pass
+    return len(removidos)
@@ -0,0 +1,176 @@
+"""Calendário de feriados em memória, compartilhado pelo processo.
+
+A tabela `feriados` é carregada uma única vez, indexada por ano, e as
+consultas passam a ser lookups O(1) em dicionário. A invalidação usa um
+carimbo de versão gravado em `configuracoes` (chave `feriados_versao`):
+as rotas que alteram feriados incrementam a versão e cada worker do
+gunicorn recarrega o calendário na próxima requisição.
+
+Para as contas de horas esperadas, cada ano usado ganha somas de prefixo
+de domingos e feriados por dia; contar dias normais e especiais de
+qualquer período vira uma subtração, sem percorrer os dias. As somas são
+refeitas junto com o calendário quando os feriados mudam.
+"""
+import threading
+from datetime import date, timedelta
+
+from flask import g, has_app_context
+
+from models import get_db
+
+CHAVE_VERSAO = 'feriados_versao'
+
+
+def incrementar_versao(db):
+    """Incrementa o carimbo de versão dos feriados (chamar antes do commit)."""
+    db.execute(
+        '''UPDATE configuracoes SET valor = CAST(valor AS INTEGER) + 1
+           WHERE chave = ?''',
+        (CHAVE_VERSAO,)
+    )
+    if has_app_context():
+        g.pop('feriados_sincronizado', None)
+
+
+class CalendarioFeriados:
+    """Cache de feriados por ano: {ano: {data_iso: descricao}}."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versao = None
+        self._por_ano = {}
+        # Feriados que tornam o dia especial e não caem em domingo (ordenados)
+        self._especiais = []
+        # {ano: (domingos, feriados)}: contagem acumulada até cada dia do ano
+        self._prefixos = {}
+
+    def sincronizar(self, db):
+        """Recarrega o calendário se a versão no banco mudou.
+
+        Dentro de uma requisição a versão é conferida uma única vez.
+        """
+        if has_app_context():
+            if g.get('feriados_sincronizado'):
+                return
+            g.feriados_sincronizado = True
+
+        row = db.execute(
+            'SELECT valor FROM configuracoes WHERE chave = ?', (CHAVE_VERSAO,)
+        ).fetchone()
+        versao = row['valor'] if row else '0'
+        if versao == self._versao:
+            return
+
+        with self._lock:
+            if versao == self._versao:
+                return
+            por_ano = {}
+            especiais = []
+            for r in db.execute('SELECT data, descricao FROM feriados'):
+                try:
+                    ano = int(r['data'][:4])
+                except (ValueError, TypeError):
+                    continue
+                por_ano.setdefault(ano, {})[r['data']] = r['descricao']
+                try:
+                    d = date.fromisoformat(r['data'])
+                except ValueError:
+                    continue
+                if r['descricao'] and d.weekday() != 6:
+                    especiais.append(d)
+            self._por_ano = por_ano
+            self._especiais = sorted(especiais)
+            self._prefixos = {}
+            self._versao = versao
+
+    def descricao(self, d, db):
+        """Retorna a descrição do feriado na data ou None."""
+        self.sincronizar(db)
+        return self._por_ano.get(d.year, {}).get(d.isoformat())
+
+    def _prefixos_ano(self, ano):
+        """Somas de prefixo do ano; o índice i cobre os i primeiros dias."""
+        prefixos = self._prefixos.get(ano)
+        if prefixos is None:
+            primeiro = date(ano, 1, 1)
+            dias = (date(ano + 1, 1, 1) - primeiro).days
+            especiais = {d.toordinal() for d in self._especiais if d.year == ano}
+            domingos, feriados_ano = [0] * (dias + 1), [0] * (dias + 1)
+            # toordinal() % 7 == 0 cai sempre num domingo
+            for i in range(dias):
+                ordinal = primeiro.toordinal() + i
+                domingos[i + 1] = domingos[i] + (ordinal % 7 == 0)
+                feriados_ano[i + 1] = feriados_ano[i] + (ordinal in especiais)
+            prefixos = self._prefixos[ano] = (domingos, feriados_ano)
+        return prefixos
+
+    def contar_dias(self, inicio, fim, db):
+        """(domingos, feriados fora de domingo) em [inicio, fim] pelas somas de prefixo."""
+        self.sincronizar(db)
+        domingos = feriados_periodo = 0
+        for ano in range(inicio.year, fim.year + 1):
+            pref_domingos, pref_feriados = self._prefixos_ano(ano)
+            a = (max(inicio, date(ano, 1, 1)) - date(ano, 1, 1)).days
+            b = (min(fim, date(ano, 12, 31)) - date(ano, 1, 1)).days + 1
+            domingos += pref_domingos[b] - pref_domingos[a]
+            feriados_periodo += pref_feriados[b] - pref_feriados[a]
+        return domingos, feriados_periodo
+
+
+feriados = CalendarioFeriados()
+
+
+# ---------------------------------------------------------------------------
+# Helpers de calendário
+# ---------------------------------------------------------------------------
+
+def is_feriado(d, db=None):
+    """Verifica se uma data é feriado (consulta o calendário em memória)."""
+    if db is None:
+        db = get_db()
+    return feriados.descricao(d, db)
+
+
+def tipo_dia(d, db=None):
+    """Retorna 'especial' para domingos/feriados, 'normal' para os demais."""
+    if d.weekday() == 6:  # domingo
+        return 'especial'
+    if is_feriado(d, db):
+        return 'especial'
+    return 'normal'
+
+
+def carga_esperada_dia(d, colaborador, db=None):
+    """Retorna carga horária esperada para o dia: 8h normal, 6h dom/feriado."""
+    if tipo_dia(d, db) == 'especial':
+        return colaborador['horas_dia_especial'] or 6.0
+    return colaborador['horas_dia_normal'] or 8.0
+
+
+def contar_tipos_dia(inicio, fim, db):
+    """Retorna (dias normais, dias especiais) em [inicio, fim] sem iterar por dia."""
+    total = (fim - inicio).days + 1
+    if total <= 0:
+        return 0, 0
+    domingos, feriados_periodo = feriados.contar_dias(inicio, fim, db)
+    especiais = domingos + feriados_periodo
+    return total - especiais, especiais
+
+
+def get_semana_inicio_fim(d):
+    """Retorna domingo e sábado da semana de uma data (convenção brasileira)."""
+    # weekday(): 0=seg..6=dom. Offset para chegar ao domingo anterior (ou o próprio dia se já for domingo)
+    offset = (d.weekday() + 1) % 7
+    inicio = d - timedelta(days=offset)
+    fim = inicio + timedelta(days=6)
+    return inicio, fim
+
+
+def get_mes_inicio_fim(d):
+    """Retorna primeiro e último dia do mês."""
+    inicio = d.replace(day=1)
+    if d.month == 12:
+        fim = d.replace(year=d.year + 1, month=1, day=1) - timedelta(days=1)
+    else:
+        fim = d.replace(month=d.month + 1, day=1) - timedelta(days=1)
+    return inicio, fim
@@ -0,0 +1,163 @@
+"""Consultas SQL críticas, usadas pelo código e pela verificação de índices.
+
+Cada constante é o texto executado pelas rotas e módulos; os trechos
+variáveis são preenchidos com str.format: {filtro_loja} é o escopo de
+lojas (escopo.filtro_sql), {filtro} um filtro de colaboradores
+(' AND colaborador_id IN (...)') e {marcas}, {alvos} e {meses} são
+listas de '?'.
+models.CONSULTAS_CRITICAS roda EXPLAIN QUERY PLAN sobre estas mesmas
+constantes (flask verificar-indices e tests/test_indices.py), de modo que
+uma consulta alterada aqui é conferida como está em produção.
+"""
+
+
+def marcas(n):
+    """'?,?,...' com n marcadores."""
+    return ','.join('?' * n)
+
+
+# ---------------------------------------------------------------------------
+# Registros de ponto
+# ---------------------------------------------------------------------------
+
+REGISTROS_HOJE = '''SELECT r.*, c.nome as colaborador_nome
+           FROM registros_ponto r
+           JOIN colaboradores c ON r.colaborador_id = c.id
+           WHERE r.data = ? AND c.ativo = 1{filtro_loja}
+           ORDER BY c.nome'''
+
+REGISTROS_COLABORADOR_PERIODO = '''SELECT * FROM registros_ponto
+           WHERE colaborador_id = ? AND data BETWEEN ? AND ?
+           ORDER BY data'''
+
+REGISTROS_PERIODO = '''SELECT colaborador_id, data, horas_trabalhadas FROM registros_ponto
+                WHERE data BETWEEN ? AND ?{filtro}
+                ORDER BY colaborador_id, data'''
+
+HISTORICO_REGISTRO = '''SELECT h.*, c.nome as editor_nome
+           FROM historico_edicoes h
+           JOIN colaboradores c ON h.editado_por = c.id
+           WHERE h.registro_id = ?
+           ORDER BY h.data_edicao DESC'''
+
+# ---------------------------------------------------------------------------
+# Justificativas
+# ---------------------------------------------------------------------------
+
+JUSTIFICATIVAS_COLABORADOR_PERIODO = '''SELECT data_inicio, data_fim FROM justificativas
+           WHERE colaborador_id = ? AND status = 'aprovado'
+           AND (data_inicio <= ? AND data_fim >= ?)'''
+
+JUSTIFICATIVAS_APROVADAS_PERIODO = '''SELECT colaborador_id, data_inicio, data_fim FROM justificativas
+                WHERE status = 'aprovado' AND data_inicio <= ? AND data_fim >= ?{filtro}'''
+
+JUSTIFICATIVAS_PENDENTES = '''SELECT j.*, c.nome as colaborador_nome
+           FROM justificativas j
+           JOIN colaboradores c ON j.colaborador_id = c.id
+           WHERE j.status = 'pendente'{filtro_loja}
+           ORDER BY j.data_registro DESC'''
+
+JUSTIFICADOS_DIA = '''SELECT DISTINCT colaborador_id FROM justificativas
+           WHERE status = 'aprovado' AND data_inicio <= ? AND data_fim >= ?'''
+
+# ---------------------------------------------------------------------------
+# Colaboradores e escalas
+# ---------------------------------------------------------------------------
+
+COLABORADORES_ATIVOS = '''SELECT * FROM colaboradores c
+           WHERE c.ativo = 1{filtro_loja}
+           ORDER BY c.nome'''
+
+ESCALAS_HOJE = '''SELECT e.*, c.nome as colaborador_nome
+           FROM escalas e
+           JOIN colaboradores c ON e.colaborador_id = c.id
+           WHERE e.data = ? AND c.ativo = 1{filtro_loja}
+           ORDER BY c.nome'''
+
+ESCALAS_SEMANA = '''SELECT COUNT(*) as cnt FROM escalas e
+            JOIN colaboradores c ON c.id = e.colaborador_id
+            WHERE e.data BETWEEN ? AND ?{filtro_loja}'''
+
+ESCALAS_PERIODO = '''SELECT colaborador_id, data, horario_entrada, horario_saida, folga
+             FROM escalas WHERE data BETWEEN ? AND ?'''
+
+# ---------------------------------------------------------------------------
+# Banco de horas
+# ---------------------------------------------------------------------------
+
+BANCO_HORAS_MES = '''SELECT c.*, l.nome AS loja_nome,
+                  COALESCE(SUM(d.horas_trabalhadas), 0) AS horas_trab,
+                  COALESCE(SUM(d.horas_justificadas), 0) AS horas_just
+           FROM colaboradores c
+           LEFT JOIN lojas l ON l.id = c.loja_id
+           LEFT JOIN banco_horas_diario d
+                  ON d.colaborador_id = c.id AND d.data BETWEEN ? AND ?
+           WHERE c.ativo = 1{filtro_loja}
+           GROUP BY c.id
+           ORDER BY c.nome'''
+
+FECHAMENTO_DIARIO_MES = '''SELECT colaborador_id,
+                      SUM(horas_trabalhadas) AS horas_trab,
+                      SUM(horas_justificadas) AS horas_just
+               FROM banco_horas_diario
+               WHERE data BETWEEN ? AND ?
+               GROUP BY colaborador_id'''
+
+# ---------------------------------------------------------------------------
+# Gráficos do dashboard (por loja; ver graficos.py)
+# ---------------------------------------------------------------------------
+
+EVOLUCAO_DIARIA = '''SELECT r.data, SUM(r.horas_trabalhadas) AS total_horas, COUNT(r.id) AS total_registros
+           FROM colaboradores c
+           JOIN registros_ponto r ON r.colaborador_id = c.id
+           WHERE c.loja_id IS ? AND r.data BETWEEN ? AND ?
+           GROUP BY r.data'''
+
+TOTAIS_MENSAIS = '''SELECT SUM(r.horas_trabalhadas)
+           FROM colaboradores c
+           JOIN registros_ponto r ON r.colaborador_id = c.id
+           WHERE c.loja_id IS ? AND r.data BETWEEN ? AND ?'''
+
+RANKING_MES = '''SELECT c.nome, SUM(r.horas_trabalhadas) AS total_horas
+           FROM colaboradores c
+           JOIN registros_ponto r ON r.colaborador_id = c.id
+           WHERE c.loja_id IS ? AND c.ativo = 1 AND r.data BETWEEN ? AND ?
+           GROUP BY c.id
+           ORDER BY total_horas DESC
+           LIMIT 10'''
+
+# ---------------------------------------------------------------------------
+# Caches e versões
+# ---------------------------------------------------------------------------
+
+VERSOES_PAINEL = '''SELECT colaborador_id, mes, versao FROM versoes_relatorio
+            WHERE colaborador_id IN ({alvos})
+              AND mes IN ({meses})'''
+
+CACHE_PAINEL = '''SELECT colaborador_id, periodo, versao, dados FROM cache_painel
+            WHERE periodo IN ({marcas})'''
+
+# CROSS JOIN fixa colaboradores como laço externo: sem escopo, o SQLite
+# preferiria varrer versoes_relatorio inteira pelo filtro de mês
+VERSOES_GRAFICOS = '''SELECT COALESCE(c.loja_id, ?) AS loja, v.colaborador_id, v.mes, v.versao
+            FROM colaboradores c
+            CROSS JOIN versoes_relatorio v ON v.colaborador_id = c.id
+            WHERE v.mes IN ({marcas}){filtro_loja}
+            ORDER BY v.colaborador_id'''
+
+CACHE_GRAFICOS = '''SELECT chave, versao, dados, criado_em FROM cache_graficos
+            WHERE chave IN ({marcas})'''
+
+# ---------------------------------------------------------------------------
+# Eventos e jobs
+# ---------------------------------------------------------------------------
+
+EVENTOS_NOVOS = '''SELECT id, tipo, colaborador_id, data, referencia FROM eventos
+               WHERE id > ? ORDER BY id'''
+
+RESERVAR_JOB = '''UPDATE jobs SET status = ?, iniciado_em = ?, heartbeat = ?,
+                   tentativas = tentativas + 1, progresso = 0
+               WHERE id = (SELECT id FROM jobs WHERE status = ?
+                           ORDER BY criado_em LIMIT 1)
+               AND status = ?
+               RETURNING *'''
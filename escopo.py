@@ -0,0 +1,47 @@
+"""Lojas que cada gestor enxerga.
+
+A atribuição fica na tabela `gestor_lojas`. Um gestor sem nenhuma linha
+vê todas as lojas, inclusive os colaboradores sem loja; com linhas, vê só
+os colaboradores dessas lojas. As telas de gestor recebem o escopo como
+uma tupla de loja_id (None = todas) e o levam até o SQL com filtro_sql(),
+em vez de carregar todos os colaboradores e filtrar no Python.
+"""
+
+
+def lojas_do_gestor(db, gestor_id):
+    """Tupla dos loja_id atribuídos ao gestor, ou None se ele vê todas."""
+    lojas = tuple(r['loja_id'] for r in db.execute(
+        'SELECT loja_id FROM gestor_lojas WHERE gestor_id = ? ORDER BY loja_id',
+        (gestor_id,)
+    ))
+    return lojas or None
+
+
+def definir_lojas(db, gestor_id, loja_ids):
+    """Substitui as lojas do gestor; lista vazia = todas (chamar antes do commit)."""
+    db.execute('DELETE FROM gestor_lojas WHERE gestor_id = ?', (gestor_id,))
+    db.executemany(
+        'INSERT INTO gestor_lojas (gestor_id, loja_id) VALUES (?, ?)',
+        [(gestor_id, loja_id) for loja_id in sorted(set(loja_ids))]
+    )
+
+
+def restringir(lojas, loja_id):
+    """Escopo com o filtro de loja da tela (?loja=); loja fora do escopo é ignorada."""
+    if not loja_id:
+        return lojas
+    if lojas is None or loja_id in lojas:
+        return (loja_id,)
+    return lojas
+
+
+def contem(lojas, loja_id):
+    """Se um colaborador da loja `loja_id` está no escopo."""
+    return lojas is None or loja_id in lojas
+
+
+def filtro_sql(lojas, coluna='c.loja_id'):
+    """(' AND coluna IN (...)', parâmetros) do escopo; ('', []) para todas."""
+    if lojas is None:
+        return '', []
+    return f" AND {coluna} IN ({','.join('?' * len(lojas))})", list(lojas)
@@ -0,0 +1,233 @@
+"""Eventos do dashboard ao vivo (Server-Sent Events).
+
+As rotas de escrita publicam na tabela `eventos`, na mesma transação da
+alteração, só o que mudou: o registro de um colaborador num dia, ou uma
+justificativa. Não há broker: em cada processo do gunicorn um único
+Barramento consulta a tabela a cada INTERVALO segundos enquanto houver
+dashboards conectados, lê o estado atual de cada item alterado (uma vez
+por processo, não por conexão) e acorda os streams. O custo no banco não
+depende de quantos dashboards estão abertos.
+
+Cada stream fica parado num threading.Condition entre um evento e outro,
+o que serve tanto para workers gthread quanto para gevent (monkey patch).
+Um stream dura no máximo DURACAO segundos; o navegador reconecta sozinho
+com o Last-Event-ID e recebe o que perdeu, ou 'recarregar' se o intervalo
+já saiu da memória ou se o dia virou.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+import consultas
+from models import get_db
+
+REGISTRO = 'registro'
+JUSTIFICATIVA = 'justificativa'
+RECARREGAR = 'recarregar'
+
+INTERVALO = float(os.environ.get('EVENTOS_INTERVALO', 1.0))
+DURACAO = int(os.environ.get('EVENTOS_DURACAO', 300))
+PING = 15
+# Eventos mantidos em memória para quem reconecta
+MEMORIA = 1000
+RETENCAO = timedelta(days=1)
+# A cada quantos eventos publicados os antigos são apagados
+LIMPEZA = 500
+
+_CAMPOS_REGISTRO = ('id', 'entrada', 'saida_almoco', 'retorno_almoco', 'saida',
+                    'horas_trabalhadas', 'atraso_minutos', 'editado_por')
+
+
+def publicar(db, tipo, colaborador_id, data=None, referencia=None):
+    """Registra uma alteração para os dashboards (chamar antes do commit).
+
+    REGISTRO: o registro de `colaborador_id` em `data` ('AAAA-MM-DD') mudou;
+    JUSTIFICATIVA: a justificativa `referencia` foi criada ou decidida.
+    """
+    agora = datetime.now()
+    cursor = db.execute(
+        '''INSERT INTO eventos (tipo, colaborador_id, data, referencia, criado_em)
+           VALUES (?, ?, ?, ?, ?)''',
+        (tipo, colaborador_id, data, referencia, agora.isoformat(timespec='seconds'))
+    )
+    if cursor.lastrowid % LIMPEZA == 0:
+        # De tempos em tempos, descarta o que nenhum stream vai mais pedir
+        db.execute('DELETE FROM eventos WHERE criado_em < ?',
+                   ((agora - RETENCAO).isoformat(timespec='seconds'),))
+
+
+def ultimo_id(db):
+    """Id do último evento publicado (0 se nenhum)."""
+    return db.execute('SELECT COALESCE(MAX(id), 0) FROM eventos').fetchone()[0]
+
+
+def _estado_registro(db, colaborador_id, data):
+    c = db.execute(
+        '''SELECT c.nome, c.cargo, c.ativo, c.is_gestor, c.loja_id,
+                  EXISTS (SELECT 1 FROM justificativas j
+                          WHERE j.colaborador_id = c.id AND j.status = 'aprovado'
+                            AND j.data_inicio <= ? AND j.data_fim >= ?) AS justificado
+           FROM colaboradores c WHERE c.id = ?''',
+        (data, data, colaborador_id)
+    ).fetchone()
+    if c is None:
+        return None
+    r = db.execute(
+        'SELECT * FROM registros_ponto WHERE colaborador_id = ? AND data = ?',
+        (colaborador_id, data)
+    ).fetchone()
+    return {
+        'colaborador_id': colaborador_id, 'data': data, 'nome': c['nome'],
+        'cargo': c['cargo'], 'ativo': bool(c['ativo']), 'loja_id': c['loja_id'],
+        'registro': {campo: r[campo] for campo in _CAMPOS_REGISTRO} if r else None,
+        # Sem registro, sem justificativa e não gestor: entra nos ausentes
+        'ausente': (r is None and bool(c['ativo']) and not c['is_gestor']
+                    and not c['justificado']),
+    }
+
+
+def _estado_justificativa(db, just_id):
+    j = db.execute(
+        '''SELECT j.id, j.colaborador_id, j.data_inicio, j.data_fim, j.tipo, j.dias,
+                  j.status, j.arquivo_atestado, c.nome AS colaborador_nome, c.loja_id
+           FROM justificativas j
+           JOIN colaboradores c ON c.id = j.colaborador_id
+           WHERE j.id = ?''',
+        (just_id,)
+    ).fetchone()
+    return dict(j) if j else None
+
+
+class Barramento:
+    """Distribui os eventos da tabela para os streams deste processo."""
+
+    def __init__(self, intervalo=INTERVALO, memoria=MEMORIA):
+        self.intervalo = intervalo
+        self.memoria = memoria
+        self._condicao = threading.Condition()
+        self._eventos = deque()   # [(id, tipo, dados)], crescente
+        self._ultimo = None       # último id lido da tabela
+        self._inicio = None       # todo evento com id maior que este está em memória
+        self._pedido = None       # `desde` do primeiro stream, para a primeira leitura
+        self._ouvintes = 0
+        self._pid = None
+
+    def _iniciar(self):
+        # Uma thread por processo (o gunicorn faz fork depois do import)
+        with self._condicao:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._eventos.clear()
+            self._ultimo = self._inicio = self._pedido = None
+        threading.Thread(target=self._loop, name='eventos', daemon=True).start()
+
+    def _loop(self):
+        db = get_db()
+        while True:
+            with self._condicao:
+                if not self._ouvintes:
+                    # Sem dashboards: para de ler e descarta a memória
+                    self._eventos.clear()
+                    self._ultimo = self._inicio = None
+                    while not self._ouvintes:
+                        self._condicao.wait()
+            try:
+                self._consultar(db)
+            except Exception:
+                # Banco ocupado ou indisponível: tenta de novo no próximo ciclo
+                db.rollback()
+            time.sleep(self.intervalo)
+
+    def _consultar(self, db):
+        if self._ultimo is None:
+            # Primeira leitura: a partir do que o dashboard mais antigo já tem
+            atual = ultimo_id(db)
+            with self._condicao:
+                pedido = atual if self._pedido is None else min(self._pedido, atual)
+                self._ultimo = self._inicio = max(pedido, atual - self.memoria)
+                self._pedido = None
+        linhas = db.execute(
+            consultas.EVENTOS_NOVOS,
+            (self._ultimo,)
+        ).fetchall()
+
+        # Vários eventos do mesmo item viram um só, com o estado atual
+        por_item = {}
+        for e in linhas:
+            por_item[(e['tipo'], e['colaborador_id'], e['data'], e['referencia'])] = e['id']
+        novos = []
+        for (tipo, colaborador_id, data, referencia), evento_id in sorted(
+                por_item.items(), key=lambda item: item[1]):
+            if tipo == REGISTRO:
+                dados = _estado_registro(db, colaborador_id, data)
+            else:
+                dados = _estado_justificativa(db, referencia)
+            if dados is not None:
+                novos.append((evento_id, tipo, dados))
+        db.commit()
+
+        with self._condicao:
+            if linhas:
+                self._ultimo = linhas[-1]['id']
+            self._eventos.extend(novos)
+            while len(self._eventos) > self.memoria:
+                self._inicio = self._eventos.popleft()[0]
+            self._condicao.notify_all()
+
+    def ouvir(self, desde, duracao=DURACAO, ping=PING, encerrar=None):
+        """Gera (id, tipo, dados) dos eventos depois de `desde`.
+
+        Sem eventos, gera (None, None, None) a cada `ping` segundos (para o
+        stream mandar um comentário). Termina após `duracao` segundos; gera
+        RECARREGAR e termina se `desde` já saiu da memória ou se encerrar()
+        ficar verdadeiro.
+        """
+        self._iniciar()
+        fim = time.monotonic() + duracao
+        with self._condicao:
+            if self._ultimo is None:
+                self._pedido = desde if self._pedido is None else min(self._pedido, desde)
+            self._ouvintes += 1
+            self._condicao.notify_all()
+        try:
+            while time.monotonic() < fim:
+                with self._condicao:
+                    self._condicao.wait_for(
+                        lambda: self._ultimo is not None and self._ultimo > desde,
+                        timeout=min(ping, max(0, fim - time.monotonic())))
+                    ultimo = self._ultimo
+                    if ultimo is not None and desde < self._inicio:
+                        eventos = None
+                    else:
+                        eventos = [e for e in self._eventos if e[0] > desde]
+                if eventos is None or (encerrar and encerrar()):
+                    yield ultimo, RECARREGAR, {}
+                    return
+                for evento in eventos:
+                    yield evento
+                if ultimo is not None and ultimo > desde:
+                    desde = ultimo
+                else:
+                    yield None, None, None
+        finally:
+            with self._condicao:
+                self._ouvintes -= 1
+
+
+barramento = Barramento()
+
+
+def formatar_sse(evento_id, tipo, dados):
+    """Uma mensagem no formato text/event-stream."""
+    if tipo is None:
+        return ': ping\n\n'
+    linhas = []
+    if evento_id is not None:
+        linhas.append(f'id: {evento_id}')
+    linhas.append(f'event: {tipo}')
+    linhas.append('data: ' + json.dumps(dados, ensure_ascii=False, separators=(',', ':')))
+    return '\n'.join(linhas) + '\n\n'
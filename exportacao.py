@@ -0,0 +1,460 @@
+"""Geração dos relatórios de ponto (Excel e PDF).
+
+As funções gravam o arquivo em `destino` (caminho ou arquivo aberto) e não
+dependem da requisição, então servem tanto às rotas de exportação quanto
+aos workers da fila de jobs. O parâmetro opcional `progresso` recebe o
+percentual concluído.
+
+A exportação em lote usa o modo write-only do openpyxl: as linhas são
+gravadas direto no arquivo à medida que saem do cursor do SQLite, então a
+memória não cresce com o número de colaboradores ou de registros. A
+formatação usa estilos nomeados registrados uma vez no workbook, em vez
+de objetos Font/Border por célula.
+"""
+import io
+import re
+from datetime import date, datetime
+
+from calendario import get_mes_inicio_fim, get_semana_inicio_fim
+import consultas
+from escopo import filtro_sql, restringir
+from horas import calcular_horas_extras_semana, calcular_horas_justificadas
+
+# ---------------------------------------------------------------------------
+# Relatório individual
+# ---------------------------------------------------------------------------
+
+def gerar_excel(db, colab_id, data_ref, rotulo, destino, progresso=None):
+    """Grava em `destino` a planilha de ponto de um colaborador no mês.
+
+    Retorna o nome sugerido para o arquivo.
+    """
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+
+    colaborador = db.execute(
+        'SELECT * FROM colaboradores WHERE id = ?', (colab_id,)
+    ).fetchone()
+
+    inicio_mes, fim_mes = get_mes_inicio_fim(data_ref)
+
+    registros = db.execute(
+        consultas.REGISTROS_COLABORADOR_PERIODO,
+        (colab_id, inicio_mes.isoformat(), fim_mes.isoformat())
+    ).fetchall()
+
+    # Horas justificadas
+    horas_just, _ = calcular_horas_justificadas(colab_id, inicio_mes, fim_mes, colaborador, db)
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Ponto"
+
+    # Header
+    header_font = Font(bold=True, color="FFFFFF", size=11)
+    header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
+    thin_border = Border(
+        left=Side(style='thin'), right=Side(style='thin'),
+        top=Side(style='thin'), bottom=Side(style='thin')
+    )
+
+    ws.merge_cells('A1:G1')
+    ws['A1'] = f"Relatório de Ponto - {colaborador['nome']}"
+    ws['A1'].font = Font(bold=True, size=14)
+
+    ws.merge_cells('A2:G2')
+    ws['A2'] = f"Período: {inicio_mes.strftime('%d/%m/%Y')} a {fim_mes.strftime('%d/%m/%Y')}"
+
+    headers = ['Data', 'Tipo Dia', 'Entrada', 'Saída Almoço', 'Retorno Almoço', 'Saída', 'Horas', 'Status']
+    for col, h in enumerate(headers, 1):
+        cell = ws.cell(row=4, column=col, value=h)
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.alignment = Alignment(horizontal='center')
+        cell.border = thin_border
+
+    total_horas = 0
+    for i, reg in enumerate(registros, 5):
+        d = date.fromisoformat(reg['data'])
+        ws.cell(row=i, column=1, value=d.strftime('%d/%m/%Y')).border = thin_border
+        td = reg['tipo_dia'] or 'normal'
+        ws.cell(row=i, column=2, value='Dom/Feriado' if td == 'especial' else 'Normal').border = thin_border
+        ws.cell(row=i, column=3, value=reg['entrada'] or '-').border = thin_border
+        ws.cell(row=i, column=4, value=reg['saida_almoco'] or '-').border = thin_border
+        ws.cell(row=i, column=5, value=reg['retorno_almoco'] or '-').border = thin_border
+        ws.cell(row=i, column=6, value=reg['saida'] or '-').border = thin_border
+        ws.cell(row=i, column=7, value=reg['horas_trabalhadas']).border = thin_border
+        ws.cell(row=i, column=8, value=reg['status']).border = thin_border
+        total_horas += reg['horas_trabalhadas']
+
+    row_total = len(registros) + 5
+    ws.cell(row=row_total, column=6, value="TOTAL TRABALHADO:").font = Font(bold=True)
+    ws.cell(row=row_total, column=7, value=round(total_horas, 2)).font = Font(bold=True)
+
+    # Horas justificadas
+    row_just = row_total + 1
+    ws.cell(row=row_just, column=6, value="HORAS JUSTIFICADAS:").font = Font(bold=True, color="0070C0")
+    ws.cell(row=row_just, column=7, value=round(horas_just, 2)).font = Font(bold=True, color="0070C0")
+
+    # Total geral
+    row_geral = row_just + 1
+    ws.cell(row=row_geral, column=6, value="TOTAL GERAL:").font = Font(bold=True)
+    ws.cell(row=row_geral, column=7, value=round(total_horas + horas_just, 2)).font = Font(bold=True)
+
+    # Calcular horas extras (incluindo justificadas)
+    max_h = colaborador['max_horas_semana'] or 40.0
+    semanas_exp = {}
+    for reg in registros:
+        d = date.fromisoformat(reg['data'])
+        sem_inicio, _ = get_semana_inicio_fim(d)
+        chave = sem_inicio.isoformat()
+        semanas_exp[chave] = semanas_exp.get(chave, 0) + reg['horas_trabalhadas']
+    total_extras = sum(calcular_horas_extras_semana(h, max_h) for h in semanas_exp.values())
+
+    row_extras = row_geral + 1
+    ws.cell(row=row_extras, column=6, value="HORAS EXTRAS:").font = Font(bold=True, color="FF0000")
+    ws.cell(row=row_extras, column=7, value=round(total_extras, 2)).font = Font(bold=True, color="FF0000")
+
+    for col in range(1, 9):
+        ws.column_dimensions[chr(64 + col)].width = 16
+
+    if progresso:
+        progresso(80)
+    wb.save(destino)
+    return f"ponto_{colaborador['nome'].replace(' ', '_')}_{rotulo}.xlsx"
+
+
+def gerar_pdf(db, colab_id, data_ref, rotulo, destino, gerado_em, progresso=None):
+    """Grava em `destino` a folha de ponto em PDF de um colaborador no mês.
+
+    Retorna o nome sugerido para o arquivo.
+    """
+    from xhtml2pdf import pisa
+
+    colaborador = db.execute(
+        'SELECT * FROM colaboradores WHERE id = ?', (colab_id,)
+    ).fetchone()
+
+    inicio_mes, fim_mes = get_mes_inicio_fim(data_ref)
+
+    registros = db.execute(
+        consultas.REGISTROS_COLABORADOR_PERIODO,
+        (colab_id, inicio_mes.isoformat(), fim_mes.isoformat())
+    ).fetchall()
+
+    horas_just, dias_just = calcular_horas_justificadas(
+        colab_id, inicio_mes, fim_mes, colaborador, db)
+
+    total_horas_trab = sum(r['horas_trabalhadas'] for r in registros)
+    total_geral = total_horas_trab + horas_just
+
+    # Loja do colaborador
+    loja = None
+    if colaborador['loja_id']:
+        loja = db.execute('SELECT nome FROM lojas WHERE id = ?',
+                          (colaborador['loja_id'],)).fetchone()
+
+    meses_pt = ['', 'Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho',
+                'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
+    nome_mes = f"{meses_pt[data_ref.month]}/{data_ref.year}"
+
+    # Build HTML
+    rows_html = ''
+    for r in registros:
+        d = date.fromisoformat(r['data'])
+        dias_sem = ['Seg', 'Ter', 'Qua', 'Qui', 'Sex', 'Sáb', 'Dom']
+        td_label = 'Fer/Dom' if (r['tipo_dia'] or 'normal') == 'especial' else 'Normal'
+        rows_html += f'''<tr>
+            <td>{d.strftime("%d/%m/%Y")} ({dias_sem[d.weekday()]})</td>
+            <td style="text-align:center">{td_label}</td>
+            <td style="text-align:center">{r['entrada'] or '-'}</td>
+            <td style="text-align:center">{r['saida_almoco'] or '-'}</td>
+            <td style="text-align:center">{r['retorno_almoco'] or '-'}</td>
+            <td style="text-align:center">{r['saida'] or '-'}</td>
+            <td style="text-align:center"><b>{r['horas_trabalhadas']:.2f}h</b></td>
+        </tr>'''
+
+    loja_info = f"<b>Loja:</b> {loja['nome']}" if loja else ""
+
+    html = f'''<!DOCTYPE html>
+<html><head><meta charset="utf-8">
+<style>
+    @page {{ size: A4; margin: 1.5cm; }}
+    body {{ font-family: Helvetica, Arial, sans-serif; font-size: 10px; color: #333; }}
+    h1 {{ color: #4472C4; font-size: 18px; margin-bottom: 2px; }}
+    h2 {{ color: #666; font-size: 13px; font-weight: normal; margin-top: 0; }}
+    .info {{ margin-bottom: 10px; font-size: 10px; }}
+    table {{ width: 100%; border-collapse: collapse; margin-top: 10px; }}
+    th {{ background-color: #4472C4; color: white; padding: 6px 4px; font-size: 9px;
+          text-align: center; }}
+    td {{ padding: 5px 4px; border-bottom: 1px solid #ddd; font-size: 9px; }}
+    tr:nth-child(even) {{ background-color: #f8f9fa; }}
+    .totals {{ margin-top: 15px; }}
+    .totals td {{ border: none; padding: 3px 4px; font-size: 10px; }}
+    .signature {{ margin-top: 50px; }}
+    .signature td {{ border: none; text-align: center; padding-top: 40px;
+                     border-top: 1px solid #333; font-size: 10px; }}
+    .footer {{ text-align: center; font-size: 8px; color: #999; margin-top: 30px; }}
+</style></head><body>
+    <h1>Piticas - Folha de Ponto</h1>
+    <h2>{nome_mes}</h2>
+    <div class="info">
+        <b>Colaborador:</b> {colaborador['nome']} &nbsp;|&nbsp;
+        <b>Cargo:</b> {colaborador['cargo'] or '-'} &nbsp;|&nbsp;
+        <b>E-mail:</b> {colaborador['email']}
+        {(' &nbsp;|&nbsp; ' + loja_info) if loja_info else ''}
+    </div>
+    <table>
+        <thead><tr>
+            <th style="text-align:left">Data</th><th>Tipo</th><th>Entrada</th>
+            <th>Saída Almoço</th><th>Retorno</th><th>Saída</th><th>Horas</th>
+        </tr></thead>
+        <tbody>{rows_html}</tbody>
+    </table>
+    <table class="totals">
+        <tr><td style="text-align:right;width:70%"><b>Total Trabalhado:</b></td>
+            <td><b>{total_horas_trab:.2f}h</b></td></tr>
+        <tr><td style="text-align:right"><b>Horas Justificadas:</b></td>
+            <td><b style="color:#0070C0">{horas_just:.2f}h</b> ({dias_just} dia(s))</td></tr>
+        <tr><td style="text-align:right"><b>Total Geral:</b></td>
+            <td><b style="color:#28a745">{total_geral:.2f}h</b></td></tr>
+    </table>
+    <table class="signature"><tr>
+        <td style="width:45%">{colaborador['nome']}<br><small>Colaborador</small></td>
+        <td style="width:10%"></td>
+        <td style="width:45%">Gestor Responsável<br><small>Assinatura</small></td>
+    </tr></table>
+    <div class="footer">
+        Versão dos dados de {gerado_em.strftime("%d/%m/%Y %H:%M")} - Piticas Controle de Ponto
+    </div>
+</body></html>'''
+
+    if progresso:
+        progresso(30)
+    pisa.CreatePDF(io.StringIO(html), dest=destino)
+    return f"ponto_{colaborador['nome'].replace(' ', '_')}_{rotulo}.pdf"
+
+
+# ---------------------------------------------------------------------------
+# Exportação em lote
+# ---------------------------------------------------------------------------
+
+MODOS = ('abas', 'unica')
+
+CABECALHO = ['Data', 'Tipo Dia', 'Entrada', 'Saída Almoço', 'Retorno Almoço',
+             'Saída', 'Horas', 'Status']
+CABECALHO_RESUMO = ['Colaborador', 'Loja', 'Cargo', 'Dias', 'Horas Trabalhadas',
+                    'Horas Justificadas', 'Total Geral', 'Horas Extras']
+
+_ABA_INVALIDA = re.compile(r'[\[\]:*?/\\]')
+
+
+def _registrar_estilos(wb):
+    """Registra os estilos nomeados usados pela planilha."""
+    from openpyxl.styles import Alignment, Border, Font, NamedStyle, PatternFill, Side
+
+    borda = Border(left=Side(style='thin'), right=Side(style='thin'),
+                   top=Side(style='thin'), bottom=Side(style='thin'))
+    estilos = [
+        NamedStyle(name='ponto_titulo', font=Font(bold=True, size=14)),
+        NamedStyle(name='ponto_cabecalho', font=Font(bold=True, color='FFFFFF', size=11),
+                   fill=PatternFill(start_color='4472C4', end_color='4472C4',
+                                    fill_type='solid'),
+                   alignment=Alignment(horizontal='center'), border=borda),
+        NamedStyle(name='ponto_celula', border=borda),
+        NamedStyle(name='ponto_data', border=borda, number_format='DD/MM/YYYY'),
+        NamedStyle(name='ponto_horas', border=borda, number_format='0.00'),
+        NamedStyle(name='ponto_total', font=Font(bold=True)),
+        NamedStyle(name='ponto_justificado', font=Font(bold=True, color='0070C0')),
+        NamedStyle(name='ponto_extra', font=Font(bold=True, color='FF0000')),
+    ]
+    for estilo in estilos:
+        wb.add_named_style(estilo)
+
+
+def _nome_aba(nome, usados):
+    """Nome de aba válido (até 31 caracteres, sem []:*?/\\) e único."""
+    base = _ABA_INVALIDA.sub(' ', nome).strip()[:31] or 'Colaborador'
+    candidato = base
+    n = 2
+    while candidato.lower() in usados:
+        sufixo = f' ({n})'
+        candidato = base[:31 - len(sufixo)] + sufixo
+        n += 1
+    usados.add(candidato.lower())
+    return candidato
+
+
+def _celula(ws, valor, estilo):
+    from openpyxl.cell import WriteOnlyCell
+
+    cell = WriteOnlyCell(ws, value=valor)
+    cell.style = estilo
+    return cell
+
+
+def _linha_registro(ws, reg):
+    """Células de um registro de ponto (mesmas colunas do export individual)."""
+    td = reg['tipo_dia'] or 'normal'
+    return [
+        _celula(ws, date.fromisoformat(reg['data']), 'ponto_data'),
+        _celula(ws, 'Dom/Feriado' if td == 'especial' else 'Normal', 'ponto_celula'),
+        _celula(ws, reg['entrada'] or '-', 'ponto_celula'),
+        _celula(ws, reg['saida_almoco'] or '-', 'ponto_celula'),
+        _celula(ws, reg['retorno_almoco'] or '-', 'ponto_celula'),
+        _celula(ws, reg['saida'] or '-', 'ponto_celula'),
+        _celula(ws, reg['horas_trabalhadas'], 'ponto_horas'),
+        _celula(ws, reg['status'], 'ponto_celula'),
+    ]
+
+
+def _larguras(ws, larguras):
+    from openpyxl.utils import get_column_letter
+
+    for col, largura in enumerate(larguras, 1):
+        ws.column_dimensions[get_column_letter(col)].width = largura
+
+
+def nome_arquivo_lote(rotulo, loja_id=None):
+    return f"ponto_lote_{rotulo}{f'_loja{loja_id}' if loja_id else ''}.xlsx"
+
+
+def gerar_excel_lote(db, inicio, fim, destino, loja_id=None, modo='abas',
+                     progresso=None, lojas=None):
+    """Grava em `destino` a planilha de ponto de todos os colaboradores ativos.
+
+    Entram os colaboradores da loja `loja_id` (None = todas) dentro do
+    escopo `lojas` do gestor que pediu (None = todas, ver escopo.py).
+
+    modo='abas' cria uma aba por colaborador; modo='unica' grava todos os
+    registros numa aba só, com as colunas Colaborador e Loja na frente. Nos
+    dois modos a última aba ('Resumo') traz os totais por colaborador.
+    Retorna a quantidade de colaboradores exportados.
+    """
+    from openpyxl import Workbook
+
+    filtro, params = filtro_sql(restringir(lojas, loja_id))
+    colaboradores = db.execute(
+        f'''SELECT c.*, l.nome AS loja_nome FROM colaboradores c
+            LEFT JOIN lojas l ON c.loja_id = l.id
+            WHERE c.ativo = 1{filtro}
+            ORDER BY c.nome, c.id''',
+        params
+    ).fetchall()
+
+    wb = Workbook(write_only=True)
+    _registrar_estilos(wb)
+    periodo = f"Período: {inicio.strftime('%d/%m/%Y')} a {fim.strftime('%d/%m/%Y')}"
+
+    if modo == 'unica':
+        ws = wb.create_sheet('Ponto')
+        _larguras(ws, [28, 20] + [16] * len(CABECALHO))
+        ws.append([_celula(ws, 'Relatório de Ponto - Todos os colaboradores', 'ponto_titulo')])
+        ws.append([periodo])
+        ws.append([])
+        ws.append([_celula(ws, h, 'ponto_cabecalho')
+                   for h in ['Colaborador', 'Loja'] + CABECALHO])
+
+    usados = set()
+    totais = []
+    for n, c in enumerate(colaboradores):
+        if progresso:
+            progresso(n * 95 // len(colaboradores))
+        if modo == 'abas':
+            ws = wb.create_sheet(_nome_aba(c['nome'], usados))
+            _larguras(ws, [16] * len(CABECALHO))
+            ws.append([_celula(ws, f"Relatório de Ponto - {c['nome']}", 'ponto_titulo')])
+            ws.append([periodo])
+            ws.append([])
+            ws.append([_celula(ws, h, 'ponto_cabecalho') for h in CABECALHO])
+
+        # Cursor percorrido sob demanda: nenhuma lista de registros em memória
+        cursor = db.execute(
+            '''SELECT data, tipo_dia, entrada, saida_almoco, retorno_almoco, saida,
+                      horas_trabalhadas, status
+               FROM registros_ponto
+               WHERE colaborador_id = ? AND data BETWEEN ? AND ?
+               ORDER BY data''',
+            (c['id'], inicio.isoformat(), fim.isoformat())
+        )
+        total_horas = 0
+        dias = 0
+        semanas = {}
+        for reg in cursor:
+            linha = _linha_registro(ws, reg)
+            if modo == 'unica':
+                linha = [_celula(ws, c['nome'], 'ponto_celula'),
+                         _celula(ws, c['loja_nome'] or '-', 'ponto_celula')] + linha
+            ws.append(linha)
+            total_horas += reg['horas_trabalhadas']
+            dias += 1
+            sem_inicio, _ = get_semana_inicio_fim(date.fromisoformat(reg['data']))
+            semanas[sem_inicio] = semanas.get(sem_inicio, 0) + reg['horas_trabalhadas']
+
+        horas_just, _ = calcular_horas_justificadas(c['id'], inicio, fim, c, db)
+        max_h = c['max_horas_semana'] or 40.0
+        total_extras = sum(calcular_horas_extras_semana(h, max_h) for h in semanas.values())
+        totais.append((c, dias, round(total_horas, 2), round(horas_just, 2),
+                       round(total_horas + horas_just, 2), round(total_extras, 2)))
+
+        if modo == 'abas':
+            vazio = [None] * 5
+            ws.append(vazio + [_celula(ws, 'TOTAL TRABALHADO:', 'ponto_total'),
+                               _celula(ws, round(total_horas, 2), 'ponto_total')])
+            ws.append(vazio + [_celula(ws, 'HORAS JUSTIFICADAS:', 'ponto_justificado'),
+                               _celula(ws, round(horas_just, 2), 'ponto_justificado')])
+            ws.append(vazio + [_celula(ws, 'TOTAL GERAL:', 'ponto_total'),
+                               _celula(ws, round(total_horas + horas_just, 2), 'ponto_total')])
+            ws.append(vazio + [_celula(ws, 'HORAS EXTRAS:', 'ponto_extra'),
+                               _celula(ws, round(total_extras, 2), 'ponto_extra')])
+
+    ws = wb.create_sheet('Resumo')
+    _larguras(ws, [28, 20, 18] + [16] * 5)
+    ws.append([_celula(ws, 'Resumo do Período', 'ponto_titulo')])
+    ws.append([periodo])
+    ws.append([])
+    ws.append([_celula(ws, h, 'ponto_cabecalho') for h in CABECALHO_RESUMO])
+    for c, dias, trabalhadas, justificadas, geral, extras in totais:
+        ws.append([
+            _celula(ws, c['nome'], 'ponto_celula'),
+            _celula(ws, c['loja_nome'] or '-', 'ponto_celula'),
+            _celula(ws, c['cargo'] or '-', 'ponto_celula'),
+            _celula(ws, dias, 'ponto_celula'),
+            _celula(ws, trabalhadas, 'ponto_horas'),
+            _celula(ws, justificadas, 'ponto_horas'),
+            _celula(ws, geral, 'ponto_horas'),
+            _celula(ws, extras, 'ponto_horas'),
+        ])
+
+    wb.save(destino)
+    return len(colaboradores)
+
+
+# ---------------------------------------------------------------------------
+# Despacho por tipo (fila de jobs e cache de relatórios)
+# ---------------------------------------------------------------------------
+
+MIME_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Parâmetros (serializáveis em JSON) de cada tipo:
+#   pdf / excel: colab_id, data_ref (AAAA-MM-01), rotulo, gerado_em (só pdf)
+#   excel_lote:  inicio, fim, rotulo, loja_id, lojas, modo
+TIPOS = ('pdf', 'excel', 'excel_lote')
+
+
+def gerar_relatorio(db, tipo, p, destino, progresso=None):
+    """Gera o relatório `tipo` em `destino`. Retorna (nome_arquivo, mimetype)."""
+    if tipo == 'pdf':
+        nome = gerar_pdf(db, p['colab_id'], date.fromisoformat(p['data_ref']), p['rotulo'],
+                         destino, datetime.fromisoformat(p['gerado_em']), progresso)
+        return nome, 'application/pdf'
+    if tipo == 'excel':
+        nome = gerar_excel(db, p['colab_id'], date.fromisoformat(p['data_ref']), p['rotulo'],
+                           destino, progresso)
+        return nome, MIME_XLSX
+    if tipo == 'excel_lote':
+        gerar_excel_lote(db, date.fromisoformat(p['inicio']), date.fromisoformat(p['fim']),
+                         destino, loja_id=p.get('loja_id'), modo=p.get('modo', 'abas'),
+                         progresso=progresso, lojas=p.get('lojas'))
+        return nome_arquivo_lote(p['rotulo'], p.get('loja_id')), MIME_XLSX
+    raise ValueError(f'tipo de relatório desconhecido: {tipo}')
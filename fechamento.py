@@ -0,0 +1,115 @@
+"""Fechamento do banco de horas em lote.
+
+Um mês é fechado para todos os colaboradores de uma vez, em fases:
+
+1. carregar: colaboradores ativos ainda sem o mês fechado (uma consulta);
+2. somar: horas trabalhadas e justificadas de todos, agrupadas por
+   colaborador no diário (banco_horas_diario);
+3. esperadas: horas esperadas pelas escalas do mês (uma consulta para
+   todos) e pelo calendário em memória;
+4. gravar: um executemany em banco_horas e outro no saldo acumulado
+   (colaboradores.saldo_banco).
+
+Vários meses são fechados em ordem cronológica numa única transação
+(BEGIN IMMEDIATE), então um fechamento concorrente não grava o mesmo mês
+duas vezes. O tempo de cada fase é devolvido para log/CLI.
+"""
+import time
+from collections import defaultdict
+from datetime import date
+
+from calendario import get_mes_inicio_fim
+import consultas
+from horas import calcular_horas_esperadas, carregar_escalas
+
+FASES = ('carregar', 'somar', 'esperadas', 'gravar')
+
+
+def meses_do_intervalo(inicio, fim):
+    """'AAAA-MM' de cada mês de `inicio` a `fim` (strings 'AAAA-MM')."""
+    ano, mes = (int(p) for p in inicio.split('-'))
+    ano_fim, mes_fim = (int(p) for p in fim.split('-'))
+    meses = []
+    while (ano, mes) <= (ano_fim, mes_fim):
+        meses.append(f'{ano:04d}-{mes:02d}')
+        ano, mes = (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+    return meses
+
+
+def _fechar_mes(db, mes, ate, tempos):
+    inicio_mes, fim_mes = get_mes_inicio_fim(date.fromisoformat(mes + '-01'))
+
+    t = time.perf_counter()
+    colaboradores = db.execute(
+        '''SELECT * FROM colaboradores c
+           WHERE ativo = 1 AND NOT EXISTS (
+               SELECT 1 FROM banco_horas b WHERE b.colaborador_id = c.id AND b.mes = ?)''',
+        (mes,)
+    ).fetchall()
+    tempos['carregar'] += time.perf_counter() - t
+    if not colaboradores:
+        return 0
+
+    t = time.perf_counter()
+    totais = {
+        r['colaborador_id']: (r['horas_trab'], r['horas_just'])
+        for r in db.execute(
+            consultas.FECHAMENTO_DIARIO_MES,
+            (inicio_mes.isoformat(), fim_mes.isoformat())
+        )
+    }
+    tempos['somar'] += time.perf_counter() - t
+
+    t = time.perf_counter()
+    limite = min(fim_mes, ate)
+    escalas = carregar_escalas(db, inicio_mes, limite)
+    esperadas = {
+        c['id']: calcular_horas_esperadas(c, inicio_mes, limite, db, escalas.get(c['id'], {}))
+        for c in colaboradores
+    }
+    tempos['esperadas'] += time.perf_counter() - t
+
+    t = time.perf_counter()
+    linhas = []
+    for c in colaboradores:
+        horas_trab, horas_just = totais.get(c['id'], (0.0, 0.0))
+        horas_just = round(horas_just, 2)
+        horas_esperadas = esperadas[c['id']]
+        saldo = round(horas_trab + horas_just - horas_esperadas, 2)
+        linhas.append((c['id'], mes, round(horas_trab, 2), horas_just, horas_esperadas, saldo))
+    db.executemany(
+        '''INSERT INTO banco_horas
+           (colaborador_id, mes, horas_trabalhadas, horas_justificadas,
+            horas_esperadas, saldo, fechado)
+           VALUES (?, ?, ?, ?, ?, ?, 1)''',
+        linhas
+    )
+    db.executemany(
+        'UPDATE colaboradores SET saldo_banco = saldo_banco + ? WHERE id = ?',
+        [(linha[5], linha[0]) for linha in linhas]
+    )
+    tempos['gravar'] += time.perf_counter() - t
+    return len(linhas)
+
+
+def fechar_meses(db, meses, ate):
+    """Fecha os meses ('AAAA-MM') para os colaboradores ativos ainda abertos.
+
+    `ate` é a data de hoje: num mês ainda em curso as horas esperadas vão
+    só até ela. Retorna ({mes: colaboradores fechados}, {fase: segundos}).
+    A transação é encerrada aqui.
+    """
+    tempos = defaultdict(float)
+    fechados = {}
+    if db.in_transaction:
+        db.commit()
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        for mes in sorted(set(meses)):
+            fechados[mes] = _fechar_mes(db, mes, ate, tempos)
+        db.commit()
+    except BaseException:
+        if db.in_transaction:
+            db.rollback()
+        raise
+    return fechados, {fase: tempos[fase] for fase in FASES}
@@ -0,0 +1,267 @@
+"""Gerador de dados sintéticos para testes de carga e benchmark.
+
+Preenche um banco recém-criado por models.init_db() com lojas,
+colaboradores, anos de registros de ponto, justificativas, escalas e
+histórico de edições, de forma determinística (mesma semente, mesmos
+dados). No fim reconstrói o resumo semanal e o diário do banco de horas
+e fecha os meses anteriores ao atual, como numa base em uso.
+
+    python gerar_dados.py --dir /tmp/ponto_bench --colaboradores 200 --anos 2
+
+Todos os colaboradores gerados usam a senha SENHA; os e-mails são
+colab<N>@exemplo.local. Só roda num banco sem colaboradores além do
+administrador padrão.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+from werkzeug.security import generate_password_hash
+
+from tempo import calcular_horas, para_minutos
+
+SENHA = 'senha123'
+CARGOS = ('Vendedor', 'Vendedor', 'Vendedor', 'Caixa', 'Estoquista', 'Subgerente')
+TIPOS_JUSTIFICATIVA = ('atestado', 'atestado', 'falta_justificada', 'licenca', 'ferias')
+# Proporção de registros corrigidos pelo gestor (com histórico)
+TAXA_EDICAO = 0.02
+# Faltas sem justificativa, além das folgas
+TAXA_FALTA = 0.03
+
+
+def _hhmm(minutos):
+    minutos = max(0, min(minutos, 23 * 60 + 59))
+    return f'{minutos // 60:02d}:{minutos % 60:02d}'
+
+
+def _criar_lojas(db, n):
+    existentes = [r['id'] for r in db.execute('SELECT id FROM lojas ORDER BY id')]
+    db.executemany('INSERT INTO lojas (nome, endereco) VALUES (?, ?)',
+                   [(f'Loja {i + 1}', f'Endereço {i + 1}')
+                    for i in range(len(existentes), n)])
+    return [r['id'] for r in db.execute('SELECT id FROM lojas ORDER BY id LIMIT ?', (n,))]
+
+
+def _criar_colaboradores(db, rng, n, lojas):
+    senha = generate_password_hash(SENHA)
+    linhas = []
+    for i in range(n):
+        linhas.append((
+            f'Colaborador {i + 1:04d}', f'colab{i + 1}@exemplo.local', senha,
+            rng.choice(CARGOS), lojas[i % len(lojas)],
+            rng.choice((44.0, 40.0, 40.0, 36.0)), 8.0, 6.0, rng.choice((1, 2, 2)),
+            rng.choice(('08:00', '09:00', '10:00', '12:00', '')),
+            # O primeiro de cada loja é gestor
+            1 if i < len(lojas) else 0,
+        ))
+    db.executemany(
+        '''INSERT INTO colaboradores
+           (nome, email, senha, cargo, loja_id, max_horas_semana, horas_dia_normal,
+            horas_dia_especial, folgas_semana, horario_entrada, is_gestor, primeiro_acesso)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0)''',
+        linhas
+    )
+    return db.execute(
+        "SELECT * FROM colaboradores WHERE email LIKE '%@exemplo.local' ORDER BY id"
+    ).fetchall()
+
+
+def _folgas(rng, colaborador):
+    """Dias da semana (weekday) de folga fixa: domingo e, com 2 folgas, outro dia."""
+    dias = {6}
+    if colaborador['folgas_semana'] >= 2:
+        dias.add(rng.randrange(0, 6))
+    return dias
+
+
+def _batidas(rng, horario_entrada, jornada_min):
+    """(entrada, saída almoço, retorno, saída) em minutos para um dia trabalhado."""
+    base = para_minutos(horario_entrada) if horario_entrada else rng.choice((480, 540, 600))
+    entrada = base + int(rng.triangular(-10, 30, 0))
+    saida_almoco = entrada + rng.randint(180, 270)
+    retorno = saida_almoco + rng.randint(60, 75)
+    saida = entrada + jornada_min + (retorno - saida_almoco) + int(rng.triangular(-30, 90, 0))
+    return entrada, saida_almoco, retorno, saida
+
+
+def _gerar_registros(db, rng, colaboradores, inicio, fim, gestor_id):
+    from calendario import tipo_dia
+
+    linhas = []
+    editados = []
+    for c in colaboradores:
+        folgas = _folgas(rng, c)
+        d = inicio
+        while d <= fim:
+            if d.weekday() in folgas or rng.random() < TAXA_FALTA:
+                d += timedelta(days=1)
+                continue
+            td = tipo_dia(d, db)
+            jornada = int((c['horas_dia_especial'] if td == 'especial' else c['horas_dia_normal']) * 60)
+            e, sa, ra, s = (_hhmm(m) for m in _batidas(rng, c['horario_entrada'], jornada))
+            atraso = 0
+            if c['horario_entrada']:
+                diff = para_minutos(e) - para_minutos(c['horario_entrada'])
+                atraso = diff if diff > 15 else 0
+            if d == fim:
+                # Hoje: só a entrada
+                linhas.append((c['id'], d.isoformat(), e, '', '', '', 0.0, td,
+                               'em_andamento', atraso, None, None, ''))
+            else:
+                editado = rng.random() < TAXA_EDICAO
+                if editado:
+                    editados.append((c['id'], d.isoformat(), s))
+                linhas.append((c['id'], d.isoformat(), e, sa, ra, s,
+                               calcular_horas(e, sa, ra, s), td, 'completo', atraso,
+                               gestor_id if editado else None,
+                               f'{d.isoformat()}T19:00:00' if editado else None,
+                               'Esqueceu de bater a saída' if editado else ''))
+            d += timedelta(days=1)
+    db.executemany(
+        '''INSERT INTO registros_ponto
+           (colaborador_id, data, entrada, saida_almoco, retorno_almoco, saida,
+            horas_trabalhadas, tipo_dia, status, atraso_minutos,
+            editado_por, editado_em, motivo_edicao)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+        linhas
+    )
+
+    # Histórico das correções: a saída foi lançada pelo gestor
+    ids = {(r['colaborador_id'], r['data']): r['id'] for r in db.execute(
+        'SELECT id, colaborador_id, data FROM registros_ponto WHERE editado_por IS NOT NULL')}
+    db.executemany(
+        '''INSERT INTO historico_edicoes
+           (registro_id, colaborador_id, editado_por, data_edicao,
+            acao, campo, valor_anterior, valor_novo, motivo)
+           VALUES (?, ?, ?, ?, 'edicao', 'saida', '', ?, 'Esqueceu de bater a saída')''',
+        [(ids[(cid, data)], cid, gestor_id, f'{data}T19:00:00', saida)
+         for cid, data, saida in editados]
+    )
+    return len(linhas), len(editados)
+
+
+def _gerar_justificativas(db, rng, colaboradores, inicio, fim, gestor_id):
+    dias_periodo = (fim - inicio).days
+    linhas = []
+    for c in colaboradores:
+        for _ in range(max(1, round(4 * dias_periodo / 365))):
+            tipo = rng.choice(TIPOS_JUSTIFICATIVA)
+            duracao = rng.randint(10, 20) if tipo == 'ferias' else rng.randint(1, 4)
+            j_inicio = inicio + timedelta(days=rng.randint(0, dias_periodo))
+            j_fim = j_inicio + timedelta(days=duracao - 1)
+            status = rng.choices(('aprovado', 'pendente', 'rejeitado'), (70, 15, 15))[0]
+            decidido = status != 'pendente'
+            linhas.append((c['id'], j_inicio.isoformat(), j_fim.isoformat(), tipo,
+                           'Gerado para benchmark', duracao, status,
+                           gestor_id if decidido else None,
+                           f'{j_inicio.isoformat()} 18:00:00' if decidido else None,
+                           f'{j_inicio.isoformat()} 09:00:00'))
+    db.executemany(
+        '''INSERT INTO justificativas
+           (colaborador_id, data_inicio, data_fim, tipo, descricao, dias, status,
+            aprovado_por, data_aprovacao, data_registro)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+        linhas
+    )
+    return len(linhas)
+
+
+def _gerar_escalas(db, rng, colaboradores, hoje):
+    """Escala das últimas 8 semanas e das próximas 2 para metade da equipe."""
+    linhas = []
+    inicio = hoje - timedelta(days=56)
+    for c in colaboradores:
+        if rng.random() < 0.5:
+            continue
+        folgas = _folgas(rng, c)
+        entrada = c['horario_entrada'] or '09:00'
+        saida = _hhmm(para_minutos(entrada) + int(c['horas_dia_normal'] * 60) + 60)
+        for i in range(70):
+            d = inicio + timedelta(days=i)
+            folga = d.weekday() in folgas
+            linhas.append((c['id'], d.isoformat(), '' if folga else entrada,
+                           '' if folga else saida, 1 if folga else 0))
+    db.executemany(
+        '''INSERT OR IGNORE INTO escalas
+           (colaborador_id, data, horario_entrada, horario_saida, folga)
+           VALUES (?, ?, ?, ?, ?)''',
+        linhas
+    )
+    return len(linhas)
+
+
+def gerar(db, lojas=3, colaboradores=60, anos=1.0, hoje=None, semente=42, fechar=True):
+    """Preenche o banco e retorna {tabela/etapa: quantidade} e os tempos (s)."""
+    # Importados aqui: models lê DATA_DIR na importação (ver main)
+    from fechamento import fechar_meses, meses_do_intervalo
+    from horas import reconstruir_resumo_semanal
+
+    if db.execute('SELECT COUNT(*) FROM colaboradores').fetchone()[0] > 1:
+        raise ValueError('o banco já tem colaboradores; use um DATA_DIR vazio')
+    rng = random.Random(semente)
+    hoje = hoje or date.today()
+    inicio = hoje - timedelta(days=int(anos * 365))
+    gestor_id = db.execute(
+        "SELECT id FROM colaboradores WHERE is_gestor = 1 ORDER BY id LIMIT 1").fetchone()['id']
+
+    totais, tempos = {}, {}
+    t = time.perf_counter()
+    ids_lojas = _criar_lojas(db, lojas)
+    equipe = _criar_colaboradores(db, rng, colaboradores, ids_lojas)
+    totais['lojas'], totais['colaboradores'] = len(ids_lojas), len(equipe)
+    totais['registros_ponto'], totais['historico_edicoes'] = _gerar_registros(
+        db, rng, equipe, inicio, hoje, gestor_id)
+    totais['justificativas'] = _gerar_justificativas(db, rng, equipe, inicio, hoje, gestor_id)
+    totais['escalas'] = _gerar_escalas(db, rng, equipe, hoje)
+    db.commit()
+    tempos['inserir'] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    reconstruir_resumo_semanal(db)
+    db.commit()
+    tempos['resumos'] = time.perf_counter() - t
+
+    if fechar and inicio.replace(day=1) < hoje.replace(day=1):
+        t = time.perf_counter()
+        ultimo = (hoje.replace(day=1) - timedelta(days=1)).strftime('%Y-%m')
+        fechados, _ = fechar_meses(db, meses_do_intervalo(inicio.strftime('%Y-%m'), ultimo), hoje)
+        totais['meses_fechados'] = len(fechados)
+        tempos['fechamento'] = time.perf_counter() - t
+    return totais, tempos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dir', required=True,
+                        help='DATA_DIR do banco a criar (deve estar vazio).')
+    parser.add_argument('--lojas', type=int, default=3)
+    parser.add_argument('--colaboradores', type=int, default=60)
+    parser.add_argument('--anos', type=float, default=1.0)
+    parser.add_argument('--semente', type=int, default=42)
+    args = parser.parse_args()
+
+    # DATA_DIR precisa estar definido antes de importar models
+    os.makedirs(args.dir, exist_ok=True)
+    os.environ['DATA_DIR'] = args.dir
+    from models import get_db, init_db
+
+    init_db()
+    db = get_db()
+    try:
+        totais, tempos = gerar(db, args.lojas, args.colaboradores, args.anos,
+                               semente=args.semente)
+    except ValueError as e:
+        print(f'Erro: {e}', file=sys.stderr)
+        sys.exit(1)
+    finally:
+        db.close()
+    print(', '.join(f'{k}={v}' for k, v in totais.items()))
+    print('tempo: ' + ', '.join(f'{k} {v:.1f}s' for k, v in tempos.items()))
+    print(f'Banco gerado em {args.dir}.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+"""Dados dos gráficos do dashboard, servidos em JSON depois da página.
+
+Os três gráficos (evolução diária, comparativo mensal e ranking do mês)
+ficam abaixo da dobra; o dashboard é enviado sem eles e o Chart.js busca
+cada um em /api/dashboard/<grafico>.
+
+Os dados são calculados e guardados por (loja, mês) na tabela
+`cache_graficos` e somados para as lojas do gestor (ver escopo.py), de
+modo que gestores de lojas diferentes não invalidam o cache um do outro
+e quem vê todas as lojas reaproveita as partes de cada uma. Cada parte
+leva a assinatura das versões de versoes_relatorio (ver
+cache_relatorios.py) dos colaboradores da loja naquele mês, que as rotas
+de escrita já incrementam. Um mês passado fica no cache até ser editado.
+O mês atual muda a cada batida: ele é servido do cache por até TTL
+segundos mesmo com versão nova, e só depois recalculado.
+"""
+import hashlib
+import json
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from cache_painel import dependencias
+from cache_relatorios import TODOS
+from calendario import get_mes_inicio_fim, get_semana_inicio_fim
+import consultas
+from escopo import filtro_sql
+from fechamento import meses_do_intervalo
+from horas import MotorHoras
+
+TTL = int(os.environ.get('GRAFICOS_TTL', 60))
+# Incrementar quando o conteúdo das linhas mudar (invalida o cache inteiro)
+FORMATO = 2
+MESES_GRAFICO = 6
+# Loja dos colaboradores sem loja (só entra no escopo de quem vê todas)
+SEM_LOJA = 0
+
+MESES_ABREV = ('Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun',
+               'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez')
+
+
+def _limites(mes):
+    return get_mes_inicio_fim(datetime.strptime(mes, '%Y-%m').date())
+
+
+def _partes(db, lojas):
+    """Lojas a somar: as do escopo, ou todas as que têm colaboradores."""
+    if lojas is not None:
+        return list(lojas)
+    return [r[0] for r in db.execute(
+        'SELECT DISTINCT COALESCE(loja_id, ?) FROM colaboradores ORDER BY 1', (SEM_LOJA,))]
+
+
+def _assinaturas(db, lojas, partes, meses_de):
+    """{(loja, mes): assinatura} das versões de que cada parte depende.
+
+    `meses_de` é {mes: [meses cujas alterações atingem o mes]} ('' é o
+    cadastro); entram as versões dos colaboradores da loja e as de TODOS.
+    """
+    meses = sorted({m for ms in meses_de.values() for m in ms})
+    marcas = ','.join('?' * len(meses))
+    todos = {r['mes']: r['versao'] for r in db.execute(
+        f'''SELECT mes, versao FROM versoes_relatorio
+            WHERE colaborador_id = ? AND mes IN ({marcas})''',
+        [TODOS] + meses
+    )}
+    filtro, params = filtro_sql(lojas)
+    versoes = defaultdict(list)
+    for r in db.execute(
+        consultas.VERSOES_GRAFICOS.format(marcas=marcas, filtro_loja=filtro),
+        [SEM_LOJA] + meses + params
+    ):
+        versoes[(r['loja'], r['mes'])].append((r['colaborador_id'], r['versao']))
+    assinaturas = {}
+    for loja in partes:
+        for mes, dependentes in meses_de.items():
+            material = json.dumps(
+                [FORMATO, [todos.get(m, 0) for m in dependentes],
+                 [versoes.get((loja, m), []) for m in dependentes]],
+                separators=(',', ':'))
+            assinaturas[(loja, mes)] = hashlib.sha256(material.encode()).hexdigest()
+    return assinaturas
+
+
+def _em_cache(db, grafico, assinaturas, mes_atual, calcular):
+    """{(loja, mes): dados} do cache, chamando calcular(loja, mes) nas partes desatualizadas.
+
+    Uma parte do mês atual com menos de TTL segundos vale mesmo com
+    assinatura diferente.
+    """
+    chaves = {f'{grafico}:{loja}:{mes}': (loja, mes) for loja, mes in assinaturas}
+    recente = (datetime.now() - timedelta(seconds=TTL)).isoformat(timespec='seconds')
+    resultado = {}
+    for linha in db.execute(
+        consultas.CACHE_GRAFICOS.format(marcas=consultas.marcas(len(chaves))),
+        list(chaves)
+    ):
+        parte = chaves[linha['chave']]
+        if linha['versao'] == assinaturas[parte] or (
+                parte[1] == mes_atual and linha['criado_em'] >= recente):
+            resultado[parte] = json.loads(linha['dados'])
+
+    novos = [(parte, calcular(*parte)) for parte in assinaturas if parte not in resultado]
+    if novos:
+        agora = datetime.now().isoformat(timespec='seconds')
+        db.executemany(
+            '''INSERT OR REPLACE INTO cache_graficos (chave, versao, dados, criado_em)
+               VALUES (?, ?, ?, ?)''',
+            [(f'{grafico}:{loja}:{mes}', assinaturas[(loja, mes)], json.dumps(dados), agora)
+             for (loja, mes), dados in novos]
+        )
+        db.commit()
+        resultado.update(novos)
+    return resultado
+
+
+# ---------------------------------------------------------------------------
+# Cálculo por loja e mês
+# ---------------------------------------------------------------------------
+
+def _loja(loja):
+    """Parâmetro para `c.loja_id IS ?`."""
+    return None if loja == SEM_LOJA else loja
+
+
+def _diario(db, loja, mes):
+    """{data: [horas, registros]} dos registros da loja no mês."""
+    inicio, fim = _limites(mes)
+    return {r['data']: [r['total_horas'], r['total_registros']] for r in db.execute(
+        consultas.EVOLUCAO_DIARIA,
+        (_loja(loja), inicio.isoformat(), fim.isoformat())
+    )}
+
+
+def _mensal(db, loja, mes):
+    """Horas de todos os registros da loja no mês e horas extras (sem justificadas) dos ativos."""
+    inicio, fim = _limites(mes)
+    horas = db.execute(
+        consultas.TOTAIS_MENSAIS,
+        (_loja(loja), inicio.isoformat(), fim.isoformat())
+    ).fetchone()[0]
+    colaboradores = db.execute(
+        'SELECT * FROM colaboradores WHERE loja_id IS ? AND ativo = 1', (_loja(loja),)
+    ).fetchall()
+    extras = 0
+    if colaboradores:
+        motor = MotorHoras(db, get_semana_inicio_fim(inicio)[0], get_semana_inicio_fim(fim)[1],
+                           [c['id'] for c in colaboradores])
+        extras = sum(motor.horas_extras(c, inicio, fim, com_justificadas=False)
+                     for c in colaboradores)
+    return {'horas': horas or 0, 'extras': extras}
+
+
+def _ranking(db, loja, mes):
+    """[(nome, horas)] dos 10 ativos da loja com mais horas no mês."""
+    inicio, fim = _limites(mes)
+    return [(r['nome'], r['total_horas']) for r in db.execute(
+        consultas.RANKING_MES,
+        (_loja(loja), inicio.isoformat(), fim.isoformat())
+    )]
+
+
+# ---------------------------------------------------------------------------
+# Gráficos (lojas=None: todas)
+# ---------------------------------------------------------------------------
+
+def evolucao(db, hoje, lojas=None):
+    """Horas e presenças por dia nos últimos 30 dias (só dias com registro)."""
+    inicio = hoje - timedelta(days=29)
+    meses = meses_do_intervalo(inicio.strftime('%Y-%m'), hoje.strftime('%Y-%m'))
+    partes = _partes(db, lojas)
+    por_dia = defaultdict(lambda: [0, 0])
+    if partes:
+        assinaturas = _assinaturas(db, lojas, partes, {m: [m] for m in meses})
+        for dias in _em_cache(db, 'evolucao', assinaturas, hoje.strftime('%Y-%m'),
+                              lambda loja, mes: _diario(db, loja, mes)).values():
+            for d, (horas, registros) in dias.items():
+                por_dia[d][0] += horas
+                por_dia[d][1] += registros
+    dias = sorted(d for d in por_dia if inicio.isoformat() <= d <= hoje.isoformat())
+    return {
+        'labels': [d[5:] for d in dias],  # MM-DD
+        'horas': [round(por_dia[d][0], 2) for d in dias],
+        'presencas': [por_dia[d][1] for d in dias],
+    }
+
+
+def mensal(db, hoje, lojas=None):
+    """Horas trabalhadas e horas extras dos últimos MESES_GRAFICO meses."""
+    inicio = hoje.replace(day=1)
+    for _ in range(MESES_GRAFICO - 1):
+        inicio = (inicio - timedelta(days=1)).replace(day=1)
+    meses = meses_do_intervalo(inicio.strftime('%Y-%m'), hoje.strftime('%Y-%m'))
+    partes = _partes(db, lojas)
+    totais = defaultdict(lambda: {'horas': 0, 'extras': 0})
+    if partes:
+        # As horas extras são semanais: os meses vizinhos também contam
+        assinaturas = _assinaturas(db, lojas, partes,
+                                   {m: dependencias(m) + [''] for m in meses})
+        for (_, mes), dados in _em_cache(db, 'mensal', assinaturas, hoje.strftime('%Y-%m'),
+                                         lambda loja, mes: _mensal(db, loja, mes)).items():
+            totais[mes]['horas'] += dados['horas']
+            totais[mes]['extras'] += dados['extras']
+    rotulos = []
+    for mes in meses:
+        ano, numero = (int(p) for p in mes.split('-'))
+        rotulos.append(f'{MESES_ABREV[numero - 1]}/{str(ano)[2:]}')
+    return {
+        'labels': rotulos,
+        'horas': [round(totais[m]['horas'], 2) for m in meses],
+        'extras': [round(totais[m]['extras'], 2) for m in meses],
+    }
+
+
+def ranking(db, hoje, lojas=None):
+    """Top 10 de horas no mês atual."""
+    mes = hoje.strftime('%Y-%m')
+    partes = _partes(db, lojas)
+    linhas = []
+    if partes:
+        assinaturas = _assinaturas(db, lojas, partes, {mes: [mes, '']})
+        # O top 10 de várias lojas está entre os top 10 de cada uma
+        for dados in _em_cache(db, 'ranking', assinaturas, mes,
+                               lambda loja, mes: _ranking(db, loja, mes)).values():
+            linhas.extend(dados)
+    linhas = sorted(linhas, key=lambda linha: -linha[1])[:10]
+    return {'nomes': [nome.split()[0] for nome, _ in linhas],  # Primeiro nome
+            'horas': [round(horas, 2) for _, horas in linhas]}
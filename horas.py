@@ -0,0 +1,469 @@
+"""Motor de cálculo de horas (trabalhadas, justificadas e extras).
+
+`MotorHoras` carrega registros e justificativas aprovadas de um período
+inteiro em poucas consultas e responde em memória as perguntas que as
+telas fazem por colaborador, evitando o padrão N+1 de consultas.
+"""
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from calendario import carga_esperada_dia, contar_tipos_dia, get_semana_inicio_fim, tipo_dia
+import consultas
+from escopo import filtro_sql
+from tempo import calcular_horas_lote, para_minutos
+
+
+def calcular_horas_extras_semana(horas_semana, max_horas_semana=40.0):
+    """Calcula horas extras na semana (acima do limite)."""
+    if horas_semana > max_horas_semana:
+        return round(horas_semana - max_horas_semana, 2)
+    return 0.0
+
+
+def calcular_resumo_semana(registros_semana, max_horas_semana=40.0):
+    """Calcula resumo da semana: horas normais, extras, folgas usadas."""
+    horas_total = sum(r['horas_trabalhadas'] for r in registros_semana)
+    dias_trabalhados = len(registros_semana)
+    horas_extras = calcular_horas_extras_semana(horas_total, max_horas_semana)
+    horas_normais = min(horas_total, max_horas_semana)
+    return {
+        'horas_total': round(horas_total, 2),
+        'horas_normais': round(horas_normais, 2),
+        'horas_extras': horas_extras,
+        'dias_trabalhados': dias_trabalhados,
+    }
+
+
+def mesclar_intervalos(intervalos):
+    """Ordena e funde intervalos de datas sobrepostos ou contíguos."""
+    mesclados = []
+    for inicio, fim in sorted(intervalos):
+        if mesclados and inicio <= mesclados[-1][1] + timedelta(days=1):
+            if fim > mesclados[-1][1]:
+                mesclados[-1] = (mesclados[-1][0], fim)
+        else:
+            mesclados.append((inicio, fim))
+    return mesclados
+
+
+def carregar_escalas(db, inicio, fim, colab_id=None, lojas=None):
+    """Escalas de [inicio, fim] numa consulta: {colab_id: {data (date): linha}}.
+
+    `lojas` limita aos colaboradores dessas lojas (escopo do gestor, ver escopo.py).
+    """
+    sql = consultas.ESCALAS_PERIODO
+    params = [inicio.isoformat(), fim.isoformat()]
+    if colab_id is not None:
+        sql += ' AND colaborador_id = ?'
+        params.append(colab_id)
+    if lojas is not None:
+        filtro_loja, params_loja = filtro_sql(lojas)
+        sql += f' AND colaborador_id IN (SELECT c.id FROM colaboradores c WHERE 1 = 1{filtro_loja})'
+        params += params_loja
+    escalas = defaultdict(dict)
+    for e in db.execute(sql, params):
+        escalas[e['colaborador_id']][date.fromisoformat(e['data'])] = e
+    return escalas
+
+
+def _carga_escala(escala, carga_padrao, especial):
+    """Horas previstas por uma escala de trabalho (entrada a saída, menos o almoço).
+
+    Sem os dois horários (ou com horário inválido) vale a carga padrão do dia.
+    """
+    try:
+        entrada = para_minutos(escala['horario_entrada'])
+        saida = para_minutos(escala['horario_saida'])
+    except (ValueError, TypeError):
+        return carga_padrao
+    if entrada is None or saida is None:
+        return carga_padrao
+    minutos = (saida - entrada) % (24 * 60)
+    # Jornada acima de 6h tem intervalo de almoço (o mesmo mínimo do registro de ponto)
+    if minutos > 6 * 60:
+        minutos -= 30 if especial else 60
+    return minutos / 60
+
+
+def calcular_horas_esperadas(colaborador, inicio, fim, db, escalas=None):
+    """Horas esperadas em [inicio, fim] pela escala e, sem ela, pelo calendário.
+
+    Dia com escala vale as horas da escala (0 na folga). Nos demais, dias
+    normais e especiais vêm das somas de prefixo do calendário e as folgas
+    semanais (`folgas_semana` por semana) que a escala não marcou são
+    descontadas pela carga média. `escalas` é {data: linha} do colaborador,
+    de carregar_escalas(); sem ele a escala do período é lida aqui.
+    """
+    if escalas is None:
+        escalas = carregar_escalas(db, inicio, fim, colaborador['id']).get(colaborador['id'], {})
+    normais, especiais = contar_tipos_dia(inicio, fim, db)
+    dias_uteis = normais + especiais
+    horas_calendario = (normais * (colaborador['horas_dia_normal'] or 8.0)
+                        + especiais * (colaborador['horas_dia_especial'] or 6.0))
+
+    horas_escala = 0.0
+    dias_escala = folgas_escala = 0
+    for d, escala in escalas.items():
+        if not inicio <= d <= fim:
+            continue
+        especial = tipo_dia(d, db) == 'especial'
+        carga = ((colaborador['horas_dia_especial'] or 6.0) if especial
+                 else (colaborador['horas_dia_normal'] or 8.0))
+        horas_calendario -= carga
+        dias_escala += 1
+        if escala['folga']:
+            folgas_escala += 1
+        else:
+            horas_escala += _carga_escala(escala, carga, especial)
+
+    dias_livres = dias_uteis - dias_escala
+    folgas = colaborador['folgas_semana'] or 2
+    semanas_periodo = max(1, dias_uteis / 7)
+    folgas_total = round(folgas * semanas_periodo)
+    folgas_restantes = min(max(0, folgas_total - folgas_escala), dias_livres)
+    media_carga = horas_calendario / dias_livres if dias_livres > 0 else 8.0
+    horas_esperadas = horas_escala + horas_calendario - folgas_restantes * media_carga
+    return max(0, round(horas_esperadas, 2))
+
+
+def _somar_horas_justificadas(mesclados, data_inicio, data_fim, colaborador, db):
+    """Soma a carga esperada dos dias cobertos pelos intervalos no período.
+
+    `mesclados` deve vir de mesclar_intervalos(); cada intervalo é resolvido
+    com contagem de domingos/feriados, então o custo depende do número de
+    justificativas e não do número de dias.
+    """
+    horas_normal = colaborador['horas_dia_normal'] or 8.0
+    horas_especial = colaborador['horas_dia_especial'] or 6.0
+    horas = 0.0
+    dias = 0
+    # Primeiro intervalo que pode alcançar data_inicio
+    i = bisect_left(mesclados, (data_inicio,))
+    if i > 0 and mesclados[i - 1][1] >= data_inicio:
+        i -= 1
+    for j_inicio, j_fim in mesclados[i:]:
+        if j_inicio > data_fim:
+            break
+        normais, especiais = contar_tipos_dia(
+            max(j_inicio, data_inicio), min(j_fim, data_fim), db)
+        horas += normais * horas_normal + especiais * horas_especial
+        dias += normais + especiais
+    return round(horas, 2), dias
+
+
+def _intervalos_aprovados(db, colab_id, data_inicio, data_fim):
+    justificativas = db.execute(
+        consultas.JUSTIFICATIVAS_COLABORADOR_PERIODO,
+        (colab_id, data_fim.isoformat(), data_inicio.isoformat())
+    ).fetchall()
+    return mesclar_intervalos(
+        (date.fromisoformat(j['data_inicio']), date.fromisoformat(j['data_fim']))
+        for j in justificativas)
+
+
+def calcular_horas_justificadas(colab_id, data_inicio, data_fim, colaborador, db):
+    """Calcula total de horas justificadas (aprovadas) em um período.
+    Para cada dia coberto por uma justificativa aprovada, soma a carga horária esperada."""
+    mesclados = _intervalos_aprovados(db, colab_id, data_inicio, data_fim)
+    return _somar_horas_justificadas(mesclados, data_inicio, data_fim, colaborador, db)
+
+
+def calcular_horas_justificadas_faixas(colab_id, faixas, colaborador, db):
+    """Horas justificadas de várias faixas (ex.: o mês e cada semana) numa consulta.
+
+    `faixas` é uma lista de (inicio, fim); retorna uma lista de
+    (horas, dias) na mesma ordem.
+    """
+    if not faixas:
+        return []
+    mesclados = _intervalos_aprovados(
+        db, colab_id, min(f[0] for f in faixas), max(f[1] for f in faixas))
+    return [_somar_horas_justificadas(mesclados, inicio, fim, colaborador, db)
+            for inicio, fim in faixas]
+
+
+class MotorHoras:
+    """Agrega as horas de todos os colaboradores de um período em memória.
+
+    São feitas apenas três consultas (registros, justificativas aprovadas e
+    resumo semanal), independentemente do número de colaboradores; todas as
+    consultas posteriores devem cair dentro de [inicio, fim]. Com
+    `colab_ids`, só esses colaboradores são carregados.
+    """
+
+    def __init__(self, db, inicio, fim, colab_ids=None):
+        self.db = db
+        self.inicio = inicio
+        self.fim = fim
+        filtro, ids = '', []
+        if colab_ids is not None:
+            ids = list(colab_ids)
+            filtro = f" AND colaborador_id IN ({','.join('?' * len(ids))})"
+
+        # {colab_id: [(data, horas), ...]} ordenado por data
+        self.registros = defaultdict(list)
+        for r in db.execute(
+            consultas.REGISTROS_PERIODO.format(filtro=filtro),
+            [inicio.isoformat(), fim.isoformat()] + ids
+        ):
+            self.registros[r['colaborador_id']].append(
+                (date.fromisoformat(r['data']), r['horas_trabalhadas'] or 0))
+
+        # {colab_id: [(data_inicio, data_fim), ...]} mesclados e ordenados
+        justificativas = defaultdict(list)
+        for j in db.execute(
+            consultas.JUSTIFICATIVAS_APROVADAS_PERIODO.format(filtro=filtro),
+            [fim.isoformat(), inicio.isoformat()] + ids
+        ):
+            justificativas[j['colaborador_id']].append(
+                (date.fromisoformat(j['data_inicio']), date.fromisoformat(j['data_fim'])))
+        self.justificativas = {cid: mesclar_intervalos(intervalos)
+                               for cid, intervalos in justificativas.items()}
+
+        # {colab_id: {semana_inicio: linha de resumo_semanal}}
+        self.resumos = carregar_resumo_semanal(
+            db, inicio, fim, None if colab_ids is None else ids)
+
+    def _registros(self, colab_id, inicio, fim):
+        return [(d, h) for d, h in self.registros.get(colab_id, ()) if inicio <= d <= fim]
+
+    def horas_trabalhadas(self, colab_id, inicio, fim):
+        """Total de horas trabalhadas de um colaborador no período."""
+        return sum(h for _, h in self._registros(colab_id, inicio, fim))
+
+    def dias_trabalhados(self, colab_id, inicio, fim):
+        """Número de registros de ponto de um colaborador no período."""
+        return len(self._registros(colab_id, inicio, fim))
+
+    def horas_justificadas(self, colaborador, inicio, fim):
+        """Equivalente em memória de calcular_horas_justificadas()."""
+        return _somar_horas_justificadas(
+            self.justificativas.get(colaborador['id'], []), inicio, fim,
+            colaborador, self.db)
+
+    def horas_por_semana(self, colab_id, inicio, fim):
+        """Horas trabalhadas no período agrupadas por domingo de início da semana."""
+        semanas = {}
+        for d, h in self._registros(colab_id, inicio, fim):
+            sem_inicio, _ = get_semana_inicio_fim(d)
+            semanas[sem_inicio] = semanas.get(sem_inicio, 0) + h
+        return semanas
+
+    def horas_extras(self, colaborador, inicio, fim, com_justificadas=True):
+        """Soma das horas extras semanais das semanas com registros no período.
+
+        Com `com_justificadas`, as horas justificadas da semana inteira
+        (domingo a sábado, lidas do resumo semanal) entram no total semanal
+        antes do limite.
+        """
+        max_h = colaborador['max_horas_semana'] or 40.0
+        semanas = self.horas_por_semana(colaborador['id'], inicio, fim)
+        resumos = self.resumos.get(colaborador['id'], {})
+        extras = 0.0
+        for sem_inicio, h in semanas.items():
+            if com_justificadas and sem_inicio in resumos:
+                h += resumos[sem_inicio]['horas_justificadas']
+            extras += calcular_horas_extras_semana(h, max_h)
+        return extras
+
+
+# ---------------------------------------------------------------------------
+# Resumo semanal materializado (tabela resumo_semanal)
+# ---------------------------------------------------------------------------
+
+def _semanas_do_periodo(inicio, fim):
+    """Lista os domingos de início das semanas que cobrem [inicio, fim]."""
+    sem_inicio, _ = get_semana_inicio_fim(inicio)
+    semanas = []
+    while sem_inicio <= fim:
+        semanas.append(sem_inicio)
+        sem_inicio += timedelta(days=7)
+    return semanas
+
+
+def atualizar_resumo_semanal(db, colab_id, inicio, fim=None):
+    """Recalcula as linhas de resumo_semanal das semanas que cobrem [inicio, fim].
+
+    Chamado pelas rotas de escrita, na mesma transação da alteração; o
+    custo é proporcional ao número de semanas afetadas, não ao histórico.
+    Os dias dessas semanas também são regravados no diário do banco de
+    horas (banco_horas_diario).
+    """
+    if fim is None:
+        fim = inicio
+    if fim < inicio:
+        # Justificativas antigas podem ter o intervalo invertido
+        inicio, fim = fim, inicio
+    colaborador = db.execute(
+        'SELECT * FROM colaboradores WHERE id = ?', (colab_id,)
+    ).fetchone()
+    if not colaborador:
+        return
+    semanas = _semanas_do_periodo(inicio, fim)
+    periodo_inicio = semanas[0]
+    periodo_fim = semanas[-1] + timedelta(days=6)
+
+    trabalhadas = defaultdict(lambda: [0.0, 0])
+    diario = defaultdict(lambda: [0.0, 0.0])
+    for r in db.execute(
+        '''SELECT data, horas_trabalhadas FROM registros_ponto
+           WHERE colaborador_id = ? AND data BETWEEN ? AND ?''',
+        (colab_id, periodo_inicio.isoformat(), periodo_fim.isoformat())
+    ):
+        d = date.fromisoformat(r['data'])
+        sem_inicio, _ = get_semana_inicio_fim(d)
+        trabalhadas[sem_inicio][0] += r['horas_trabalhadas'] or 0
+        trabalhadas[sem_inicio][1] += 1
+        diario[d][0] = r['horas_trabalhadas'] or 0
+
+    mesclados = _intervalos_aprovados(db, colab_id, periodo_inicio, periodo_fim)
+    _gravar_diario(db, colaborador, periodo_inicio, periodo_fim, diario, mesclados)
+
+    max_h = colaborador['max_horas_semana'] or 40.0
+    atualizado_em = datetime.now().isoformat(timespec='seconds')
+    for sem_inicio in semanas:
+        horas_trab, dias = trabalhadas.get(sem_inicio, (0.0, 0))
+        hj, _ = _somar_horas_justificadas(
+            mesclados, sem_inicio, sem_inicio + timedelta(days=6), colaborador, db)
+        if not dias and not hj:
+            db.execute(
+                'DELETE FROM resumo_semanal WHERE colaborador_id = ? AND semana_inicio = ?',
+                (colab_id, sem_inicio.isoformat())
+            )
+            continue
+        db.execute(
+            '''INSERT INTO resumo_semanal
+               (colaborador_id, semana_inicio, horas_trabalhadas, horas_justificadas,
+                horas_extras, dias_trabalhados, atualizado_em)
+               VALUES (?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(colaborador_id, semana_inicio) DO UPDATE SET
+                   horas_trabalhadas = excluded.horas_trabalhadas,
+                   horas_justificadas = excluded.horas_justificadas,
+                   horas_extras = excluded.horas_extras,
+                   dias_trabalhados = excluded.dias_trabalhados,
+                   atualizado_em = excluded.atualizado_em''',
+            (colab_id, sem_inicio.isoformat(), round(horas_trab, 2), hj,
+             calcular_horas_extras_semana(horas_trab + hj, max_h), dias, atualizado_em)
+        )
+
+
+def _gravar_diario(db, colaborador, inicio, fim, diario, mesclados):
+    """Regrava o diário do banco de horas em [inicio, fim].
+
+    `diario` traz as horas trabalhadas por dia; as justificadas (carga do
+    dia coberto por justificativa aprovada) são somadas aqui.
+    """
+    for j_inicio, j_fim in mesclados:
+        d = max(j_inicio, inicio)
+        while d <= min(j_fim, fim):
+            diario[d][1] = carga_esperada_dia(d, colaborador, db)
+            d += timedelta(days=1)
+    db.execute(
+        'DELETE FROM banco_horas_diario WHERE colaborador_id = ? AND data BETWEEN ? AND ?',
+        (colaborador['id'], inicio.isoformat(), fim.isoformat())
+    )
+    db.executemany(
+        '''INSERT INTO banco_horas_diario
+           (colaborador_id, data, horas_trabalhadas, horas_justificadas)
+           VALUES (?, ?, ?, ?)''',
+        [(colaborador['id'], d.isoformat(), trab, just)
+         for d, (trab, just) in sorted(diario.items()) if trab or just]
+    )
+
+
+def atualizar_resumo_feriado(db, data_iso):
+    """Recalcula a semana de um feriado alterado para quem tinha justificativa nela."""
+    try:
+        d = date.fromisoformat(data_iso)
+    except (ValueError, TypeError):
+        return
+    for j in db.execute(consultas.JUSTIFICADOS_DIA, (data_iso, data_iso)).fetchall():
+        atualizar_resumo_semanal(db, j['colaborador_id'], d)
+
+
+def reconstruir_resumo_semanal(db, colab_id=None):
+    """Reconstrói resumo_semanal, o diário e o saldo do banco de horas do zero (backfill).
+
+    Retorna o nº de colaboradores.
+    """
+    if colab_id is None:
+        ids = [r['id'] for r in db.execute('SELECT id FROM colaboradores')]
+    else:
+        ids = [colab_id]
+    for cid in ids:
+        db.execute('DELETE FROM resumo_semanal WHERE colaborador_id = ?', (cid,))
+        db.execute('DELETE FROM banco_horas_diario WHERE colaborador_id = ?', (cid,))
+        db.execute(
+            '''UPDATE colaboradores SET saldo_banco = (
+                   SELECT COALESCE(SUM(saldo), 0) FROM banco_horas
+                   WHERE colaborador_id = ? AND fechado = 1)
+               WHERE id = ?''',
+            (cid, cid)
+        )
+        limites = db.execute(
+            '''SELECT MIN(inicio) AS inicio, MAX(fim) AS fim FROM (
+                   SELECT MIN(data) AS inicio, MAX(data) AS fim
+                   FROM registros_ponto WHERE colaborador_id = ?
+                   UNION ALL
+                   SELECT MIN(data_inicio), MAX(data_fim)
+                   FROM justificativas WHERE colaborador_id = ? AND status = 'aprovado'
+               )''',
+            (cid, cid)
+        ).fetchone()
+        if limites['inicio']:
+            atualizar_resumo_semanal(db, cid, date.fromisoformat(limites['inicio']),
+                                     date.fromisoformat(limites['fim']))
+    return len(ids)
+
+
+def carregar_resumo_semanal(db, inicio, fim, colab_ids=None):
+    """Lê resumo_semanal das semanas que cobrem [inicio, fim].
+
+    Com `colab_ids`, só desses colaboradores. Retorna
+    {colab_id: {semana_inicio (date): linha}}.
+    """
+    sem_inicio, _ = get_semana_inicio_fim(inicio)
+    sql = '''SELECT * FROM resumo_semanal
+             WHERE semana_inicio BETWEEN ? AND ?'''
+    params = [sem_inicio.isoformat(), fim.isoformat()]
+    if colab_ids is not None:
+        ids = list(colab_ids)
+        sql += f" AND colaborador_id IN ({','.join('?' * len(ids))})"
+        params += ids
+    resumos = defaultdict(dict)
+    for r in db.execute(sql, params):
+        resumos[r['colaborador_id']][date.fromisoformat(r['semana_inicio'])] = r
+    return resumos
+
+
+def recalcular_horas(db, inicio, fim):
+    """Recalcula em lote horas_trabalhadas dos registros fechados no período.
+
+    Usa a aritmética vetorizada de tempo.calcular_horas_lote, grava só as
+    linhas que mudaram (executemany) e atualiza o resumo semanal delas.
+    Retorna (registros lidos, registros alterados).
+    """
+    registros = db.execute(
+        '''SELECT id, colaborador_id, data, entrada, saida_almoco, retorno_almoco,
+                  saida, horas_trabalhadas
+           FROM registros_ponto
+           WHERE data BETWEEN ? AND ? AND saida IS NOT NULL AND saida != '' ''',
+        (inicio.isoformat(), fim.isoformat())
+    ).fetchall()
+    horas = calcular_horas_lote(registros)
+
+    alterados = []
+    periodos = {}
+    for r, h in zip(registros, horas):
+        if h == r['horas_trabalhadas']:
+            continue
+        alterados.append((h, r['id']))
+        d = date.fromisoformat(r['data'])
+        p_inicio, p_fim = periodos.get(r['colaborador_id'], (d, d))
+        periodos[r['colaborador_id']] = (min(p_inicio, d), max(p_fim, d))
+
+    db.executemany('UPDATE registros_ponto SET horas_trabalhadas = ? WHERE id = ?', alterados)
+    for colab_id, (p_inicio, p_fim) in periodos.items():
+        atualizar_resumo_semanal(db, colab_id, p_inicio, p_fim)
+    return len(registros), len(alterados)
@@ -0,0 +1,117 @@
+"""Instrumentação das consultas SQL por requisição.
+
+Toda consulta feita pela conexão de get_db() (Conexao.execute,
+executemany e executescript) é contada e cronometrada dentro do app
+context; as mais lentas ficam guardadas com o SQL normalizado (literais
+trocados por ?), para agrupar a mesma consulta com parâmetros diferentes.
+
+Ao fim da requisição os totais vão no cabeçalho `Server-Timing` (visível
+na aba Network do navegador). Com SQL_TOOLBAR=1 (ou app.debug) o
+base.html mostra uma barra com as consultas da página, e com
+SQL_LENTO_MS=<ms> as consultas acima do limite são gravadas em
+DATA_DIR/sql_lento.log.
+
+O tempo medido é o do execute(): para SELECTs lidos aos poucos, a
+leitura das linhas depois da primeira não entra na conta.
+"""
+import logging
+import os
+import re
+import time
+
+from flask import g, has_app_context, request
+
+import models
+
+# Quantas consultas mais lentas guardar por requisição
+MAIS_LENTAS = 5
+LENTO_MS = float(os.environ.get('SQL_LENTO_MS', 0))
+ARQUIVO_LENTO = os.path.join(models.DATA_DIR, 'sql_lento.log')
+
+_LITERAIS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTAS = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_ESPACOS = re.compile(r'\s+')
+
+log_lento = logging.getLogger('ponto.sql_lento')
+
+
+def normalizar(sql):
+    """SQL numa linha, com literais e listas IN (?, ?, ...) trocados por ?."""
+    sql = _LITERAIS.sub('?', sql)
+    sql = _LISTAS.sub('(?...)', sql)
+    return _ESPACOS.sub(' ', sql).strip()
+
+
+class MedicaoSQL:
+    """Consultas de uma requisição: total, tempo e as mais lentas."""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.tempo = 0.0
+        self.lentas = []   # [(segundos, sql)], decrescente
+
+    def registrar(self, sql, segundos):
+        self.consultas += 1
+        self.tempo += segundos
+        if len(self.lentas) < MAIS_LENTAS or segundos > self.lentas[-1][0]:
+            self.lentas.append((segundos, sql))
+            self.lentas.sort(key=lambda item: item[0], reverse=True)
+            del self.lentas[MAIS_LENTAS:]
+
+    def mais_lentas(self):
+        """[(ms, sql normalizado)] das consultas mais lentas."""
+        return [(segundos * 1000, normalizar(sql)) for segundos, sql in self.lentas]
+
+    def server_timing(self):
+        total_ms = (time.perf_counter() - self.inicio) * 1000
+        return (f'db;dur={self.tempo * 1000:.1f};desc="{self.consultas} consultas", '
+                f'app;dur={total_ms:.1f}')
+
+
+def _observar(sql, segundos):
+    """Chamado pela Conexao a cada consulta (ver models.Conexao.observador)."""
+    if not has_app_context():
+        return
+    medicao = g.get('medicao_sql')
+    if medicao is not None:
+        medicao.registrar(sql, segundos)
+    if LENTO_MS and segundos * 1000 >= LENTO_MS:
+        log_lento.warning('%.1fms %s %s', segundos * 1000,
+                          request.endpoint if request else '-', normalizar(sql))
+
+
+def _iniciar():
+    g.medicao_sql = MedicaoSQL()
+
+
+def _finalizar(resposta):
+    medicao = g.get('medicao_sql')
+    if medicao is not None:
+        resposta.headers.add('Server-Timing', medicao.server_timing())
+    return resposta
+
+
+def medicao_atual():
+    """Medição da requisição em andamento (para a barra de depuração) ou None."""
+    return g.get('medicao_sql') if has_app_context() else None
+
+
+def init_app(app):
+    """Liga a instrumentação ao app: medição por requisição, cabeçalho e log."""
+    app.config.setdefault('SQL_TOOLBAR', os.environ.get('SQL_TOOLBAR') == '1')
+    models.Conexao.observador = staticmethod(_observar)
+    app.before_request(_iniciar)
+    app.after_request(_finalizar)
+
+    if LENTO_MS and not log_lento.handlers:
+        handler = logging.FileHandler(ARQUIVO_LENTO, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        log_lento.addHandler(handler)
+        log_lento.setLevel(logging.WARNING)
+        log_lento.propagate = False
+
+    @app.context_processor
+    def injetar_medicao():
+        mostrar = app.config['SQL_TOOLBAR'] or app.debug
+        return {'medicao_sql': medicao_atual() if mostrar else None}
@@ -0,0 +1,212 @@
+"""Fila local de jobs para geração de relatórios (PDF/Excel).
+
+Os pedidos ficam na tabela `jobs` do próprio SQLite, então não há broker
+externo: qualquer processo do gunicorn pode enfileirar, e as threads
+worker de cada processo disputam os jobs pendentes com um UPDATE atômico.
+Cada progresso renova o heartbeat do job; um job sem heartbeat há
+TEMPO_MAXIMO é de um worker que morreu e volta à fila (até
+JOBS_TENTATIVAS reservas, depois vai para erro).
+O arquivo gerado vai para o cache de relatórios (cache_relatorios.py): o
+job guarda só a chave, e um pedido cujo relatório já está no cache nasce
+concluído.
+
+Threads worker por processo: JOBS_WORKERS (padrão 1; 0 desliga e deixa o
+trabalho para `flask --app app processar-jobs`). Elas sobem na primeira
+requisição de cada processo (init_app), de modo que jobs pendentes ou
+travados de antes de um deploy são retomados sem esperar um novo pedido.
+"""
+import json
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+import cache_relatorios
+import consultas
+from exportacao import TIPOS
+from models import get_db
+
+PENDENTE = 'pendente'
+PROCESSANDO = 'processando'
+CONCLUIDO = 'concluido'
+ERRO = 'erro'
+
+WORKERS = int(os.environ.get('JOBS_WORKERS', 1))
+INTERVALO_POLL = 2.0
+# Job "processando" sem heartbeat (progresso) há mais tempo que isso é de
+# um worker que morreu; depois de MAX_TENTATIVAS reservas ele vai para erro
+TEMPO_MAXIMO = timedelta(minutes=15)
+MAX_TENTATIVAS = int(os.environ.get('JOBS_TENTATIVAS', 3))
+RETENCAO = timedelta(hours=int(os.environ.get('JOBS_RETENCAO_HORAS', 24)))
+
+
+def _agora():
+    return datetime.now().isoformat(timespec='microseconds')
+
+
+# ---------------------------------------------------------------------------
+# Fila
+# ---------------------------------------------------------------------------
+
+class FilaJobs:
+    """Workers em threads que consomem a tabela `jobs`."""
+
+    def __init__(self, workers=WORKERS):
+        self.workers = workers
+        self._evento = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def enfileirar(self, db, tipo, parametros, solicitado_por=None):
+        """Registra (e grava) um job e acorda os workers.
+
+        Se o relatório já estiver no cache, o job é criado concluído.
+        """
+        if tipo not in TIPOS:
+            raise ValueError(f'tipo de job desconhecido: {tipo}')
+        job_id = uuid.uuid4().hex
+        item = cache_relatorios.obter(db, cache_relatorios.chave(db, tipo, parametros))
+        if item is not None:
+            db.execute(
+                '''INSERT INTO jobs (id, tipo, parametros, status, progresso, solicitado_por,
+                                     chave, nome_arquivo, mimetype, criado_em, concluido_em)
+                   VALUES (?, ?, ?, ?, 100, ?, ?, ?, ?, ?, ?)''',
+                (job_id, tipo, json.dumps(parametros), CONCLUIDO, solicitado_por,
+                 item['chave'], item['nome_arquivo'], item['mimetype'], _agora(), _agora())
+            )
+            db.commit()
+            return job_id
+        db.execute(
+            '''INSERT INTO jobs (id, tipo, parametros, status, solicitado_por, criado_em)
+               VALUES (?, ?, ?, ?, ?, ?)''',
+            (job_id, tipo, json.dumps(parametros), PENDENTE, solicitado_por, _agora())
+        )
+        db.commit()
+        self.iniciar()
+        self._evento.set()
+        return job_id
+
+    def iniciar(self):
+        """Sobe as threads worker deste processo (uma vez por processo)."""
+        if self.workers <= 0 or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            for n in range(self.workers):
+                threading.Thread(target=self.executar, name=f'jobs-{n}', daemon=True).start()
+
+    def executar(self):
+        """Loop de um worker: processa jobs pendentes até o processo terminar."""
+        db = get_db()
+        self.recuperar_travados(db)
+        ciclos = 0
+        while True:
+            try:
+                self._evento.clear()
+                if not self.processar_proximo(db):
+                    ciclos += 1
+                    if ciclos % 450 == 0:   # ~15 min ocioso
+                        self.recuperar_travados(db)
+                    if ciclos % 900 == 0:   # ~30 min ocioso
+                        self.limpar(db)
+                    self._evento.wait(INTERVALO_POLL)
+            except Exception:
+                # Erro de infraestrutura (banco travado, disco cheio): tenta de novo
+                if db.in_transaction:
+                    db.rollback()
+                self._evento.wait(INTERVALO_POLL)
+
+    def _reservar(self, db):
+        """Marca o job pendente mais antigo como 'processando' e o retorna."""
+        agora = _agora()
+        job = db.execute(
+            consultas.RESERVAR_JOB,
+            (PROCESSANDO, agora, agora, PENDENTE, PENDENTE)
+        ).fetchone()
+        db.commit()
+        return job
+
+    def processar_proximo(self, db):
+        """Executa um job pendente, se houver. Retorna False se a fila estiver vazia."""
+        job = self._reservar(db)
+        if job is None:
+            return False
+        # Só a reserva atual grava no job: se ele foi dado como travado e
+        # reservado de novo, este worker não sobrescreve o novo dono
+        reserva = (job['id'], PROCESSANDO, job['tentativas'])
+
+        def progresso(pct):
+            db.execute(
+                '''UPDATE jobs SET progresso = ?, heartbeat = ?
+                   WHERE id = ? AND status = ? AND tentativas = ?''',
+                (max(0, min(99, int(pct))), _agora()) + reserva)
+            db.commit()
+
+        try:
+            item = cache_relatorios.gerar(
+                db, job['tipo'], json.loads(job['parametros']), progresso)
+        except Exception as e:
+            if db.in_transaction:
+                db.rollback()
+            db.execute(
+                '''UPDATE jobs SET status = ?, erro = ?, concluido_em = ?
+                   WHERE id = ? AND status = ? AND tentativas = ?''',
+                (ERRO, f'{type(e).__name__}: {e}'[:500], _agora()) + reserva
+            )
+        else:
+            db.execute(
+                '''UPDATE jobs SET status = ?, progresso = 100, chave = ?, nome_arquivo = ?,
+                   mimetype = ?, concluido_em = ?
+                   WHERE id = ? AND status = ? AND tentativas = ?''',
+                (CONCLUIDO, item['chave'], item['nome_arquivo'], item['mimetype'],
+                 _agora()) + reserva
+            )
+        db.commit()
+        return True
+
+    def recuperar_travados(self, db):
+        """Trata jobs presos em 'processando' por um worker que morreu.
+
+        Sem heartbeat há TEMPO_MAXIMO, o job volta à fila; se já foi
+        reservado MAX_TENTATIVAS vezes, vai para erro.
+        """
+        limite = (datetime.now() - TEMPO_MAXIMO).isoformat(timespec='microseconds')
+        db.execute(
+            '''UPDATE jobs SET status = ?, erro = ?, concluido_em = ?
+               WHERE status = ? AND heartbeat < ? AND tentativas >= ?''',
+            (ERRO, f'Processamento interrompido {MAX_TENTATIVAS} vezes.', _agora(),
+             PROCESSANDO, limite, MAX_TENTATIVAS)
+        )
+        db.execute(
+            'UPDATE jobs SET status = ? WHERE status = ? AND heartbeat < ?',
+            (PENDENTE, PROCESSANDO, limite)
+        )
+        db.commit()
+
+    def limpar(self, db):
+        """Remove jobs finalizados mais antigos que a retenção (o arquivo fica no cache)."""
+        limite = (datetime.now() - RETENCAO).isoformat(timespec='microseconds')
+        removidos = db.execute(
+            'DELETE FROM jobs WHERE status IN (?, ?) AND concluido_em < ?',
+            (CONCLUIDO, ERRO, limite)
+        ).rowcount
+        db.commit()
+        return removidos
+
+
+fila = FilaJobs()
+
+
+def init_app(app):
+    """Sobe os workers na primeira requisição de cada processo.
+
+    No import o processo ainda pode ser o mestre do gunicorn (--preload),
+    e threads não sobrevivem ao fork; iniciar() confere o pid.
+    """
+    app.before_request(fila.iniciar)
+
+
+def obter_job(db, job_id):
+    return db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
@@ -0,0 +1,190 @@
+"""Métricas de latência por rota, compartilhadas entre os workers do gunicorn.
+
+Cada requisição alimenta três histogramas do seu endpoint: latência total,
+tempo em consultas SQL (da instrumentacao.py) e tempo renderizando
+templates. Os histogramas ficam num arquivo mapeado em memória (mmap) em
+DATA_DIR, um bloco fixo por endpoint, então todos os workers somam nos
+mesmos contadores; as escritas são serializadas com flock.
+
+O arquivo leva no nome um hash dos endpoints e das faixas: uma versão
+nova do app com outras rotas começa um arquivo novo em vez de ler um
+layout diferente. /metrics expõe tudo no formato texto do Prometheus;
+p50/p95/p99 saem de histogram_quantile() sobre as faixas.
+"""
+import hashlib
+import hmac
+import mmap
+import os
+import struct
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows (desenvolvimento): agrega só dentro do processo
+    fcntl = None
+
+from flask import before_render_template, g, request, template_rendered
+
+import instrumentacao
+from models import DATA_DIR
+
+# Limites superiores das faixas, em segundos (a última faixa é +Inf)
+FAIXAS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SERIES = (
+    ('ponto_requisicao_segundos', 'Latência das requisições por endpoint.'),
+    ('ponto_db_segundos', 'Tempo em consultas SQL por requisição.'),
+    ('ponto_template_segundos', 'Tempo renderizando templates por requisição.'),
+)
+# Sempre expostos, mesmo sem requisições ainda
+VIGIADOS = ('registrar_ponto', 'meu_ponto', 'dashboard', 'exportar_pdf')
+# Requisições sem endpoint (404) ou de rotas desconhecidas
+OUTROS = '_outros'
+
+# Por série: uma contagem (uint64) por faixa, mais +Inf, e a soma (double)
+_CAMPOS = len(FAIXAS) + 2
+_TAM_SERIE = _CAMPOS * 8
+
+
+class HistogramasCompartilhados:
+    """Histogramas de todos os endpoints num arquivo mmap."""
+
+    def __init__(self, caminho, endpoints):
+        self.endpoints = sorted(set(endpoints)) + [OUTROS]
+        self.indice = {e: i for i, e in enumerate(self.endpoints)}
+        tamanho = len(self.endpoints) * len(SERIES) * _TAM_SERIE
+        self._lock = threading.Lock()
+        self._fd = os.open(caminho, os.O_RDWR | os.O_CREAT, 0o644)
+        with self._travado():
+            if os.fstat(self._fd).st_size < tamanho:
+                os.ftruncate(self._fd, tamanho)
+        self._mm = mmap.mmap(self._fd, tamanho)
+
+    @contextmanager
+    def _travado(self):
+        # flock vale entre processos; threads do mesmo worker usam o lock
+        with self._lock:
+            if fcntl:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def observar(self, endpoint, valores):
+        """Soma uma requisição: `valores` tem um número por série, em segundos."""
+        slot = self.indice.get(endpoint, self.indice[OUTROS])
+        with self._travado():
+            for serie, valor in enumerate(valores):
+                base = (slot * len(SERIES) + serie) * _TAM_SERIE
+                pos = base + bisect_left(FAIXAS, valor) * 8
+                contagem, = struct.unpack_from('Q', self._mm, pos)
+                struct.pack_into('Q', self._mm, pos, contagem + 1)
+                pos = base + (_CAMPOS - 1) * 8
+                soma, = struct.unpack_from('d', self._mm, pos)
+                struct.pack_into('d', self._mm, pos, soma + valor)
+
+    def ler(self):
+        """{endpoint: [(contagens por faixa, soma) por série]} dos endpoints usados."""
+        with self._travado():
+            dados = bytes(self._mm)
+        resultado = {}
+        for slot, endpoint in enumerate(self.endpoints):
+            series = []
+            for serie in range(len(SERIES)):
+                base = (slot * len(SERIES) + serie) * _TAM_SERIE
+                contagens = struct.unpack_from(f'{_CAMPOS - 1}Q', dados, base)
+                soma, = struct.unpack_from('d', dados, base + (_CAMPOS - 1) * 8)
+                series.append((contagens, soma))
+            if sum(series[0][0]) or endpoint in VIGIADOS:
+                resultado[endpoint] = series
+        return resultado
+
+
+def texto_prometheus(histogramas):
+    """Histogramas no formato texto de exposição do Prometheus."""
+    dados = histogramas.ler()
+    linhas = []
+    for serie, (nome, ajuda) in enumerate(SERIES):
+        linhas.append(f'# HELP {nome} {ajuda}')
+        linhas.append(f'# TYPE {nome} histogram')
+        for endpoint, series in sorted(dados.items()):
+            contagens, soma = series[serie]
+            acumulado = 0
+            for limite, contagem in zip(FAIXAS + (None,), contagens):
+                acumulado += contagem
+                le = '+Inf' if limite is None else repr(limite)
+                linhas.append(f'{nome}_bucket{{endpoint="{endpoint}",le="{le}"}} {acumulado}')
+            linhas.append(f'{nome}_sum{{endpoint="{endpoint}"}} {soma!r}')
+            linhas.append(f'{nome}_count{{endpoint="{endpoint}"}} {acumulado}')
+    return '\n'.join(linhas) + '\n'
+
+
+# ---------------------------------------------------------------------------
+# Integração com o Flask
+# ---------------------------------------------------------------------------
+
+_histogramas = None
+_lock_criacao = threading.Lock()
+
+
+def histogramas(app):
+    """Histogramas do processo, criados na primeira requisição (após o fork
+    e com todas as rotas já registradas)."""
+    global _histogramas
+    if _histogramas is None:
+        with _lock_criacao:
+            if _histogramas is None:
+                endpoints = sorted(app.view_functions)
+                layout = repr((endpoints, FAIXAS, SERIES)).encode()
+                nome = f'metricas-{hashlib.sha1(layout).hexdigest()[:12]}.mmap'
+                _histogramas = HistogramasCompartilhados(
+                    os.path.join(DATA_DIR, nome), endpoints)
+    return _histogramas
+
+
+def _inicio_requisicao():
+    g.metricas_inicio = time.perf_counter()
+    g.metricas_template = 0.0
+
+
+def _inicio_template(sender, template, context, **extra):
+    g.metricas_template_inicio = time.perf_counter()
+
+
+def _fim_template(sender, template, context, **extra):
+    inicio = g.pop('metricas_template_inicio', None)
+    if inicio is not None:
+        g.metricas_template = g.get('metricas_template', 0.0) + time.perf_counter() - inicio
+
+
+def acesso_permitido(token_configurado):
+    """/metrics: com token configurado, exige 'Authorization: Bearer <token>';
+    sem ele, só aceita chamadas diretas de localhost (não via proxy)."""
+    if token_configurado:
+        enviado = request.headers.get('Authorization', '').encode()
+        return hmac.compare_digest(enviado, f'Bearer {token_configurado}'.encode())
+    return (request.remote_addr in ('127.0.0.1', '::1')
+            and 'X-Forwarded-For' not in request.headers)
+
+
+def init_app(app):
+    """Registra os ganchos que alimentam os histogramas."""
+    def registrar(exc=None):
+        inicio = g.pop('metricas_inicio', None)
+        if inicio is None:
+            return
+        medicao = instrumentacao.medicao_atual()
+        histogramas(app).observar(request.endpoint or OUTROS, (
+            time.perf_counter() - inicio,
+            medicao.tempo if medicao else 0.0,
+            g.get('metricas_template', 0.0),
+        ))
+
+    app.before_request(_inicio_requisicao)
+    app.teardown_request(registrar)
+    before_render_template.connect(_inicio_template, app)
+    template_rendered.connect(_fim_template, app)
@@ -1,19 +1,329 @@
 import sqlite3
 import os
+import queue
+import threading
+import time
 from datetime import datetime, date
 
+from flask import g, has_app_context
+
+import consultas
+from escopo import filtro_sql
+
 DATA_DIR = os.environ.get('DATA_DIR', os.path.dirname(os.path.abspath(__file__)))
 DB_PATH = os.path.join(DATA_DIR, 'ponto.db')
 
+# Pool de conexões por worker (gunicorn faz fork: cada processo tem o seu)
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+BUSY_TIMEOUT_MS = 5000
 
-def get_db():
-    """Get a database connection."""
-    conn = sqlite3.connect(DB_PATH)
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}",
+    "PRAGMA mmap_size = 67108864",   # 64 MB
+    "PRAGMA cache_size = -8000",     # ~8 MB
+    "PRAGMA foreign_keys = ON",
+)
+
+
+class Conexao(sqlite3.Connection):
+    """Conexão SQLite que pode pertencer ao pool.
+
+    Enquanto estiver emprestada a uma requisição, close() não fecha de fato:
+    a conexão volta ao pool no teardown do app context. Se houver um
+    `observador` (ver instrumentacao.py), cada consulta é cronometrada e
+    repassada a ele.
+    """
+    em_pool = False
+    observador = None
+
+    def _medir(self, metodo, sql, *args):
+        if self.observador is None:
+            return metodo(sql, *args)
+        inicio = time.perf_counter()
+        try:
+            return metodo(sql, *args)
+        finally:
+            self.observador(sql, time.perf_counter() - inicio)
+
+    def execute(self, sql, *args):
+        return self._medir(super().execute, sql, *args)
+
+    def executemany(self, sql, *args):
+        return self._medir(super().executemany, sql, *args)
+
+    def executescript(self, sql):
+        return self._medir(super().executescript, sql)
+
+    def close(self):
+        if self.em_pool:
+            return
+        super().close()
+
+    def fechar(self):
+        """Fecha a conexão de verdade (usado pelo pool)."""
+        super().close()
+
+
+def _abrir_conexao():
+    conn = sqlite3.connect(DB_PATH, factory=Conexao, check_same_thread=False,
+                           timeout=BUSY_TIMEOUT_MS / 1000)
     conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON")
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
     return conn
 
 
+class PoolConexoes:
+    """Pool LIFO de conexões já configuradas, recriado após fork."""
+
+    def __init__(self, tamanho=POOL_SIZE):
+        self.tamanho = tamanho
+        self._pid = os.getpid()
+        self._fila = queue.LifoQueue(maxsize=tamanho)
+        self._lock = threading.Lock()
+
+    def _verificar_fork(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # Conexões herdadas do processo pai não podem ser reusadas
+                    self._fila = queue.LifoQueue(maxsize=self.tamanho)
+                    self._pid = os.getpid()
+
+    def obter(self):
+        self._verificar_fork()
+        try:
+            conn = self._fila.get_nowait()
+        except queue.Empty:
+            conn = _abrir_conexao()
+        conn.em_pool = True
+        return conn
+
+    def devolver(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._fila.put_nowait(conn)
+        except queue.Full:
+            conn.fechar()
+
+    def fechar_todas(self):
+        while True:
+            try:
+                self._fila.get_nowait().fechar()
+            except queue.Empty:
+                break
+
+
+pool = PoolConexoes()
+
+
+def get_db():
+    """Get a database connection.
+
+    Inside a Flask app context the same pooled connection is shared for the
+    whole request and released on teardown; outside of it (init_db, scripts)
+    a fresh configured connection is returned and the caller must close it.
+    """
+    if not has_app_context():
+        return _abrir_conexao()
+    if 'db' not in g:
+        g.db = pool.obter()
+    return g.db
+
+
+def liberar_db(exc=None):
+    """Devolve a conexão da requisição ao pool (teardown)."""
+    conn = g.pop('db', None)
+    if conn is not None:
+        pool.devolver(conn)
+
+
+def init_app(app):
+    """Registra o pool de conexões no app Flask."""
+    app.teardown_appcontext(liberar_db)
+
+
+# ---------------------------------------------------------------------------
+# Migrações versionadas (PRAGMA user_version)
+# ---------------------------------------------------------------------------
+
+# Cada entrada: (versão, [comandos SQL]). Aplicadas em ordem, uma única vez.
+MIGRACOES = [
+    (1, [
+        # Dashboard (registros de hoje, evolução diária, comparativo mensal)
+        'CREATE INDEX IF NOT EXISTS idx_registros_data_colab '
+        'ON registros_ponto(data, colaborador_id)',
+        # Horas justificadas por colaborador e período
+        'CREATE INDEX IF NOT EXISTS idx_justificativas_colab_status_periodo '
+        'ON justificativas(colaborador_id, status, data_inicio, data_fim)',
+        # Justificativas pendentes / aprovadas de todos no período
+        'CREATE INDEX IF NOT EXISTS idx_justificativas_status_inicio '
+        'ON justificativas(status, data_inicio)',
+        'CREATE INDEX IF NOT EXISTS idx_justificativas_status_registro '
+        'ON justificativas(status, data_registro)',
+        # Histórico de edições de um registro
+        'CREATE INDEX IF NOT EXISTS idx_historico_registro_data '
+        'ON historico_edicoes(registro_id, data_edicao)',
+        # Escalas do dia / da semana de todos os colaboradores
+        'CREATE INDEX IF NOT EXISTS idx_escalas_data '
+        'ON escalas(data)',
+        # Saldo acumulado de meses fechados
+        'CREATE INDEX IF NOT EXISTS idx_banco_horas_colab_fechado '
+        'ON banco_horas(colaborador_id, fechado, saldo)',
+    ]),
+    (2, [
+        # Resumo semanal de todos os colaboradores (dashboard)
+        'CREATE INDEX IF NOT EXISTS idx_resumo_semanal_semana '
+        'ON resumo_semanal(semana_inicio, colaborador_id)',
+    ]),
+    (3, [
+        # Próximo job pendente (workers) e limpeza de jobs finalizados
+        'CREATE INDEX IF NOT EXISTS idx_jobs_status_criado '
+        'ON jobs(status, criado_em)',
+    ]),
+    (4, [
+        # Remoção LRU do cache de relatórios
+        'CREATE INDEX IF NOT EXISTS idx_cache_relatorios_acesso '
+        'ON cache_relatorios(acessado_em)',
+    ]),
+    (5, [
+        # Diário do banco de horas de todos os colaboradores no mês
+        'CREATE INDEX IF NOT EXISTS idx_banco_horas_diario_data '
+        'ON banco_horas_diario(data, colaborador_id)',
+    ]),
+    (6, [
+        # Telas de gestor por loja: colaboradores da loja, e a partir deles
+        # os registros, escalas e versões de cada um
+        'CREATE INDEX IF NOT EXISTS idx_colaboradores_loja_ativo '
+        'ON colaboradores(loja_id, ativo, nome)',
+        # Quem gerencia uma loja (remoção da loja)
+        'CREATE INDEX IF NOT EXISTS idx_gestor_lojas_loja '
+        'ON gestor_lojas(loja_id)',
+    ]),
+]
+
+
+def _aplicar_migracoes(cursor):
+    """Aplica as migrações com versão maior que PRAGMA user_version.
+
+    Retorna o conjunto de versões aplicadas nesta chamada.
+    """
+    versao_atual = cursor.execute('PRAGMA user_version').fetchone()[0]
+    aplicadas = set()
+    for versao, comandos in MIGRACOES:
+        if versao <= versao_atual:
+            continue
+        for sql in comandos:
+            cursor.execute(sql)
+        cursor.execute(f'PRAGMA user_version = {versao}')
+        aplicadas.add(versao)
+    return aplicadas
+
+
+# Consultas conferidas por verificar_planos(): os textos vêm de consultas.py,
+# os mesmos executados pelo código. As que recebem o escopo de lojas ou uma
+# lista de colaboradores são conferidas com e sem o filtro.
+_LOJAS, _PARAMS_LOJAS = filtro_sql((1, 2))
+_COLABORADORES = ' AND colaborador_id IN (?,?)'
+_MES = ('2026-01-01', '2026-01-31')
+
+CONSULTAS_CRITICAS = {
+    'registros_hoje': (
+        consultas.REGISTROS_HOJE.format(filtro_loja=''), ('2026-01-01',)),
+    'registros_hoje_loja': (
+        consultas.REGISTROS_HOJE.format(filtro_loja=_LOJAS), ['2026-01-01'] + _PARAMS_LOJAS),
+    'registros_colaborador_periodo': (
+        consultas.REGISTROS_COLABORADOR_PERIODO, (1,) + _MES),
+    'registros_periodo': (
+        consultas.REGISTROS_PERIODO.format(filtro=''), _MES),
+    'registros_periodo_colaboradores': (
+        consultas.REGISTROS_PERIODO.format(filtro=_COLABORADORES), _MES + (1, 2)),
+    'historico_registro': (consultas.HISTORICO_REGISTRO, (1,)),
+    'justificativas_colaborador_periodo': (
+        consultas.JUSTIFICATIVAS_COLABORADOR_PERIODO, (1, '2026-01-31', '2026-01-01')),
+    'justificativas_aprovadas_periodo': (
+        consultas.JUSTIFICATIVAS_APROVADAS_PERIODO.format(filtro=''),
+        ('2026-01-31', '2026-01-01')),
+    'justificativas_aprovadas_colaboradores': (
+        consultas.JUSTIFICATIVAS_APROVADAS_PERIODO.format(filtro=_COLABORADORES),
+        ('2026-01-31', '2026-01-01', 1, 2)),
+    'justificativas_pendentes': (
+        consultas.JUSTIFICATIVAS_PENDENTES.format(filtro_loja=''), ()),
+    'justificativas_pendentes_loja': (
+        consultas.JUSTIFICATIVAS_PENDENTES.format(filtro_loja=_LOJAS), _PARAMS_LOJAS),
+    'justificados_dia': (consultas.JUSTIFICADOS_DIA, ('2026-01-01', '2026-01-01')),
+    'colaboradores_ativos_loja': (
+        consultas.COLABORADORES_ATIVOS.format(filtro_loja=_LOJAS), _PARAMS_LOJAS),
+    'escalas_hoje': (consultas.ESCALAS_HOJE.format(filtro_loja=''), ('2026-01-01',)),
+    'escalas_hoje_loja': (
+        consultas.ESCALAS_HOJE.format(filtro_loja=_LOJAS), ['2026-01-01'] + _PARAMS_LOJAS),
+    'escalas_semana': (
+        consultas.ESCALAS_SEMANA.format(filtro_loja=''), ('2026-01-04', '2026-01-10')),
+    'escalas_semana_loja': (
+        consultas.ESCALAS_SEMANA.format(filtro_loja=_LOJAS),
+        ['2026-01-04', '2026-01-10'] + _PARAMS_LOJAS),
+    'escalas_periodo': (consultas.ESCALAS_PERIODO, _MES),
+    'banco_horas_mes': (consultas.BANCO_HORAS_MES.format(filtro_loja=''), _MES),
+    'banco_horas_mes_loja': (
+        consultas.BANCO_HORAS_MES.format(filtro_loja=_LOJAS), list(_MES) + _PARAMS_LOJAS),
+    'fechamento_diario_mes': (consultas.FECHAMENTO_DIARIO_MES, _MES),
+    'evolucao_diaria': (consultas.EVOLUCAO_DIARIA, (1,) + _MES),
+    'totais_mensais': (consultas.TOTAIS_MENSAIS, (1,) + _MES),
+    'ranking_mes': (consultas.RANKING_MES, (1,) + _MES),
+    'versoes_painel': (
+        consultas.VERSOES_PAINEL.format(alvos=consultas.marcas(2), meses=consultas.marcas(2)),
+        (-1, 1, '2026-01', '')),
+    'cache_painel': (
+        consultas.CACHE_PAINEL.format(marcas=consultas.marcas(2)), ('2026-01', '2026-01-04')),
+    'versoes_graficos': (
+        consultas.VERSOES_GRAFICOS.format(marcas=consultas.marcas(2), filtro_loja=''),
+        (0, '2026-01', '')),
+    'versoes_graficos_loja': (
+        consultas.VERSOES_GRAFICOS.format(marcas=consultas.marcas(2), filtro_loja=_LOJAS),
+        [0, '2026-01', ''] + _PARAMS_LOJAS),
+    'cache_graficos': (
+        consultas.CACHE_GRAFICOS.format(marcas=consultas.marcas(2)),
+        ('mensal:1:2026-01', 'mensal:2:2026-01')),
+    'eventos_novos': (consultas.EVENTOS_NOVOS, (0,)),
+    'reservar_job': (
+        consultas.RESERVAR_JOB,
+        ('processando', '2026-01-01T00:00:00', '2026-01-01T00:00:00', 'pendente', 'pendente')),
+}
+
+# Tabelas pequenas (cadastros) que podem ser varridas sem problema
+TABELAS_PEQUENAS = {'colaboradores', 'lojas', 'feriados', 'configuracoes', 'gestor_lojas'}
+
+
+def verificar_planos(conn):
+    """Roda EXPLAIN QUERY PLAN nas consultas críticas.
+
+    Retorna uma lista de (nome, detalhe) para cada varredura completa de
+    tabela grande encontrada; lista vazia significa que está tudo indexado.
+    """
+    problemas = []
+    for nome, (sql, params) in CONSULTAS_CRITICAS.items():
+        for linha in conn.execute('EXPLAIN QUERY PLAN ' + sql, params):
+            detalhe = linha['detail']
+            partes = detalhe.split()
+            if partes[0] != 'SCAN':
+                continue
+            if partes[1] in TABELAS_PEQUENAS or _alias_de_tabela_pequena(sql, partes[1]):
+                continue
+            problemas.append((nome, detalhe))
+    return problemas
+
+
+def _alias_de_tabela_pequena(sql, alias):
+    palavras = sql.split()
+    for i, palavra in enumerate(palavras[1:], 1):
+        if palavra == alias and palavras[i - 1] in TABELAS_PEQUENAS:
+            return True
+    return False
+
+
 def init_db():
     """Initialize the database with all tables."""
     conn = get_db()
@@ -163,6 +473,132 @@ def init_db():
         )
     ''')
 
+    # Tabela de resumo semanal materializado (mantida pelas rotas de escrita)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS resumo_semanal (
+            colaborador_id INTEGER NOT NULL,
+            semana_inicio TEXT NOT NULL,
+            horas_trabalhadas REAL DEFAULT 0,
+            horas_justificadas REAL DEFAULT 0,
+            horas_extras REAL DEFAULT 0,
+            dias_trabalhados INTEGER DEFAULT 0,
+            atualizado_em TEXT,
+            PRIMARY KEY (colaborador_id, semana_inicio),
+            FOREIGN KEY (colaborador_id) REFERENCES colaboradores(id)
+        )
+    ''')
+
+    # Fila de jobs de relatórios (ver jobs.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            tipo TEXT NOT NULL,
+            parametros TEXT NOT NULL DEFAULT '{}',
+            status TEXT NOT NULL DEFAULT 'pendente',
+            progresso INTEGER DEFAULT 0,
+            solicitado_por INTEGER,
+            nome_arquivo TEXT,
+            mimetype TEXT,
+            erro TEXT,
+            chave TEXT,
+            tentativas INTEGER NOT NULL DEFAULT 0,
+            criado_em TEXT NOT NULL,
+            iniciado_em TEXT,
+            heartbeat TEXT,
+            concluido_em TEXT,
+            FOREIGN KEY (solicitado_por) REFERENCES colaboradores(id)
+        )
+    ''')
+
+    # Cache de relatórios gerados e versões dos dados (ver cache_relatorios.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS versoes_relatorio (
+            colaborador_id INTEGER NOT NULL,
+            mes TEXT NOT NULL,
+            versao INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (colaborador_id, mes)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cache_relatorios (
+            chave TEXT PRIMARY KEY,
+            nome_arquivo TEXT NOT NULL,
+            mimetype TEXT NOT NULL,
+            tamanho INTEGER NOT NULL,
+            criado_em TEXT NOT NULL,
+            acessado_em TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS idempotencia_batidas (
+            colaborador_id INTEGER NOT NULL,
+            chave TEXT NOT NULL,
+            data TEXT NOT NULL,
+            tipo TEXT NOT NULL,
+            hora TEXT NOT NULL,
+            criado_em TEXT NOT NULL,
+            PRIMARY KEY (colaborador_id, chave),
+            FOREIGN KEY (colaborador_id) REFERENCES colaboradores(id)
+        )
+    ''')
+
+    # Diário do banco de horas: horas trabalhadas e justificadas por dia
+    # (mantido junto com resumo_semanal pelas rotas de escrita)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS banco_horas_diario (
+            colaborador_id INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            horas_trabalhadas REAL DEFAULT 0,
+            horas_justificadas REAL DEFAULT 0,
+            PRIMARY KEY (colaborador_id, data),
+            FOREIGN KEY (colaborador_id) REFERENCES colaboradores(id)
+        )
+    ''')
+
+    # Totais do dashboard por colaborador e período (ver cache_painel.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cache_painel (
+            periodo TEXT NOT NULL,
+            colaborador_id INTEGER NOT NULL,
+            versao TEXT NOT NULL,
+            dados TEXT NOT NULL,
+            PRIMARY KEY (periodo, colaborador_id)
+        )
+    ''')
+
+    # Lojas de cada gestor; sem linhas, o gestor vê todas (ver escopo.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS gestor_lojas (
+            gestor_id INTEGER NOT NULL,
+            loja_id INTEGER NOT NULL,
+            PRIMARY KEY (gestor_id, loja_id),
+            FOREIGN KEY (gestor_id) REFERENCES colaboradores(id),
+            FOREIGN KEY (loja_id) REFERENCES lojas(id)
+        )
+    ''')
+
+    # Dados dos gráficos do dashboard por mês (ver graficos.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cache_graficos (
+            chave TEXT PRIMARY KEY,
+            versao TEXT NOT NULL,
+            dados TEXT NOT NULL,
+            criado_em TEXT NOT NULL
+        )
+    ''')
+
+    # Alterações para o dashboard ao vivo (ver eventos.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS eventos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo TEXT NOT NULL,
+            colaborador_id INTEGER,
+            data TEXT,
+            referencia INTEGER,
+            criado_em TEXT NOT NULL
+        )
+    ''')
+
     # Migração: adicionar loja_id em colaboradores se não existir
     try:
         cursor.execute("SELECT loja_id FROM colaboradores LIMIT 1")
@@ -188,6 +624,26 @@ def init_db():
     except sqlite3.OperationalError:
         cursor.execute("ALTER TABLE registros_ponto ADD COLUMN atraso_minutos INTEGER DEFAULT 0")
 
+    # Migração: adicionar chave (cache de relatórios) em jobs se não existir
+    try:
+        cursor.execute("SELECT chave FROM jobs LIMIT 1")
+    except sqlite3.OperationalError:
+        cursor.execute("ALTER TABLE jobs ADD COLUMN chave TEXT")
+
+    # Migração: saldo acumulado dos meses fechados em colaboradores
+    try:
+        cursor.execute("SELECT saldo_banco FROM colaboradores LIMIT 1")
+    except sqlite3.OperationalError:
+        cursor.execute("ALTER TABLE colaboradores ADD COLUMN saldo_banco REAL DEFAULT 0")
+        cursor.execute('''
+            UPDATE colaboradores SET saldo_banco = (
+                SELECT COALESCE(SUM(saldo), 0) FROM banco_horas
+                WHERE colaborador_id = colaboradores.id AND fechado = 1)
+        ''')
+
+    # Índices secundários versionados
+    migracoes_aplicadas = _aplicar_migracoes(cursor)
+
     # Inserir loja padrão se não existir nenhuma
     cursor.execute("SELECT id FROM lojas LIMIT 1")
     if not cursor.fetchone():
@@ -198,6 +654,7 @@ def init_db():
     configs_padrao = [
         ('tolerancia_minutos', '15'),
         ('nome_empresa', 'Piticas'),
+        ('feriados_versao', '0'),
     ]
     for chave, valor in configs_padrao:
         cursor.execute('''
@@ -240,6 +697,11 @@ def init_db():
             0
         ))
 
+    # Backfill do resumo semanal e do diário na primeira vez que existem
+    if migracoes_aplicadas & {2, 5}:
+        from horas import reconstruir_resumo_semanal
+        reconstruir_resumo_semanal(conn)
+
     conn.commit()
     conn.close()
     print("Banco de dados inicializado com sucesso!")
@@ -0,0 +1,129 @@
+"""Dados da página Meu Ponto, montados com um número fixo de consultas.
+
+A página é aberta pelo colaborador a cada batida. Registros e escalas do
+mês (estendido até as bordas da semana atual) vêm numa consulta cada, e
+as justificativas aprovadas em outra; o registro e a escala de hoje, a
+semana, os totais e o calendário do mês saem desses dados em memória.
+"""
+from datetime import date, timedelta
+
+from calendario import get_mes_inicio_fim, get_semana_inicio_fim, is_feriado, tipo_dia
+import consultas
+from horas import (
+    calcular_horas_extras_semana, calcular_horas_justificadas_faixas, calcular_resumo_semana
+)
+import ponto
+import tempo
+
+MESES_PT = ('', 'Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho',
+            'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro')
+
+
+def _semanas_calendario(inicio_mes, fim_mes):
+    """Semanas (domingo a sábado) que cobrem o mês, como listas de datas."""
+    # weekday(): 0=seg..6=dom. Para achar o domingo anterior: (weekday + 1) % 7
+    d = inicio_mes - timedelta(days=(inicio_mes.weekday() + 1) % 7)
+    cal_fim = fim_mes + timedelta(days=(5 - fim_mes.weekday()) % 7)
+    semanas = []
+    while d <= cal_fim:
+        semanas.append([d + timedelta(days=i) for i in range(7)])
+        d += timedelta(days=7)
+    return semanas
+
+
+def montar_meu_ponto(db, colaborador, hoje):
+    """Contexto do template meu_ponto.html para o colaborador na data `hoje`."""
+    colab_id = colaborador['id']
+    hoje_iso = hoje.isoformat()
+    inicio_sem, fim_sem = get_semana_inicio_fim(hoje)
+    inicio_mes, fim_mes = get_mes_inicio_fim(hoje)
+    inicio = min(inicio_sem, inicio_mes).isoformat()
+    fim = max(fim_sem, fim_mes).isoformat()
+
+    registros = db.execute(
+        consultas.REGISTROS_COLABORADOR_PERIODO,
+        (colab_id, inicio, fim)
+    ).fetchall()
+    escalas = db.execute(
+        '''SELECT * FROM escalas
+           WHERE colaborador_id = ? AND data BETWEEN ? AND ?
+           ORDER BY data''',
+        (colab_id, inicio, fim)
+    ).fetchall()
+
+    registro_hoje = next((r for r in registros if r['data'] == hoje_iso), None)
+    registros_semana = [r for r in registros
+                        if inicio_sem.isoformat() <= r['data'] <= fim_sem.isoformat()]
+    registros_mes = [r for r in registros
+                     if inicio_mes.isoformat() <= r['data'] <= fim_mes.isoformat()]
+    escala_hoje = next((e for e in escalas if e['data'] == hoje_iso), None)
+    escalas_semana = [e for e in escalas
+                      if inicio_sem.isoformat() <= e['data'] <= fim_sem.isoformat()]
+    escalas_mes_map = {e['data']: e for e in escalas
+                       if inicio_mes.isoformat() <= e['data'] <= fim_mes.isoformat()}
+
+    # Horas trabalhadas no mês por semana; toda semana até hoje entra, mesmo sem registro
+    semanas_no_mes = {}
+    d = inicio_mes
+    while d <= min(fim_mes, hoje):
+        semanas_no_mes.setdefault(get_semana_inicio_fim(d)[0], 0.0)
+        d += timedelta(days=7)
+    semanas_no_mes.setdefault(get_semana_inicio_fim(min(fim_mes, hoje))[0], 0.0)
+    for r in registros_mes:
+        sem = get_semana_inicio_fim(date.fromisoformat(r['data']))[0]
+        semanas_no_mes[sem] = semanas_no_mes.get(sem, 0.0) + r['horas_trabalhadas']
+
+    # Justificadas (aprovadas) do mês, da semana atual e de cada semana inteira do mês
+    faixas = [(inicio_mes, fim_mes), (inicio_sem, fim_sem)]
+    faixas += [(sem, sem + timedelta(days=6)) for sem in semanas_no_mes]
+    justificadas = [horas for horas, _ in
+                    calcular_horas_justificadas_faixas(colab_id, faixas, colaborador, db)]
+    horas_just_mes, horas_just_semana = justificadas[0], justificadas[1]
+
+    max_horas = colaborador['max_horas_semana'] or 40.0
+    horas_extras_mes = sum(
+        calcular_horas_extras_semana(horas + hj, max_horas)
+        for horas, hj in zip(semanas_no_mes.values(), justificadas[2:]))
+
+    resumo_sem = calcular_resumo_semana(registros_semana, max_horas)
+    resumo_sem['horas_justificadas'] = horas_just_semana
+    resumo_sem['horas_total'] = round(resumo_sem['horas_total'] + horas_just_semana, 2)
+
+    atrasados = [r['atraso_minutos'] for r in registros_mes
+                 if r['atraso_minutos'] and r['atraso_minutos'] > 0]
+
+    tipo_dia_hoje = tipo_dia(hoje, db)
+    min_almoco = 30 if tipo_dia_hoje == 'especial' else 60
+    retorno_minimo = None
+    if registro_hoje and registro_hoje['saida_almoco'] and not registro_hoje['retorno_almoco']:
+        retorno_minimo = tempo.formatar(
+            tempo.para_minutos(registro_hoje['saida_almoco']) + min_almoco)
+
+    return {
+        'colaborador': colaborador,
+        'registro_hoje': registro_hoje,
+        'registros_semana': registros_semana,
+        'registros_mes': registros_mes,
+        'horas_semana': round(sum(r['horas_trabalhadas'] for r in registros_semana)
+                              + horas_just_semana, 2),
+        'horas_mes': round(sum(r['horas_trabalhadas'] for r in registros_mes)
+                           + horas_just_mes, 2),
+        'horas_just_semana': horas_just_semana,
+        'horas_just_mes': horas_just_mes,
+        'resumo_sem': resumo_sem,
+        'horas_extras_mes': round(horas_extras_mes, 2),
+        'tipo_dia_hoje': tipo_dia_hoje,
+        'feriado_hoje': is_feriado(hoje, db),
+        'min_almoco': min_almoco,
+        'retorno_minimo': retorno_minimo,
+        'proximo_tipo': ponto.proximo_tipo(registro_hoje),
+        'atrasos_mes': len(atrasados),
+        'total_atraso_mes': sum(atrasados),
+        'escala_hoje': escala_hoje,
+        'escalas_semana': escalas_semana,
+        'escalas_mes_map': escalas_mes_map,
+        'calendario_semanas': _semanas_calendario(inicio_mes, fim_mes),
+        'nome_mes_atual': f'{MESES_PT[hoje.month]} {hoje.year}',
+        'inicio_mes_dt': inicio_mes,
+        'fim_mes_dt': fim_mes,
+    }
@@ -0,0 +1,274 @@
+"""Registro de batidas de ponto, seguro sob concorrência.
+
+Cada batida roda numa transação `BEGIN IMMEDIATE` (o lock de escrita é
+pego antes de ler), e a linha do dia é gravada por um único upsert em
+(colaborador_id, data): o INSERT cria o registro com a entrada e o
+ON CONFLICT preenche, via CASE, a primeira coluna vazia entre entrada,
+saida_almoco, retorno_almoco e saida. O RETURNING devolve a linha já
+atualizada, sem SELECT antes nem depois.
+
+A ordem das batidas é a de proximo_tipo(); uma batida com horário anterior
+ao da última já gravada (envio offline atrasado, lançamento manual do
+gestor) é recusada como fora de ordem.
+
+Reenvios (duplo toque, reenvio offline) são barrados por uma chave de
+idempotência por colaborador, respondida com uma leitura, sem pegar o
+lock de escrita; sem chave explícita a chave é o minuto da batida. Além
+disso o próprio upsert não grava uma batida no mesmo minuto da anterior,
+o que cobre dois aparelhos com chaves diferentes.
+"""
+from datetime import datetime, timedelta
+
+from cache_relatorios import marcar_alteracao
+from calendario import tipo_dia
+from horas import atualizar_resumo_semanal
+import eventos
+import tempo
+
+COLUNAS = ('entrada', 'saida_almoco', 'retorno_almoco', 'saida')
+# Por quanto tempo uma chave de idempotência segura reenvios
+RETENCAO_CHAVES = timedelta(days=7)
+
+REGISTRADA = 'registrada'
+DUPLICADA = 'duplicada'
+COMPLETO = 'completo'
+ALMOCO_CURTO = 'almoco_curto'
+FORA_DE_ORDEM = 'fora_de_ordem'
+# Batida recusada antes de chegar ao banco (horário inválido, fora da janela)
+INVALIDA = 'invalida'
+
+# Coluna preenchida quando a anterior já tem valor ('' conta como vazio)
+_PREENCHIDO = "COALESCE({}, '') <> ''"
+_VAZIO = "COALESCE({}, '') = ''"
+_MINUTOS = ("(CAST(substr({0}, 1, instr({0}, ':') - 1) AS INTEGER) * 60"
+            " + CAST(substr({0}, instr({0}, ':') + 1) AS INTEGER))")
+
+
+def _sql_upsert():
+    def cheias(n):
+        return ' AND '.join(_PREENCHIDO.format(c) for c in COLUNAS[:n]) or '1'
+
+    sets = [
+        f"{col} = CASE WHEN {cheias(i)} AND {_VAZIO.format(col)} THEN :hora ELSE {col} END"
+        for i, col in enumerate(COLUNAS)
+    ]
+    sets.append(f"status = CASE WHEN {cheias(3)} AND {_VAZIO.format('saida')} "
+                f"THEN 'completo' ELSE status END")
+    return f'''INSERT INTO registros_ponto
+               (colaborador_id, data, entrada, tipo_dia, status, atraso_minutos)
+               VALUES (:colab, :data, :hora, :tipo_dia, 'em_andamento', :atraso)
+               ON CONFLICT(colaborador_id, data) DO UPDATE SET
+                   {(',' + chr(10) + '                   ').join(sets)}
+               WHERE NOT ({cheias(4)})
+                 AND :hora NOT IN ({', '.join(f"COALESCE({c}, '')" for c in COLUNAS)})
+                 AND :hora_min >= MAX({', '.join(_MINUTOS.format(f"COALESCE({c}, '')") for c in COLUNAS)})
+                 AND NOT ({cheias(2)} AND {_VAZIO.format('retorno_almoco')}
+                          AND :hora_min - {_MINUTOS.format('saida_almoco')} < :min_almoco)
+               RETURNING *'''
+
+
+UPSERT_BATIDA = _sql_upsert()
+
+
+def proximo_tipo(registro):
+    """Próxima batida do dia: a primeira coluna vazia, ou 'completo'."""
+    if not registro:
+        return 'entrada'
+    for col in COLUNAS:
+        if not registro[col]:
+            return col
+    return 'completo'
+
+
+def _ultima_batida(registro):
+    """Horário da última coluna preenchida do registro ('' se nenhuma).
+
+    Não depende de proximo_tipo(): uma edição manual pode deixar a entrada
+    vazia com as colunas seguintes preenchidas.
+    """
+    return next((registro[col] for col in reversed(COLUNAS) if registro[col]), '')
+
+
+def _tipo_preenchido(registro, hora):
+    """Coluna que o upsert acabou de preencher (a única com o horário da batida)."""
+    return next(col for col in COLUNAS if registro[col] == hora)
+
+
+def _tipo_repetido(registro, hora):
+    """Coluna já batida no mesmo minuto (outro aparelho, outra aba), se houver."""
+    if registro is None:
+        return None
+    for col in reversed(COLUNAS):
+        if registro[col] == hora:
+            return col
+    return None
+
+
+def horario_esperado(db, colab_id, data_iso):
+    """(horário de entrada esperado, tolerância em minutos): escala do dia > cadastro."""
+    row = db.execute(
+        '''SELECT COALESCE(
+               NULLIF((SELECT horario_entrada FROM escalas
+                       WHERE colaborador_id = :colab AND data = :data), ''),
+               (SELECT horario_entrada FROM colaboradores WHERE id = :colab)) AS horario,
+           (SELECT valor FROM configuracoes WHERE chave = 'tolerancia_minutos') AS tolerancia''',
+        {'colab': colab_id, 'data': data_iso}
+    ).fetchone()
+    return row['horario'] or '', int(row['tolerancia']) if row['tolerancia'] else 15
+
+
+def _calcular_atraso(hora, horario_esp, tolerancia):
+    if not horario_esp:
+        return 0
+    try:
+        diff = tempo.para_minutos(hora) - tempo.para_minutos(horario_esp)
+    except (ValueError, TypeError):
+        return 0
+    return int(diff) if diff > tolerancia else 0
+
+
+def _gravar_batida(db, colab_id, data, hora, chave, resumir=True):
+    """Grava uma batida dentro de uma transação já aberta com BEGIN IMMEDIATE.
+
+    resumir=False deixa resumo_semanal e versões de relatório para quem
+    chama (registrar_lote atualiza uma vez só no fim).
+    """
+    data_iso = data.isoformat()
+    td = tipo_dia(data, db)
+    min_almoco = 30 if td == 'especial' else 60
+    resultado = {'status': REGISTRADA, 'tipo': None, 'data': data_iso, 'hora': hora,
+                 'atraso': 0, 'horario_esperado': '', 'min_almoco': min_almoco,
+                 'restante': 0, 'ultima': '', 'registro': None}
+
+    # Sob o lock a chave não pode mais ser gravada por outra requisição
+    repetida = db.execute(
+        'SELECT tipo, hora FROM idempotencia_batidas WHERE colaborador_id = ? AND chave = ?',
+        (colab_id, chave)
+    ).fetchone()
+    if repetida:
+        return dict(resultado, status=DUPLICADA, tipo=repetida['tipo'], hora=repetida['hora'])
+
+    horario_esp, tolerancia = horario_esperado(db, colab_id, data_iso)
+    registro = db.execute(UPSERT_BATIDA, {
+        'colab': colab_id, 'data': data_iso, 'hora': hora, 'tipo_dia': td,
+        'atraso': _calcular_atraso(hora, horario_esp, tolerancia),
+        'hora_min': tempo.para_minutos(hora), 'min_almoco': min_almoco,
+    }).fetchone()
+
+    if registro is None:
+        # Nada a preencher: mesmo minuto, dia completo, fora de ordem ou almoço curto
+        atual = db.execute(
+            'SELECT * FROM registros_ponto WHERE colaborador_id = ? AND data = ?',
+            (colab_id, data_iso)
+        ).fetchone()
+        repetida = _tipo_repetido(atual, hora)
+        if repetida:
+            return dict(resultado, status=DUPLICADA, tipo=repetida, registro=atual)
+        if proximo_tipo(atual) == 'completo':
+            return dict(resultado, status=COMPLETO, registro=atual)
+        ultima = _ultima_batida(atual)
+        if ultima and tempo.para_minutos(hora) < tempo.para_minutos(ultima):
+            return dict(resultado, status=FORA_DE_ORDEM, tipo=proximo_tipo(atual),
+                        ultima=ultima, registro=atual)
+        if atual['saida_almoco'] and not atual['retorno_almoco']:
+            almoco = tempo.para_minutos(hora) - tempo.para_minutos(atual['saida_almoco'])
+            return dict(resultado, status=ALMOCO_CURTO, tipo='retorno_almoco',
+                        restante=int(min_almoco - almoco), registro=atual)
+        return dict(resultado, status=COMPLETO, registro=atual)
+
+    tipo = _tipo_preenchido(registro, hora)
+    db.execute(
+        '''INSERT INTO idempotencia_batidas (colaborador_id, chave, data, tipo, hora, criado_em)
+           VALUES (?, ?, ?, ?, ?, ?)''',
+        (colab_id, chave, data_iso, tipo, hora, datetime.now().isoformat(timespec='seconds'))
+    )
+
+    if tipo == 'entrada':
+        # Chaves antigas não servem mais (reenvios offline chegam em poucos dias)
+        db.execute(
+            'DELETE FROM idempotencia_batidas WHERE colaborador_id = ? AND data < ?',
+            (colab_id, (data - RETENCAO_CHAVES).isoformat())
+        )
+    else:
+        horas = tempo.calcular_horas(
+            registro['entrada'], registro['saida_almoco'], registro['retorno_almoco'],
+            registro['saida'], agora_min=tempo.para_minutos(hora))
+        db.execute('UPDATE registros_ponto SET horas_trabalhadas = ? WHERE id = ?',
+                   (horas, registro['id']))
+        # O RETURNING do upsert é anterior a este UPDATE
+        registro = dict(registro, horas_trabalhadas=horas)
+
+    eventos.publicar(db, eventos.REGISTRO, colab_id, data_iso)
+    if resumir:
+        atualizar_resumo_semanal(db, colab_id, data)
+        marcar_alteracao(db, colab_id, data)
+
+    return dict(resultado, tipo=tipo, registro=registro,
+                atraso=registro['atraso_minutos'] if tipo == 'entrada' else 0,
+                horario_esperado=horario_esp)
+
+
+def _em_transacao(db, funcao):
+    """Executa funcao() sob BEGIN IMMEDIATE, com commit no fim ou rollback no erro."""
+    if db.in_transaction:
+        db.commit()
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        retorno = funcao()
+        db.commit()
+    except BaseException:
+        if db.in_transaction:
+            db.rollback()
+        raise
+    return retorno
+
+
+def registrar_batida(db, colab_id, data, hora, idempotencia=None):
+    """Registra a próxima batida do dia `data` às `hora` ('HH:MM').
+
+    Retorna um dict com 'status' (registrada, duplicada, completo ou
+    almoco_curto), 'tipo' da batida, 'data', 'hora', 'atraso',
+    'horario_esperado', 'min_almoco', 'restante' (minutos que faltam de
+    almoço) e 'registro'. A transação é encerrada aqui.
+    """
+    chave = idempotencia or f'{data.isoformat()} {hora}'
+
+    # Caminho barato para reenvio: só leitura, sem lock de escrita
+    repetida = db.execute(
+        'SELECT tipo, hora FROM idempotencia_batidas WHERE colaborador_id = ? AND chave = ?',
+        (colab_id, chave)
+    ).fetchone()
+    if repetida:
+        return {'status': DUPLICADA, 'tipo': repetida['tipo'], 'data': data.isoformat(),
+                'hora': repetida['hora'], 'atraso': 0, 'horario_esperado': '',
+                'min_almoco': 0, 'restante': 0, 'ultima': '', 'registro': None}
+
+    return _em_transacao(db, lambda: _gravar_batida(db, colab_id, data, hora, chave))
+
+
+def registrar_lote(db, batidas):
+    """Grava batidas enfileiradas offline, de um ou vários colaboradores, numa
+    única transação.
+
+    `batidas` é uma lista de (colaborador_id, data, 'HH:MM', chave ou None),
+    aplicadas em ordem cronológica por colaborador como se tivessem sido
+    feitas na hora. Retorna os resultados na ordem recebida, no formato de
+    registrar_batida.
+    """
+    ordem = sorted(range(len(batidas)), key=lambda i: batidas[i][:3])
+
+    def gravar():
+        resultados = [None] * len(batidas)
+        datas = {}
+        for i in ordem:
+            colab_id, data, hora, chave = batidas[i]
+            resultados[i] = _gravar_batida(db, colab_id, data, hora,
+                                           chave or f'{data.isoformat()} {hora}', resumir=False)
+            if resultados[i]['status'] == REGISTRADA:
+                datas.setdefault(colab_id, []).append(data)
+        for colab_id, dias in datas.items():
+            atualizar_resumo_semanal(db, colab_id, min(dias), max(dias))
+            marcar_alteracao(db, colab_id, min(dias), max(dias))
+        return resultados
+
+    return _em_transacao(db, gravar)
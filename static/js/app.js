@@ -64,6 +64,428 @@ document.addEventListener('DOMContentLoaded', function () {
         });
     }
 
+    // ------------------------------------------
+    // Report export via job queue (links with data-job)
+    // Falls back to the synchronous href if the request fails
+    // ------------------------------------------
+    document.querySelectorAll('a[data-job]').forEach(function (link) {
+        link.addEventListener('click', function (event) {
+            event.preventDefault();
+            if (link.classList.contains('disabled')) {
+                return;
+            }
+            const original = link.innerHTML;
+            const dados = new FormData();
+            const params = JSON.parse(link.dataset.jobParams || '{}');
+            dados.append('tipo', link.dataset.job);
+            Object.keys(params).forEach(function (chave) {
+                dados.append(chave, params[chave]);
+            });
+
+            function restaurar() {
+                link.classList.remove('disabled');
+                link.innerHTML = original;
+            }
+
+            function acompanhar(job) {
+                if (job.status === 'concluido') {
+                    restaurar();
+                    window.location = job.download_url;
+                } else if (job.status === 'erro') {
+                    restaurar();
+                    alert('Erro ao gerar o relatório: ' + (job.erro || ''));
+                } else {
+                    link.innerHTML = '<span class="spinner-border spinner-border-sm me-1"></span>' +
+                        job.progresso + '%';
+                    setTimeout(function () {
+                        fetch(job.status_url)
+                            .then(function (r) { return r.json(); })
+                            .then(acompanhar)
+                            .catch(restaurar);
+                    }, 1000);
+                }
+            }
+
+            link.classList.add('disabled');
+            link.innerHTML = '<span class="spinner-border spinner-border-sm me-1"></span>0%';
+            fetch(link.dataset.jobUrl, { method: 'POST', body: dados })
+                .then(function (r) {
+                    if (!r.ok) { throw new Error(r.status); }
+                    return r.json();
+                })
+                .then(acompanhar)
+                .catch(function () {
+                    restaurar();
+                    window.location = link.href;
+                });
+        });
+    });
+
+    // ------------------------------------------
+    // Offline kiosk (quiosque.html)
+    // Punches go to an IndexedDB queue first and are sent in bulk to
+    // /api/ponto/sync; the service worker keeps the page available offline
+    // ------------------------------------------
+    const quiosque = document.getElementById('quiosque');
+    if (quiosque) {
+        const LOTE_SYNC = 500;
+        const token = quiosque.dataset.token;
+        const mensagemEl = document.getElementById('quiosqueMensagem');
+        const modalEl = document.getElementById('quiosqueModal');
+        let colaboradorAtual = null;
+        let sincronizando = false;
+        let timerMensagem = null;
+
+        if ('serviceWorker' in navigator) {
+            navigator.serviceWorker.register(quiosque.dataset.swUrl, { scope: quiosque.dataset.escopo })
+                .catch(function () { /* no offline page, the queue still works */ });
+        }
+
+        function abrirFila() {
+            return new Promise(function (resolve, reject) {
+                const req = indexedDB.open('piticas-quiosque', 1);
+                req.onupgradeneeded = function () {
+                    req.result.createObjectStore('batidas', { keyPath: 'idempotencia' });
+                };
+                req.onsuccess = function () { resolve(req.result); };
+                req.onerror = function () { reject(req.error); };
+            });
+        }
+
+        function naFila(modo, operacao) {
+            return abrirFila().then(function (db) {
+                return new Promise(function (resolve, reject) {
+                    const tx = db.transaction('batidas', modo);
+                    const req = operacao(tx.objectStore('batidas'));
+                    tx.oncomplete = function () { resolve(req ? req.result : null); };
+                    tx.onerror = function () { reject(tx.error); };
+                });
+            });
+        }
+
+        function dois(n) {
+            return String(n).padStart(2, '0');
+        }
+
+        // Local time with UTC offset, e.g. 2026-10-17T08:01:30-03:00
+        function horarioLocal(d) {
+            const offset = -d.getTimezoneOffset();
+            return d.getFullYear() + '-' + dois(d.getMonth() + 1) + '-' + dois(d.getDate()) +
+                'T' + dois(d.getHours()) + ':' + dois(d.getMinutes()) + ':' + dois(d.getSeconds()) +
+                (offset >= 0 ? '+' : '-') + dois(Math.floor(Math.abs(offset) / 60)) + ':' +
+                dois(Math.abs(offset) % 60);
+        }
+
+        function novaChave() {
+            if (window.crypto && crypto.randomUUID) {
+                return crypto.randomUUID();
+            }
+            return Date.now().toString(36) + Math.random().toString(36).slice(2);
+        }
+
+        function mostrar(texto, categoria) {
+            mensagemEl.className = 'alert alert-' + categoria + ' mt-3 mb-0';
+            mensagemEl.textContent = texto;
+            clearTimeout(timerMensagem);
+            timerMensagem = setTimeout(function () {
+                mensagemEl.className = 'alert d-none mt-3 mb-0';
+            }, 8000);
+        }
+
+        function atualizarEstado() {
+            const conexao = document.getElementById('quiosqueConexao');
+            conexao.className = 'badge ' + (navigator.onLine ? 'bg-success' : 'bg-danger');
+            conexao.innerHTML = navigator.onLine
+                ? '<i class="bi bi-wifi me-1"></i>Online'
+                : '<i class="bi bi-wifi-off me-1"></i>Offline';
+            return naFila('readonly', function (fila) { return fila.count(); }).then(function (n) {
+                const pendentes = document.getElementById('quiosquePendentes');
+                pendentes.textContent = n + (n === 1 ? ' pendente' : ' pendentes');
+                pendentes.className = 'badge ' + (n ? 'bg-warning text-dark' : 'bg-secondary');
+            });
+        }
+
+        // Sends the oldest queued punches; resolves with the server response (or null)
+        function sincronizar() {
+            if (sincronizando || !navigator.onLine) {
+                return Promise.resolve(null);
+            }
+            sincronizando = true;
+            let restantes = 0;
+            return naFila('readonly', function (fila) { return fila.getAll(); })
+                .then(function (batidas) {
+                    if (!batidas.length) {
+                        return null;
+                    }
+                    batidas.sort(function (a, b) { return a.criada_em - b.criada_em; });
+                    const lote = batidas.slice(0, LOTE_SYNC);
+                    restantes = batidas.length - lote.length;
+                    return fetch(quiosque.dataset.syncUrl, {
+                        method: 'POST',
+                        headers: {
+                            'Content-Type': 'application/json',
+                            'Authorization': 'Bearer ' + token
+                        },
+                        body: JSON.stringify({
+                            batidas: lote.map(function (b) {
+                                return {
+                                    colaborador_id: b.colaborador_id,
+                                    data_hora: b.data_hora,
+                                    idempotencia: b.idempotencia
+                                };
+                            })
+                        })
+                    }).then(function (r) {
+                        if (r.status === 401) {
+                            mostrar('Quiosque não autorizado. Peça a um gestor para ativá-lo.', 'danger');
+                        }
+                        if (!r.ok) {
+                            throw new Error(r.status);
+                        }
+                        return r.json();
+                    }).then(function (resposta) {
+                        // Every result is final (registered, duplicate or refused): drop it from the queue
+                        return naFila('readwrite', function (fila) {
+                            resposta.resultados.forEach(function (res) {
+                                fila.delete(res.idempotencia);
+                            });
+                        }).then(function () { return resposta; });
+                    });
+                })
+                .finally(function () {
+                    sincronizando = false;
+                    atualizarEstado();
+                    if (restantes > 0) {
+                        setTimeout(function () { sincronizar().catch(function () {}); }, 0);
+                    }
+                });
+        }
+
+        function registrar(colaborador) {
+            const agora = new Date();
+            const batida = {
+                idempotencia: novaChave(),
+                colaborador_id: Number(colaborador.id),
+                data_hora: horarioLocal(agora),
+                criada_em: agora.getTime()
+            };
+            const guardada = colaborador.nome + ': batida guardada às ' + dois(agora.getHours()) + ':' +
+                dois(agora.getMinutes()) + '. Será enviada quando a conexão voltar.';
+            naFila('readwrite', function (fila) { return fila.add(batida); })
+                .then(atualizarEstado)
+                .then(sincronizar)
+                .then(function (resposta) {
+                    const res = resposta && resposta.resultados.find(function (r) {
+                        return r.idempotencia === batida.idempotencia;
+                    });
+                    if (res) {
+                        mostrar(colaborador.nome + ': ' + res.mensagem,
+                            res.status === 'registrada' ? 'success' : 'warning');
+                    } else {
+                        mostrar(guardada, 'info');
+                    }
+                })
+                .catch(function (erro) {
+                    if (erro.message !== '401') {
+                        mostrar(guardada, 'info');
+                    }
+                });
+        }
+
+        quiosque.querySelectorAll('.quiosque-colaborador').forEach(function (btn) {
+            btn.addEventListener('click', function () {
+                colaboradorAtual = { id: btn.dataset.id, nome: btn.dataset.nome };
+                const agora = new Date();
+                document.getElementById('quiosqueNome').textContent = colaboradorAtual.nome;
+                document.getElementById('quiosqueHora').textContent =
+                    dois(agora.getHours()) + ':' + dois(agora.getMinutes()) + ':' + dois(agora.getSeconds());
+                bootstrap.Modal.getOrCreateInstance(modalEl).show();
+            });
+        });
+
+        document.getElementById('quiosqueConfirmar').addEventListener('click', function () {
+            bootstrap.Modal.getOrCreateInstance(modalEl).hide();
+            if (colaboradorAtual) {
+                registrar(colaboradorAtual);
+                colaboradorAtual = null;
+            }
+        });
+
+        document.getElementById('quiosqueBusca').addEventListener('input', function (event) {
+            const termo = event.target.value.trim().toLowerCase();
+            quiosque.querySelectorAll('.quiosque-item').forEach(function (item) {
+                item.classList.toggle('d-none', termo !== '' && item.dataset.nome.indexOf(termo) === -1);
+            });
+        });
+
+        document.getElementById('quiosqueSincronizar').addEventListener('click', function () {
+            sincronizar()
+                .then(function (resposta) {
+                    if (resposta) {
+                        mostrar(resposta.registradas + ' batida(s) enviada(s).', 'success');
+                    }
+                })
+                .catch(function () { mostrar('Sem conexão com o servidor. Tentaremos de novo.', 'warning'); });
+        });
+
+        window.addEventListener('online', function () { sincronizar().catch(function () {}); });
+        window.addEventListener('offline', atualizarEstado);
+        setInterval(function () { sincronizar().catch(function () {}); }, 30000);
+        atualizarEstado().then(sincronizar).catch(function () {});
+    }
+
+    // ------------------------------------------
+    // Live dashboard (dashboard.html)
+    // Server-Sent Events from /dashboard/eventos patch today's records,
+    // absences and pending justificativas in place; the server sends
+    // 'recarregar' when a delta is not enough (missed events, new day)
+    // ------------------------------------------
+    const painel = document.querySelector('[data-painel-eventos]');
+    if (painel && window.EventSource) {
+        const tabela = document.getElementById('registros-hoje');
+        const listaAusentes = painel.querySelector('[data-lista="ausentes"]');
+        const listaPendentes = painel.querySelector('[data-lista="pendentes"]');
+        const dia = painel.dataset.dia;
+
+        function clonar(id) {
+            return document.getElementById(id).content.firstElementChild.cloneNode(true);
+        }
+
+        function campo(el, nome) {
+            return el.querySelector('[data-campo="' + nome + '"]');
+        }
+
+        function ddmm(iso) {
+            return iso.slice(8, 10) + '/' + iso.slice(5, 7);
+        }
+
+        // Keeps the list ordered by data-nome, like the server-rendered page
+        function inserirPorNome(lista, item, antesDe) {
+            const seguinte = Array.prototype.find.call(lista.querySelectorAll(':scope > [data-nome]'),
+                function (outro) { return outro.dataset.nome.localeCompare(item.dataset.nome) > 0; });
+            lista.insertBefore(item, seguinte || antesDe || null);
+        }
+
+        function contar(nome, valor) {
+            const el = painel.querySelector('[data-contador="' + nome + '"]');
+            if (el) {
+                el.textContent = valor;
+            }
+        }
+
+        function atualizarContadores() {
+            const linhas = tabela.querySelectorAll('tr[data-colaborador]');
+            const atrasos = Array.prototype.filter.call(linhas, function (tr) {
+                return Number(tr.dataset.atraso) > 0;
+            });
+            const ausentes = listaAusentes.querySelectorAll('li[data-colaborador]').length;
+            const pendentes = listaPendentes.querySelectorAll('li[data-justificativa]').length;
+            contar('presentes', linhas.length);
+            contar('atrasos', atrasos.length);
+            contar('ausentes', ausentes);
+            contar('pendentes', pendentes);
+            tabela.querySelector('tr[data-vazio]').classList.toggle('d-none', linhas.length > 0);
+            listaAusentes.classList.toggle('d-none', ausentes === 0);
+            listaPendentes.classList.toggle('d-none', pendentes === 0);
+        }
+
+        function linhaRegistro(estado) {
+            const reg = estado.registro;
+            const tr = clonar('modelo-registro');
+            tr.dataset.colaborador = estado.colaborador_id;
+            tr.dataset.nome = estado.nome;
+            tr.dataset.atraso = reg.atraso_minutos || 0;
+            campo(tr, 'nome').textContent = estado.nome;
+            campo(tr, 'editado').classList.toggle('d-none', !reg.editado_por);
+            ['entrada', 'saida_almoco', 'retorno_almoco', 'saida'].forEach(function (nome) {
+                campo(tr, nome).textContent = reg[nome] || '-';
+            });
+            if (reg.atraso_minutos > 0) {
+                campo(tr, 'atraso').classList.remove('d-none');
+                campo(tr, 'atraso_minutos').textContent = reg.atraso_minutos;
+            }
+            campo(tr, 'horas').textContent = (reg.horas_trabalhadas || 0).toFixed(2);
+            campo(tr, 'editar').href = painel.dataset.urlEditar.replace('/0/', '/' + reg.id + '/');
+            return tr;
+        }
+
+        function removerAusente(colaboradorId) {
+            const li = listaAusentes.querySelector('li[data-colaborador="' + colaboradorId + '"]');
+            if (li) {
+                li.remove();
+            }
+        }
+
+        function aplicarRegistro(estado) {
+            const atual = tabela.querySelector('tr[data-colaborador="' + estado.colaborador_id + '"]');
+            if (estado.registro && estado.ativo) {
+                const tr = linhaRegistro(estado);
+                if (atual) {
+                    atual.replaceWith(tr);
+                } else {
+                    inserirPorNome(tabela, tr, tabela.querySelector('tr[data-vazio]'));
+                }
+            } else if (atual) {
+                atual.remove();
+            }
+
+            removerAusente(estado.colaborador_id);
+            if (estado.ausente) {
+                const li = clonar('modelo-ausente');
+                li.dataset.colaborador = estado.colaborador_id;
+                li.dataset.nome = estado.nome;
+                campo(li, 'nome').textContent = estado.nome;
+                campo(li, 'cargo').textContent = estado.cargo || '';
+                inserirPorNome(listaAusentes.querySelector('ul'), li);
+            }
+        }
+
+        function aplicarJustificativa(just) {
+            const atual = listaPendentes.querySelector('li[data-justificativa="' + just.id + '"]');
+            if (atual) {
+                atual.remove();
+            }
+            if (just.status === 'pendente') {
+                const li = clonar('modelo-pendente');
+                const aprovar = painel.dataset.urlAprovar.replace('/0/', '/' + just.id + '/');
+                li.dataset.justificativa = just.id;
+                campo(li, 'nome').textContent = just.colaborador_nome;
+                campo(li, 'tipo').textContent = just.tipo;
+                campo(li, 'periodo').textContent = ddmm(just.data_inicio) + ' a ' + ddmm(just.data_fim) +
+                    ' (' + just.dias + ' dia' + (just.dias > 1 ? 's' : '') + ')';
+                if (just.arquivo_atestado) {
+                    campo(li, 'atestado').classList.remove('d-none');
+                    campo(li, 'atestado').querySelector('a').href = painel.dataset.urlAtestado
+                        .replace('__arquivo__', encodeURIComponent(just.arquivo_atestado));
+                }
+                li.querySelectorAll('form').forEach(function (form) { form.action = aprovar; });
+                // Newest first, as on the server-rendered page
+                const ul = listaPendentes.querySelector('ul');
+                ul.insertBefore(li, ul.firstChild);
+            } else if (just.status === 'aprovado' && just.data_inicio <= dia && dia <= just.data_fim) {
+                removerAusente(just.colaborador_id);
+            }
+        }
+
+        function tratar(aplicar) {
+            return function (event) {
+                aplicar(JSON.parse(event.data));
+                atualizarContadores();
+            };
+        }
+
+        // Last-Event-ID is resent by the browser on reconnect, so only the
+        // first connection needs the id the page was rendered with
+        const fonte = new EventSource(painel.dataset.painelEventos + '?desde=' +
+            encodeURIComponent(painel.dataset.desde) + '&dia=' + encodeURIComponent(dia));
+        fonte.addEventListener('registro', tratar(aplicarRegistro));
+        fonte.addEventListener('justificativa', tratar(aplicarJustificativa));
+        fonte.addEventListener('recarregar', function () {
+            fonte.close();
+            window.location.reload();
+        });
+    }
+
     // ------------------------------------------
     // Tooltips
     // ------------------------------------------
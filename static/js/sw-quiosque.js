@@ -0,0 +1,64 @@
+// ============================================
+// Piticas Ponto - Kiosk service worker
+// Keeps the kiosk page and its assets available offline. Punches are not
+// handled here: they live in the IndexedDB queue managed by app.js.
+// ============================================
+
+const CACHE = 'piticas-quiosque-v1';
+
+self.addEventListener('install', function () {
+    self.skipWaiting();
+});
+
+self.addEventListener('activate', function (event) {
+    event.waitUntil(
+        caches.keys().then(function (nomes) {
+            return Promise.all(nomes
+                .filter(function (nome) { return nome.startsWith('piticas-quiosque-') && nome !== CACHE; })
+                .map(function (nome) { return caches.delete(nome); }));
+        }).then(function () { return self.clients.claim(); })
+    );
+});
+
+self.addEventListener('fetch', function (event) {
+    const req = event.request;
+    if (req.method !== 'GET') {
+        return;
+    }
+
+    if (req.mode === 'navigate') {
+        // Kiosk page: network first; offline (or session expired and
+        // redirected to login) falls back to the last cached copy
+        event.respondWith(
+            fetch(req).then(function (resp) {
+                if (resp.ok && !resp.redirected) {
+                    const copia = resp.clone();
+                    caches.open(CACHE).then(function (cache) { cache.put(req, copia); });
+                    return resp;
+                }
+                return caches.match(req, { ignoreSearch: true }).then(function (cached) {
+                    return cached || resp;
+                });
+            }).catch(function () {
+                return caches.match(req, { ignoreSearch: true });
+            })
+        );
+        return;
+    }
+
+    // Static assets (own and CDN): cache first, refreshed in the background
+    event.respondWith(
+        caches.match(req).then(function (cached) {
+            const rede = fetch(req).then(function (resp) {
+                if (resp.ok || resp.type === 'opaque') {
+                    const copia = resp.clone();
+                    caches.open(CACHE).then(function (cache) { cache.put(req, copia); });
+                }
+                return resp;
+            }).catch(function () {
+                return cached;
+            });
+            return cached || rede;
+        })
+    );
+});
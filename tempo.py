@@ -0,0 +1,146 @@
+"""Aritmética de horários em minutos desde a meia-noite.
+
+As batidas são strings 'HH:MM'. Em vez de `datetime.strptime` (lento e
+chamado várias vezes por registro), cada horário é convertido uma vez para
+um inteiro de minutos, usando uma tabela pré-calculada com os 1440
+horários canônicos. `calcular_horas_lote` processa colunas inteiras de
+registros (array.array) e devolve exatamente o mesmo resultado que
+`calcular_horas` devolveria registro a registro.
+"""
+from array import array
+
+# 'HH:MM' canônico -> minutos
+_TABELA = {f'{h:02d}:{m:02d}': h * 60 + m for h in range(24) for m in range(60)}
+
+SEM_HORARIO = -1
+INVALIDO = -2
+
+
+def para_minutos(hhmm):
+    """Converte 'HH:MM' (ou 'H:M', como o strptime aceita) em minutos.
+
+    Retorna None para vazio/None e levanta ValueError se for inválido.
+    """
+    if not hhmm:
+        return None
+    minutos = _TABELA.get(hhmm)
+    if minutos is not None:
+        return minutos
+    if not isinstance(hhmm, str):
+        raise TypeError(f'horário inválido: {hhmm!r}')
+    partes = hhmm.split(':')
+    if (len(partes) != 2
+            or not all(p.isdecimal() and 1 <= len(p) <= 2 for p in partes)):
+        raise ValueError(f'horário inválido: {hhmm!r}')
+    h, m = int(partes[0]), int(partes[1])
+    if h > 23 or m > 59:
+        raise ValueError(f'horário inválido: {hhmm!r}')
+    return h * 60 + m
+
+
+def formatar(minutos):
+    """Converte minutos desde a meia-noite em 'HH:MM' (módulo 24h)."""
+    minutos %= 24 * 60
+    return f'{minutos // 60:02d}:{minutos % 60:02d}'
+
+
+def minutos_agora(dt):
+    """Minutos desde a meia-noite de um datetime (precisão de minuto)."""
+    return dt.hour * 60 + dt.minute
+
+
+def _minutos_trabalhados(entrada, saida_almoco, retorno_almoco, saida, agora_min):
+    """Núcleo do cálculo com horários já convertidos (None = sem batida)."""
+    if entrada is None:
+        return 0
+    if saida is None:
+        # Jornada em andamento: conta até agora
+        if agora_min is None:
+            return 0
+        total = agora_min - entrada
+        if saida_almoco is not None and retorno_almoco is not None:
+            total -= retorno_almoco - saida_almoco
+        elif saida_almoco is not None:
+            total -= agora_min - saida_almoco
+        return total
+    total = saida - entrada
+    if saida_almoco is not None and retorno_almoco is not None:
+        total -= retorno_almoco - saida_almoco
+    return total
+
+
+def calcular_horas(entrada, saida_almoco, retorno_almoco, saida, agora_min=None):
+    """Total de horas trabalhadas considerando almoço, arredondado em 2 casas.
+
+    Sem saída, a jornada é contada até `agora_min`. Horários inválidos
+    resultam em 0.0.
+    """
+    try:
+        minutos = _minutos_trabalhados(
+            para_minutos(entrada),
+            para_minutos(saida_almoco) if retorno_almoco or not saida else None,
+            para_minutos(retorno_almoco) if saida_almoco else None,
+            para_minutos(saida),
+            agora_min,
+        )
+    except (ValueError, TypeError):
+        return 0.0
+    return round(max(0, minutos / 60), 2)
+
+
+def _coluna(valores):
+    """Converte uma sequência de 'HH:MM' em array de minutos.
+
+    Vazio vira SEM_HORARIO e horário inválido vira INVALIDO; cada string
+    distinta é convertida uma única vez.
+    """
+    coluna = array('i', bytes(4 * len(valores)))
+    convertidos = {}
+    for i, v in enumerate(valores):
+        if not v:
+            coluna[i] = SEM_HORARIO
+            continue
+        minutos = _TABELA.get(v)
+        if minutos is None:
+            minutos = convertidos.get(v)
+            if minutos is None:
+                try:
+                    minutos = para_minutos(v)
+                except (ValueError, TypeError):
+                    minutos = INVALIDO
+                convertidos[v] = minutos
+        coluna[i] = minutos
+    return coluna
+
+
+def calcular_horas_lote(registros, agora_min=None):
+    """Calcula as horas trabalhadas de vários registros de uma vez.
+
+    `registros` é uma sequência de linhas com as chaves entrada,
+    saida_almoco, retorno_almoco e saida. As quatro colunas são convertidas
+    para arrays de minutos e o cálculo roda sobre inteiros; o resultado é
+    um array('d') com as horas na mesma ordem, idênticas às de
+    calcular_horas() linha a linha.
+    """
+    entradas = _coluna([r['entrada'] for r in registros])
+    saidas_almoco = _coluna([r['saida_almoco'] for r in registros])
+    retornos = _coluna([r['retorno_almoco'] for r in registros])
+    saidas = _coluna([r['saida'] for r in registros])
+
+    resultado = array('d', bytes(8 * len(registros)))
+    for i, (e, sa, ra, s) in enumerate(zip(entradas, saidas_almoco, retornos, saidas)):
+        if e == SEM_HORARIO:
+            continue
+        # Mesmas regras de calcular_horas(): a saída do almoço só conta com
+        # retorno (ou com a jornada em andamento) e o retorno só com a saída
+        if sa == SEM_HORARIO or (ra == SEM_HORARIO and s != SEM_HORARIO):
+            sa = None
+        if ra == SEM_HORARIO or sa is None:
+            ra = None
+        if INVALIDO in (e, s, sa, ra):
+            continue
+        minutos = _minutos_trabalhados(
+            e, sa, ra, None if s == SEM_HORARIO else s, agora_min)
+        if minutos > 0:
+            resultado[i] = round(minutos / 60, 2)
+    return resultado
@@ -0,0 +1,44 @@
+"""Fixtures dos testes: cada teste roda num banco novo, criado por init_db()."""
+import contextlib
+import io
+import os
+import sys
+import tempfile
+
+import pytest
+
+# models lê DATA_DIR na importação e app.py cria o banco ao ser importado;
+# os workers de jobs ficam desligados (os testes chamam a fila diretamente)
+os.environ.setdefault('DATA_DIR', tempfile.mkdtemp(prefix='ponto-testes-'))
+os.environ['JOBS_WORKERS'] = '0'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app as app_module
+
+import calendario
+import models
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """O app Flask apontando para um banco vazio (só o usuário admin)."""
+    models.pool.fechar_todas()
+    monkeypatch.setattr(models, 'DB_PATH', str(tmp_path / 'ponto.db'))
+    monkeypatch.setattr(calendario, 'feriados', calendario.CalendarioFeriados())
+    with contextlib.redirect_stdout(io.StringIO()):
+        models.init_db()
+    app_module.app.config['TESTING'] = True
+    yield app_module.app
+    models.pool.fechar_todas()
+
+
+@pytest.fixture
+def db(app):
+    with app.app_context():
+        yield models.get_db()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
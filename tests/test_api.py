@@ -0,0 +1,73 @@
+"""API de ponto: emissão e validação de tokens e corpo JSON das batidas."""
+from datetime import datetime
+
+from werkzeug.security import generate_password_hash
+
+import app as app_module
+
+MOMENTO = datetime(2026, 3, 10, 17, 0, tzinfo=app_module.BR_TZ)
+
+
+def _colaborador(db):
+    cursor = db.execute(
+        '''INSERT INTO colaboradores (nome, email, senha, primeiro_acesso)
+           VALUES ('Ana', 'ana@empresa.com', ?, 0)''',
+        (generate_password_hash('segredo1'),))
+    db.commit()
+    return cursor.lastrowid
+
+
+def _token(client, senha='segredo1'):
+    return client.post('/api/v1/token', json={'email': 'ana@empresa.com', 'senha': senha})
+
+
+def _auth(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+def test_token_emitido_autentica_a_api(client, db):
+    _colaborador(db)
+    assert _token(client, 'errada').status_code == 401
+    resposta = _token(client)
+    assert resposta.status_code == 200
+    token = resposta.get_json()['token']
+    assert client.get('/api/v1/ponto/hoje', headers=_auth(token)).status_code == 200
+    assert client.get('/api/v1/ponto/hoje', headers=_auth(token + 'x')).status_code == 401
+
+
+def test_token_expirado_e_recusado(client, db, monkeypatch):
+    _colaborador(db)
+    token = _token(client).get_json()['token']
+    monkeypatch.setattr(app_module, 'API_TOKEN_DIAS', -1)
+    assert client.get('/api/v1/ponto/hoje', headers=_auth(token)).status_code == 401
+
+
+def test_token_anterior_a_troca_de_senha_e_recusado(client, db):
+    colab_id = _colaborador(db)
+    token = _token(client).get_json()['token']
+    db.execute('UPDATE colaboradores SET senha = ? WHERE id = ?',
+               (generate_password_hash('segredo2'), colab_id))
+    db.commit()
+    assert client.get('/api/v1/ponto/hoje', headers=_auth(token)).status_code == 401
+
+
+def test_batida_de_saida_devolve_horas_gravadas(client, db, monkeypatch):
+    colab_id = _colaborador(db)
+    db.execute(
+        '''INSERT INTO registros_ponto (colaborador_id, data, entrada, saida_almoco, retorno_almoco)
+           VALUES (?, '2026-03-10', '08:00', '12:00', '13:00')''',
+        (colab_id,))
+    db.commit()
+    token = _token(client).get_json()['token']
+    monkeypatch.setattr(app_module, 'agora', lambda: MOMENTO)
+    monkeypatch.setattr(app_module, 'hoje', lambda: MOMENTO.date())
+
+    resposta = client.post('/api/v1/ponto', json={}, headers=_auth(token))
+    assert resposta.status_code == 201
+    corpo = resposta.get_json()
+    gravado = db.execute(
+        'SELECT horas_trabalhadas FROM registros_ponto WHERE colaborador_id = ?',
+        (colab_id,)).fetchone()
+    assert corpo['tipo'] == 'saida'
+    assert gravado['horas_trabalhadas'] == 8.0
+    assert corpo['registro']['horas_trabalhadas'] == gravado['horas_trabalhadas']
@@ -0,0 +1,198 @@
+"""Gestor com lojas atribuídas não enxerga nem altera as outras lojas."""
+import re
+from datetime import timedelta
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from app import agora
+import escopo
+
+
+@pytest.fixture
+def lojas(db):
+    """Duas lojas, um colaborador em cada e um gestor só da primeira."""
+    db.executemany('INSERT INTO lojas (id, nome) VALUES (?, ?)',
+                   [(2, 'Centro'), (3, 'Shopping')])
+    db.executemany(
+        '''INSERT INTO colaboradores (id, nome, email, loja_id, primeiro_acesso)
+           VALUES (?, ?, ?, ?, 0)''',
+        [(10, 'Ana Centro', 'ana@empresa.com', 2), (20, 'Bruno Shopping', 'bruno@empresa.com', 3)])
+    db.execute(
+        '''INSERT INTO colaboradores (id, nome, email, senha, loja_id, is_gestor, primeiro_acesso)
+           VALUES (30, 'Gestor Centro', 'gestor@empresa.com', ?, 2, 1, 0)''',
+        (generate_password_hash('gestor123'),))
+    escopo.definir_lojas(db, 30, [2])
+    db.commit()
+    return db
+
+
+def _login(client, email='gestor@empresa.com', senha='gestor123'):
+    client.post('/login', data={'email': email, 'senha': senha})
+
+
+def _token_quiosque(client, url):
+    return re.search(r'data-token="([^"]+)"', client.get(url).get_data(as_text=True)).group(1)
+
+
+def _sync(client, token, colaborador_id):
+    data_hora = (agora() - timedelta(minutes=10)).strftime('%Y-%m-%dT%H:%M:%S')
+    return client.post('/api/ponto/sync', headers={'Authorization': f'Bearer {token}'},
+                       json={'batidas': [{'colaborador_id': colaborador_id, 'data_hora': data_hora,
+                                          'idempotencia': f'k{colaborador_id}'}]})
+
+
+# ---------------------------------------------------------------------------
+# Quiosque
+# ---------------------------------------------------------------------------
+
+def test_quiosque_recusa_loja_fora_do_escopo(client, lojas):
+    _login(client)
+    assert client.get('/quiosque/?loja=3').status_code == 403
+    assert client.get('/quiosque/?loja=2').status_code == 200
+
+
+def test_quiosque_sem_loja_abre_na_loja_do_gestor(client, lojas):
+    _login(client)
+    resposta = client.get('/quiosque/')
+    assert resposta.status_code == 302
+    assert resposta.headers['Location'].endswith('/quiosque/?loja=2')
+
+
+def test_sync_recusa_colaborador_de_outra_loja(client, lojas):
+    _login(client)
+    token = _token_quiosque(client, '/quiosque/?loja=2')
+    assert _sync(client, token, 20).get_json()['registradas'] == 0
+    assert _sync(client, token, 10).get_json()['registradas'] == 1
+    assert [r[0] for r in lojas.execute('SELECT colaborador_id FROM registros_ponto')] == [10]
+
+
+def test_sync_recusa_token_de_todas_as_lojas_de_gestor_com_escopo(client, lojas):
+    _login(client, 'admin@empresa.com', 'admin123')
+    token = _token_quiosque(client, '/quiosque/')
+    # O gestor passa a ter lojas depois de ativar o quiosque de todas
+    escopo.definir_lojas(lojas, 1, [3])
+    lojas.commit()
+    assert _sync(client, token, 20).status_code == 401
+
+
+# ---------------------------------------------------------------------------
+# Cadastro de lojas
+# ---------------------------------------------------------------------------
+
+def test_cadastro_de_lojas_restrito_a_quem_ve_todas(client, lojas):
+    _login(client)
+    assert client.get('/lojas').status_code == 302
+    client.post('/lojas/3/editar', data={'nome': 'Outra', 'ativo': '1'})
+    client.post('/lojas/3/excluir')
+    assert lojas.execute('SELECT nome FROM lojas WHERE id = 3').fetchone()[0] == 'Shopping'
+
+
+def test_excluir_loja_com_gestor_atribuido_e_recusado(client, lojas):
+    _login(client, 'admin@empresa.com', 'admin123')
+    client.post('/lojas/2/excluir')
+    assert lojas.execute('SELECT COUNT(*) FROM lojas WHERE id = 2').fetchone()[0] == 1
+    assert escopo.lojas_do_gestor(lojas, 30) == (2,)
+    client.post('/lojas/3/excluir')
+    assert lojas.execute('SELECT COUNT(*) FROM lojas WHERE id = 3').fetchone()[0] == 0
+
+
+# ---------------------------------------------------------------------------
+# Colaboradores, registros e relatórios de outra loja
+# ---------------------------------------------------------------------------
+
+@pytest.fixture
+def outra_loja(lojas):
+    """Um registro e uma justificativa pendente do colaborador da loja fora do escopo."""
+    lojas.execute(
+        '''INSERT INTO registros_ponto (id, colaborador_id, data, entrada, saida, horas_trabalhadas)
+           VALUES (1, 20, '2026-03-10', '08:00', '16:00', 8)''')
+    lojas.execute(
+        '''INSERT INTO justificativas (id, colaborador_id, data_inicio, data_fim, tipo, status)
+           VALUES (1, 20, '2026-03-11', '2026-03-11', 'atestado', 'pendente')''')
+    lojas.commit()
+    return lojas
+
+
+@pytest.mark.parametrize('url', ['/exportar/20', '/exportar-pdf/20'])
+def test_exportacao_de_outra_loja_responde_404(client, outra_loja, url):
+    _login(client)
+    assert client.get(url).status_code == 404
+
+
+def test_job_de_outra_loja_responde_404(client, outra_loja):
+    _login(client)
+    resposta = client.post('/relatorios/jobs', data={'tipo': 'pdf', 'colab_id': 20})
+    assert resposta.status_code == 404
+    assert outra_loja.execute('SELECT COUNT(*) FROM jobs').fetchone()[0] == 0
+
+
+def test_job_em_lote_leva_o_escopo(client, outra_loja):
+    _login(client)
+    resposta = client.post('/relatorios/jobs', data={'tipo': 'excel_lote', 'loja': '3'})
+    assert resposta.status_code == 202
+    parametros = outra_loja.execute('SELECT parametros FROM jobs').fetchone()[0]
+    assert '"loja_id": null' in parametros and '"lojas": [2]' in parametros
+
+
+def _inserir_job(db, solicitado_por):
+    db.execute(
+        '''INSERT INTO jobs (id, tipo, parametros, status, solicitado_por, criado_em)
+           VALUES ('j', 'excel_lote', '{}', 'pendente', ?, '2026-03-10T08:00:00')''',
+        (solicitado_por,))
+    db.commit()
+
+
+def test_job_de_outro_gestor_responde_404(client, lojas):
+    _inserir_job(lojas, 1)
+    _login(client)
+    assert client.get('/relatorios/jobs/j').status_code == 404
+    assert client.get('/relatorios/jobs/j/download').status_code == 404
+
+
+def test_job_do_proprio_gestor_e_visto_por_quem_ve_todas(client, lojas):
+    _inserir_job(lojas, 30)
+    _login(client)
+    assert client.get('/relatorios/jobs/j').status_code == 200
+    client.get('/logout')
+    _login(client, 'admin@empresa.com', 'admin123')
+    assert client.get('/relatorios/jobs/j').status_code == 200
+
+
+def test_relatorio_de_outra_loja_redireciona(client, outra_loja):
+    _login(client)
+    assert client.get('/relatorio-colaborador/20').status_code == 302
+    assert client.get('/relatorio-colaborador/10').status_code == 200
+
+
+def test_registro_de_outra_loja_nao_e_editado(client, outra_loja):
+    _login(client)
+    assert client.get('/registro/1/editar').status_code == 302
+    client.post('/registro/1/editar', data={'entrada': '09:00', 'saida': '16:00',
+                                           'motivo': 'teste'})
+    client.post('/registro/1/excluir', data={'motivo': 'teste'})
+    assert outra_loja.execute('SELECT entrada FROM registros_ponto WHERE id = 1').fetchone()[0] == '08:00'
+
+
+def test_criar_registro_recusa_colaborador_de_outra_loja(client, outra_loja):
+    _login(client)
+    pagina = client.get('/registro/novo').get_data(as_text=True)
+    assert 'Ana Centro' in pagina and 'Bruno Shopping' not in pagina
+    client.post('/registro/novo', data={'colaborador_id': 20, 'data': '2026-03-12',
+                                        'entrada': '08:00', 'motivo': 'teste'})
+    assert outra_loja.execute(
+        "SELECT COUNT(*) FROM registros_ponto WHERE data = '2026-03-12'").fetchone()[0] == 0
+
+
+def test_justificativa_de_outra_loja_nao_aparece_nem_e_aprovada(client, outra_loja):
+    _login(client)
+    assert 'Bruno Shopping' not in client.get('/justificativas').get_data(as_text=True)
+    client.post('/justificativas/1/aprovar', data={'acao': 'aprovar'})
+    assert outra_loja.execute('SELECT status FROM justificativas').fetchone()[0] == 'pendente'
+
+
+def test_colaborador_nao_vai_para_loja_fora_do_escopo(client, lojas):
+    _login(client)
+    client.post('/colaboradores/10/editar', data={'nome': 'Ana Centro', 'email': 'ana@empresa.com',
+                                                  'loja_id': '3', 'ativo': '1'})
+    assert lojas.execute('SELECT loja_id FROM colaboradores WHERE id = 10').fetchone()[0] == 2
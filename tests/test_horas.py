@@ -0,0 +1,40 @@
+"""Horas esperadas no mês, com e sem escala de trabalho."""
+from datetime import date
+
+from horas import _carga_escala, calcular_horas_esperadas
+
+# Março de 2026: 26 dias normais e 5 domingos (especiais), sem feriados
+INICIO, FIM = date(2026, 3, 1), date(2026, 3, 31)
+
+
+def _colaborador(db):
+    return db.execute('SELECT * FROM colaboradores WHERE id = 1').fetchone()
+
+
+def test_mes_sem_escala_segue_a_formula_do_calendario(db):
+    colaborador = _colaborador(db)
+    # 26 * 8 + 5 * 6 = 238h; 2 folgas por semana em 31 dias = 9 folgas pela carga média
+    assert calcular_horas_esperadas(colaborador, INICIO, FIM, db) == round(238 - 9 * 238 / 31, 2)
+    assert calcular_horas_esperadas(colaborador, INICIO, FIM, db) == 168.9
+
+
+def test_mes_com_escala_folga_e_domingo(db):
+    db.executemany(
+        '''INSERT INTO escalas (colaborador_id, data, horario_entrada, horario_saida, folga)
+           VALUES (1, ?, ?, ?, ?)''',
+        [('2026-03-02', '09:00', '15:00', 0),   # 6h, sem almoço
+         ('2026-03-03', '', '', 1),             # folga marcada na escala
+         ('2026-03-08', '10:00', '18:00', 0)])  # domingo: 8h menos 30min de almoço
+    db.commit()
+    # Fora da escala: 238 - 8 - 8 - 6 = 216h em 28 dias; 9 - 1 = 8 folgas pela média
+    esperado = round(6.0 + 7.5 + 216 - 8 * 216 / 28, 2)
+    assert esperado == 167.79
+    assert calcular_horas_esperadas(_colaborador(db), INICIO, FIM, db) == esperado
+
+
+def test_carga_escala():
+    sem_horario = {'horario_entrada': '', 'horario_saida': ''}
+    noturna = {'horario_entrada': '22:00', 'horario_saida': '06:00'}
+    assert _carga_escala(sem_horario, 8.0, False) == 8.0
+    assert _carga_escala(noturna, 8.0, False) == 7.0
+    assert _carga_escala(noturna, 6.0, True) == 7.5
@@ -0,0 +1,12 @@
+"""As consultas críticas (consultas.py) precisam usar índices."""
+import models
+
+
+def test_consultas_criticas_usam_indices(db):
+    assert models.verificar_planos(db) == []
+
+
+def test_varredura_de_tabela_grande_e_apontada(db, monkeypatch):
+    monkeypatch.setitem(models.CONSULTAS_CRITICAS, 'sem_indice', (
+        'SELECT * FROM registros_ponto WHERE horas_trabalhadas > ?', (8,)))
+    assert [nome for nome, _ in models.verificar_planos(db)] == ['sem_indice']
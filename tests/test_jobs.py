@@ -0,0 +1,84 @@
+"""Fila de jobs: workers sobem com o processo e retomam jobs travados."""
+import threading
+from datetime import datetime, timedelta
+
+import cache_relatorios
+import jobs
+
+_ITEM = {'chave': 'k', 'nome_arquivo': 'a.xlsx', 'mimetype': 'application/octet-stream'}
+
+
+def _inserir_job(db, status, heartbeat=None, tentativas=0, iniciado=None):
+    db.execute(
+        '''INSERT INTO jobs (id, tipo, parametros, status, tentativas, criado_em,
+                             iniciado_em, heartbeat)
+           VALUES ('a', 'excel', '{}', ?, ?, ?, ?, ?)''',
+        (status, tentativas, datetime.now().isoformat(), iniciado or heartbeat, heartbeat))
+    db.commit()
+
+
+def _ha(minutos):
+    return (datetime.now() - timedelta(minutes=minutos)).isoformat()
+
+
+def test_primeira_requisicao_sobe_os_workers(client, monkeypatch):
+    iniciados = threading.Event()
+    monkeypatch.setattr(jobs.fila, 'workers', 1)
+    monkeypatch.setattr(jobs.fila, '_pid', None)
+    monkeypatch.setattr(jobs.fila, 'executar', iniciados.set)
+    client.get('/login')
+    assert iniciados.wait(2)
+
+
+def test_job_sem_heartbeat_volta_para_a_fila(db):
+    _inserir_job(db, jobs.PROCESSANDO, heartbeat=_ha(20), tentativas=1)
+    jobs.fila.recuperar_travados(db)
+    assert jobs.obter_job(db, 'a')['status'] == jobs.PENDENTE
+
+
+def test_job_longo_com_heartbeat_recente_continua(db):
+    _inserir_job(db, jobs.PROCESSANDO, heartbeat=_ha(1), tentativas=1, iniciado=_ha(60))
+    jobs.fila.recuperar_travados(db)
+    assert jobs.obter_job(db, 'a')['status'] == jobs.PROCESSANDO
+
+
+def test_job_travado_vai_para_erro_depois_das_tentativas(db):
+    _inserir_job(db, jobs.PROCESSANDO, heartbeat=_ha(20), tentativas=jobs.MAX_TENTATIVAS)
+    jobs.fila.recuperar_travados(db)
+    job = jobs.obter_job(db, 'a')
+    assert job['status'] == jobs.ERRO
+    assert job['erro']
+
+
+def test_progresso_renova_o_heartbeat(db, monkeypatch):
+    _inserir_job(db, jobs.PENDENTE)
+    vistos = []
+
+    def gerar(db, tipo, p, progresso):
+        progresso(50)
+        vistos.append(jobs.obter_job(db, 'a')['heartbeat'])
+        return _ITEM
+
+    monkeypatch.setattr(cache_relatorios, 'gerar', gerar)
+    antes = datetime.now().isoformat()
+    assert jobs.fila.processar_proximo(db)
+    assert vistos[0] >= antes
+    job = jobs.obter_job(db, 'a')
+    assert (job['status'], job['tentativas']) == (jobs.CONCLUIDO, 1)
+
+
+def test_worker_que_perdeu_o_job_nao_sobrescreve_o_novo_dono(db, monkeypatch):
+    _inserir_job(db, jobs.PENDENTE)
+
+    def gerar(db, tipo, p, progresso):
+        # Enquanto isso o job foi dado como travado e reservado por outro worker
+        db.execute('UPDATE jobs SET tentativas = tentativas + 1 WHERE id = ?', ('a',))
+        db.commit()
+        progresso(50)
+        return _ITEM
+
+    monkeypatch.setattr(cache_relatorios, 'gerar', gerar)
+    assert jobs.fila.processar_proximo(db)
+    job = jobs.obter_job(db, 'a')
+    assert (job['status'], job['progresso'], job['tentativas']) == (jobs.PROCESSANDO, 0, 2)
+    assert job['nome_arquivo'] is None
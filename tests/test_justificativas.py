@@ -0,0 +1,39 @@
+"""Justificativas com intervalo de datas invertido."""
+from datetime import date
+
+from horas import atualizar_resumo_semanal
+
+
+def _login(client):
+    client.post('/login', data={'email': 'admin@empresa.com', 'senha': 'admin123'})
+
+
+def test_resumo_semanal_aceita_intervalo_invertido(db):
+    db.executemany(
+        '''INSERT INTO registros_ponto (colaborador_id, data, entrada, saida, horas_trabalhadas)
+           VALUES (1, ?, '08:00', '16:00', 8)''',
+        [('2026-03-05',), ('2026-03-10',), ('2026-03-18',)])
+    # O fim cai antes do domingo da semana do início
+    atualizar_resumo_semanal(db, 1, date(2026, 3, 18), date(2026, 3, 5))
+    semanas = [r['semana_inicio'] for r in db.execute(
+        'SELECT semana_inicio FROM resumo_semanal WHERE colaborador_id = 1 ORDER BY 1')]
+    assert semanas == ['2026-03-01', '2026-03-08', '2026-03-15']
+
+
+def test_nova_justificativa_rejeita_fim_antes_do_inicio(client, db):
+    _login(client)
+    resposta = client.post('/justificativas/nova', data={
+        'data_inicio': '2026-03-18', 'data_fim': '2026-03-05', 'tipo': 'atestado'})
+    assert resposta.status_code == 302
+    assert db.execute('SELECT COUNT(*) FROM justificativas').fetchone()[0] == 0
+
+
+def test_aprovar_justificativa_invertida_gravada(client, db):
+    db.execute(
+        '''INSERT INTO justificativas (colaborador_id, data_inicio, data_fim, tipo, status)
+           VALUES (1, '2026-03-18', '2026-03-05', 'atestado', 'pendente')''')
+    db.commit()
+    _login(client)
+    resposta = client.post('/justificativas/1/aprovar', data={'acao': 'aprovar'})
+    assert resposta.status_code == 302
+    assert db.execute('SELECT status FROM justificativas').fetchone()[0] == 'aprovado'
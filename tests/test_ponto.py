@@ -0,0 +1,25 @@
+"""Batidas de ponto pelo caminho de escrita única (ponto.registrar_batida)."""
+from datetime import date
+
+import ponto
+
+
+def test_batida_devolve_registro_com_horas_atualizadas(db):
+    dia = date(2026, 3, 10)
+    ponto.registrar_batida(db, 1, dia, '08:00')
+    resultado = ponto.registrar_batida(db, 1, dia, '12:00')
+    gravado = db.execute(
+        'SELECT horas_trabalhadas FROM registros_ponto WHERE colaborador_id = 1 AND data = ?',
+        (dia.isoformat(),)).fetchone()
+    assert gravado['horas_trabalhadas'] == 4.0
+    assert resultado['registro']['horas_trabalhadas'] == gravado['horas_trabalhadas']
+
+
+def test_batida_antes_de_coluna_editada_com_entrada_vazia(db):
+    db.execute(
+        '''INSERT INTO registros_ponto (colaborador_id, data, entrada, saida_almoco, status)
+           VALUES (1, '2026-03-10', '', '12:00', 'em_andamento')''')
+    db.commit()
+    resultado = ponto.registrar_batida(db, 1, date(2026, 3, 10), '08:00')
+    assert resultado['status'] == ponto.FORA_DE_ORDEM
+    assert resultado['ultima'] == '12:00'